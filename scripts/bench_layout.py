@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Measure the time taken to cut a message into lines, along with the
+attributes carried over to each line, in the text windows.
+
+Compares the previous way (poopt.cut_text, then the attributes of each
+line parsed in python) with poopt.layout_message.  Build poopt first
+(make), then run it from the root of the sources:
+
+    python3 scripts/bench_layout.py [number of messages]
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import poopt
+
+FORMAT_CHAR = '\x19'
+WIDTH = 80
+
+def parse_attrs(text, previous=None):
+    """
+    The attributes of a line, parsed in python
+    """
+    next_attr_char = text.find(FORMAT_CHAR)
+    if previous:
+        attrs = previous
+    else:
+        attrs = []
+    while next_attr_char != -1 and text:
+        if next_attr_char + 1 < len(text):
+            attr_char = text[next_attr_char+1].lower()
+        else:
+            attr_char = str()
+        if attr_char == 'o':
+            attrs = []
+        elif attr_char == 'u':
+            attrs.append('u')
+        elif attr_char == 'b':
+            attrs.append('b')
+        if attr_char in '0123456789' and attr_char != '':
+            color_str = text[next_attr_char+1:text.find('}', next_attr_char)]
+            if color_str:
+                attrs.append(color_str + '}')
+            text = text[next_attr_char+len(color_str)+2:]
+        else:
+            text = text[next_attr_char+2:]
+        next_attr_char = text.find(FORMAT_CHAR)
+    return attrs
+
+def layout_python(txt, width):
+    ret = []
+    prepend = ''
+    attrs = []
+    for start, end in poopt.cut_text(txt, width):
+        ret.append((start, end, prepend))
+        attrs = parse_attrs(txt[start:end], attrs)
+        prepend = FORMAT_CHAR + FORMAT_CHAR.join(attrs) if attrs else ''
+    return ret
+
+def make_message(length):
+    words = ['poezio', 'message', 'à', 'réfrigérateur', 'エメルカ', 'xmpp',
+             '\x19b', '\x19o', '\x191}', '\x1912,-1}', '\x19u']
+    return ' '.join(random.choice(words) for _ in range(length))
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    random.seed(0)
+    for length in (5, 40, 400):
+        messages = [make_message(length) for _ in range(100)]
+        for name, function in (('cut_text + parse_attrs', layout_python),
+                               ('layout_message', poopt.layout_message)):
+            duration = timeit.timeit(
+                    lambda: [function(msg, WIDTH) for msg in messages],
+                    number=max(1, number // 100))
+            print('%3d words, %-22s %8.2f µs per message' %
+                    (length, name, duration / number * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -9,11 +9,13 @@
 Various useful functions.
 """
 
-from sys import version_info
+from sys import version_info, getsizeof
 from datetime import datetime, timedelta
 from slixmpp import JID, InvalidJID
 
 import base64
+import collections
+import itertools
 import os
 import mimetypes
 import hashlib
@@ -481,3 +483,45 @@ def safeJID(*args, **kwargs):
     except InvalidJID:
         return JID('')
 
+class RingBuffer(collections.deque):
+    """
+    A deque, usually bounded with maxlen, so that appending an item to a
+    full buffer drops the oldest one in constant time.
+
+    Unlike a deque, it can be sliced like a list. Only the requested
+    items are walked, from the closest end, so a slice of the most
+    recent items is cheap whatever the size of the buffer.
+    """
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return collections.deque.__getitem__(self, index)
+        size = len(self)
+        start, stop, step = index.indices(size)
+        if step > 0:
+            first, last = start, stop
+        else:
+            first, last = stop + 1, start + 1
+        if first >= last:
+            return []
+        if first > size - last:
+            items = list(itertools.islice(reversed(self),
+                                          size - last, size - first))
+            items.reverse()
+        else:
+            items = list(itertools.islice(self, first, last))
+        if step != 1:
+            return items[::step]
+        return items
+
+def get_size(objects, seen):
+    """
+    Approximate number of bytes used by the objects (without the objects
+    they reference), not counting the ones whose id is already in seen,
+    which is updated, so that the shared objects are only counted once
+    """
+    size = 0
+    for obj in objects:
+        if obj is not None and id(obj) not in seen:
+            seen.add(id(obj))
+            size += getsizeof(obj)
+    return size
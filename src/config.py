@@ -44,12 +44,14 @@ DEFAULT_CONFIG = {
         'default_nick': '',
         'deterministic_nick_colors': True,
         'nick_color_aliases': True,
+        'nick_color_hash': 'md5',
         'display_activity_notifications': False,
         'display_gaming_notifications': False,
         'display_mood_notifications': False,
         'display_tune_notifications': False,
         'display_user_color_in_join_part': True,
         'enable_carbons': False,
+        'enable_log_search': True,
         'enable_user_activity': True,
         'enable_user_gaming': True,
         'enable_user_mood': True,
@@ -77,10 +79,15 @@ DEFAULT_CONFIG = {
         'load_log': 10,
         'log_dir': '',
         'logfile': 'logs',
+        'log_buffer_size': 16384,
         'log_errors': True,
+        'log_flush_interval': 2,
+        'max_fps': 30,
         'max_lines_in_memory': 2048,
         'max_messages_in_memory': 2048,
+        'max_recent_words': 1024,
         'max_nick_length': 25,
+        'max_open_log_files': 128,
         'muc_history_length': 50,
         'notify_messages': True,
         'open_all_bookmarks': False,
@@ -89,6 +96,7 @@ DEFAULT_CONFIG = {
         'plugins_conf_dir': '',
         'plugins_dir': '',
         'popup_time': 4,
+        'presence_batch_window': 10,
         'private_auto_response': '',
         'remote_fifo_path': './',
         'request_message_receipts': True,
@@ -141,6 +149,9 @@ DEFAULT_CONFIG = {
     }
 }
 
+# The number of values kept in the cache of Config.get_by_tabname
+TABNAME_CACHE_LIMIT = 4096
+
 class Config(RawConfigParser):
     """
     load/save the config to a file
@@ -150,10 +161,35 @@ class Config(RawConfigParser):
         # make the options case sensitive
         self.optionxform = str
         self.file_name = file_name
+        # (option, tabname, fallback, fallback_server, default) -> value
+        # returned by get_by_tabname, emptied whenever the configuration
+        # is changed or when it reaches TABNAME_CACHE_LIMIT values
+        self.tabname_cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_clears = 0
         self.read_file()
         self.default = default
 
+    def clear_cache(self):
+        """
+        Forget the values cached by get_by_tabname
+        """
+        self.tabname_cache.clear()
+
+    def get_cache_stats(self):
+        """
+        Return the size and the hit/miss counters of the get_by_tabname
+        cache
+        """
+        return {'entries': len(self.tabname_cache),
+                'max': TABNAME_CACHE_LIMIT,
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'clears': self.cache_clears}
+
     def read_file(self):
+        self.clear_cache()
         try:
             RawConfigParser.read(self, self.file_name, encoding='utf-8')
         except TypeError: # python < 3.2 sucks
@@ -201,7 +237,27 @@ class Config(RawConfigParser):
         a section named `tabname`, if the option is not present
         in the section, we search for the global option if fallback is
         True. And we return `default` as a fallback as a last resort.
+
+        The values are cached until the configuration changes.
         """
+        key = (option, tabname, fallback, fallback_server,
+               type(default), default)
+        try:
+            value = self.tabname_cache[key]
+        except KeyError:
+            self.cache_misses += 1
+            value = self._get_by_tabname(option, tabname, fallback,
+                                         fallback_server, default)
+            if len(self.tabname_cache) >= TABNAME_CACHE_LIMIT:
+                self.cache_clears += 1
+                self.tabname_cache.clear()
+            self.tabname_cache[key] = value
+        else:
+            self.cache_hits += 1
+        return value
+
+    def _get_by_tabname(self, option, tabname,
+                        fallback, fallback_server, default):
         if self.default and (not default) and fallback:
             default = self.default.get(DEFSECTION, {}).get(option, '')
         if tabname in self.sections():
@@ -413,6 +469,7 @@ class Config(RawConfigParser):
                               ' Current value is %s.') %
                                   (option, current or _("empty")),
                             'Warning')
+        self.clear_cache()
         if self.has_section(section):
             RawConfigParser.set(self, section, option, value)
         else:
@@ -426,6 +483,7 @@ class Config(RawConfigParser):
         """
         Remove an option and then save it the config file
         """
+        self.clear_cache()
         if self.has_section(section):
             RawConfigParser.remove_option(self, section, option)
         if not self.remove_in_file(section, option):
@@ -436,6 +494,7 @@ class Config(RawConfigParser):
         """
         Set a value, save, and return True on success and False on failure
         """
+        self.clear_cache()
         if self.has_section(section):
             RawConfigParser.set(self, section, option, value)
         else:
@@ -447,11 +506,20 @@ class Config(RawConfigParser):
         """
         Set the value of an option temporarily
         """
+        self.clear_cache()
         try:
             RawConfigParser.set(self, section, option, value)
         except NoSectionError:
             pass
 
+    def remove_section(self, section):
+        self.clear_cache()
+        return RawConfigParser.remove_section(self, section)
+
+    def remove_option(self, section, option):
+        self.clear_cache()
+        return RawConfigParser.remove_option(self, section, option)
+
     def to_dict(self):
         """
         Returns a dict of the form {section: {option: value, option: value}, …}
@@ -14,6 +14,7 @@ import logging
 log = logging.getLogger(__name__)
 
 from common import safeJID
+from string_pool import string_pool
 from collections import defaultdict
 
 class Resource(object):
@@ -91,7 +92,7 @@ class Contact(object):
     @name.setter
     def name(self, value):
         """Set the name of the contact with user nickname"""
-        self._name = value
+        self._name = string_pool.intern(value)
 
     @property
     def ask(self):
@@ -24,9 +24,11 @@ import pep
 import tabs
 from common import safeJID
 from config import config, DEFAULT_CONFIG, options as config_opts
+from logger import logger
 import multiuserchat as muc
 from plugin import PluginConfig
 from roster import roster
+from string_pool import string_pool
 from theming import dump_tuple, get_theme
 from decorators import command_args_parser
 
@@ -240,10 +242,7 @@ def command_move_tab(self, args):
         try:
             ref = int(value)
         except ValueError:
-            old_tab = None
-            for tab in self.tabs:
-                if not old_tab and value == tab.name:
-                    old_tab = tab
+            old_tab = self.get_tab_by_name(value)
             if not old_tab:
                 self.information("Tab %s does not exist" % args[0], "Error")
                 return None
@@ -404,6 +403,7 @@ def command_join(self, args, histo_length=None):
     else:
         tab.own_nick = nick
         tab.users = []
+        tab.joining_presences.clear()
     if tab and tab.joined:
         self.enable_private_tabs(room)
         tab.state = "normal"
@@ -1036,5 +1036,81 @@ def command_self(self):
             config_opts.version))
     self.information(info, 'Info')
 
+@command_args_parser.raw
+def command_search(self, args):
+    """
+    /search <query>
+    """
+    if not args:
+        return self.command_help('search')
+    if not self.log_search:
+        return self.information(_('The search is disabled, see the '
+                                  'enable_log_search option'), _('Error'))
+    search_tab = tabs.SearchTab(args)
+    self.add_tab(search_tab, True)
+    self.log_search.search(args, search_tab.on_results_received)
+
+@command_args_parser.ignored
+def command_log_stats(self):
+    """
+    /log_stats
+    """
+    stats = logger.get_fds_stats()
+    info = ('Log and index files opened: %(opened)s (max %(max)s)\n'
+            'Handles reused: %(hits)s, opened: %(misses)s, '
+            'closed to make room: %(evictions)s' % stats)
+    self.information(info, 'Info')
+
+@command_args_parser.ignored
+def command_config_stats(self):
+    """
+    /config_stats
+    """
+    stats = config.get_cache_stats()
+    info = ('Cached tab options: %(entries)s (max %(max)s)\n'
+            'Cache hits: %(hits)s, misses: %(misses)s, '
+            'emptied when full: %(clears)s' % stats)
+    self.information(info, 'Info')
+
+@command_args_parser.ignored
+def command_memory(self):
+    """
+    /memory
+    """
+    # ids of the objects already counted, the ones shared by several tabs
+    # are counted in the first one
+    seen = set()
+    sizes = []
+    def format_size(text_buffer, text_win):
+        "Size of the messages and the lines of a tab"
+        nb_messages = nb_lines = size = 0
+        if text_buffer is not None:
+            nb_messages = len(text_buffer.messages)
+            size += text_buffer.get_size(seen)
+        if text_win is not None:
+            nb_lines = len(text_win.built_lines)
+            size += text_win.get_size(seen)
+        sizes.append(size)
+        return _('%s messages, %s lines: %.1f KiB') % (nb_messages, nb_lines,
+                                                      size / 1024)
+
+    info = [_('Memory used by the messages and their lines:'),
+            _('information: %s') % format_size(self.information_buffer,
+                                               self.information_win),
+            _('XML: %s') % format_size(self.xml_buffer, None)]
+    for tab in self.tabs:
+        text_buffer = getattr(tab, '_text_buffer', None)
+        text_win = getattr(tab, 'text_win', None)
+        if text_buffer is None and text_win is None:
+            continue
+        info.append('%s: %s' % (tab.name, format_size(text_buffer, text_win)))
+    info.append(_('Total: %.1f KiB') % (sum(sizes) / 1024))
+    stats = string_pool.get_stats()
+    info.append(_('Shared strings: %s (%.1f KiB), reused %s times, '
+                  'saving %.1f KiB; %s dropped in %s trims') % (
+                    stats['strings'], stats['size'] / 1024, stats['hits'],
+                    stats['saved'] / 1024, stats['dropped'], stats['trims']))
+    self.information('\n'.join(info), 'Info')
+
 def dumb_callback(*args, **kwargs):
     "mock callback"
@@ -28,6 +28,7 @@ import connection
 import decorators
 import events
 import fixes
+import log_search
 import singleton
 import tabs
 import theming
@@ -82,7 +83,7 @@ class Core(object):
         # a unique buffer used to store global informations
         # that are displayed in almost all tabs, in an
         # information window.
-        self.information_buffer = TextBuffer()
+        self.information_buffer = TextBuffer(words_nb_limit=0)
         self.information_win_size = config.get('info_win_height', section='var')
         self.information_win = windows.TextWin(300)
         self.information_buffer.add_window(self.information_win)
@@ -91,11 +92,37 @@ class Core(object):
         self.tab_win = windows.GlobalInfoBar()
         # Whether the XML tab is opened
         self.xml_tab = None
-        self.xml_buffer = TextBuffer()
+        self.xml_buffer = TextBuffer(words_nb_limit=0)
+        # The full-text index of the logs, used by /search
+        self.log_search = None
+        if config.get('enable_log_search'):
+            if log_search.SQLITE:
+                self.log_search = log_search.SearchIndex()
+                logger.write_handlers.append(self.log_search.feed)
+            else:
+                log.error('The sqlite3 module is not available, /search '
+                          'is disabled')
 
         self.tabs = []
+        # Indexes of the opened tabs (gaps excepted), kept up to date by
+        # add_tab, close_tab and the renames of the tabs:
+        # name -> tabs with that name, class -> tabs of that class
+        self.tabs_by_name = {}
+        self.tabs_by_class = {}
         self._current_tab_nb = 0
         self.previous_tab_nb = 0
+        # The tab drawn by the last refresh_window()
+        self.last_drawn_tab = None
+        # The refreshes to do in the next frame (see refresh_later):
+        # refresh function -> arguments
+        self.pending_refreshes = collections.OrderedDict()
+        self.pending_refresh_window = False
+        self.frame_handle = None
+        self.last_frame = 0
+        # The counters of the presences batched after the login (see
+        # start_presence_batch), None when they are not batched
+        self.presence_batch = None
+        self.presence_batch_handle = None
 
         own_nick = config.get('default_nick')
         own_nick = own_nick or self.xmpp.boundjid.user
@@ -313,6 +340,10 @@ class Core(object):
                                        self.on_theme_config_change)
         self.add_configuration_handler("password",
                                        self.on_password_change)
+        self.add_configuration_handler("highlight_on",
+                                       self.on_highlight_config_change)
+        self.add_configuration_handler("nick_color_hash",
+                                       self.on_nick_color_hash_config_change)
 
         self.add_configuration_handler("", self.on_any_config_change)
 
@@ -391,6 +422,22 @@ class Core(object):
             self.information(error_msg, 'Warning')
         self.refresh_window()
 
+    def on_highlight_config_change(self, option, value):
+        """
+        Called when the highlight_on option is changed: the highlight
+        regexes of the rooms have to be compiled again
+        """
+        for tab in self.get_tabs(tabs.MucTab):
+            tab.highlight_regex = None
+
+    def on_nick_color_hash_config_change(self, option, value):
+        """
+        Called when the nick_color_hash option is changed: the colors
+        computed with the previous hash are forgotten (/recolor applies
+        the new ones)
+        """
+        theming.nick_colors.clear()
+
     def on_password_change(self, option, value):
         """
         Set the new password in the slixmpp.ClientXMPP object
@@ -444,6 +491,7 @@ class Core(object):
                 }
 
         log.error("%s received. Exiting…", signals[sig])
+        logger.flush_all()
         if config.get('enable_user_mood'):
             self.xmpp.plugin['xep_0107'].stop()
         if config.get('enable_user_activity'):
@@ -477,6 +525,7 @@ class Core(object):
         default_tab = tabs.RosterInfoTab()
         default_tab.on_gain_focus()
         self.tabs.append(default_tab)
+        self.register_tab(default_tab)
         self.information(_('Welcome to poezio!'), _('Info'))
         if firstrun:
             self.information(_(
@@ -488,9 +537,18 @@ class Core(object):
                 _('Help'))
         self.refresh_window()
         self.xmpp.plugin['xep_0012'].begin_idle(jid=self.xmpp.boundjid)
+        if self.log_search:
+            self.log_search.index_all()
 
     def exit(self, event=None):
         log.debug("exit(%s)" % (event,))
+        if self.frame_handle:
+            self.frame_handle.cancel()
+        if self.presence_batch_handle:
+            self.presence_batch_handle.cancel()
+        logger.flush_all()
+        if self.log_search:
+            self.log_search.stop()
         asyncio.get_event_loop().stop()
 
     def on_exception(self, typ, value, trace):
@@ -645,8 +703,8 @@ class Core(object):
         Returns a list of all the messages in the current chat.
         If the current tab is not a ChatTab, returns None.
 
-        Messages are namedtuples of the form
-        ('txt nick_color time str_time nickname user')
+        Messages are text_buffer.Message objects, with (among others)
+        the attributes txt nick_color time str_time nickname user
         """
         if not isinstance(self.current_tab(), tabs.ChatTab):
             return None
@@ -905,8 +963,14 @@ class Core(object):
     ### Tab getters ###
 
     def get_tabs(self, cls=tabs.Tab):
-        "Get all the tabs of a type"
-        return filter(lambda tab: isinstance(tab, cls), self.tabs)
+        "Get all the tabs of a type, in the order of self.tabs"
+        found = [tab for tab_class, class_tabs in self.tabs_by_class.items()
+                         if issubclass(tab_class, cls)
+                     for tab in class_tabs]
+        if len(found) > 1:
+            positions = {id(tab): nb for nb, tab in enumerate(self.tabs)}
+            found.sort(key=lambda tab: positions.get(id(tab), 0))
+        return found
 
     def current_tab(self):
         """
@@ -953,11 +1017,9 @@ class Core(object):
         Get the tab with the given name.
         If typ is provided, return a tab of this type only
         """
-        for tab in self.tabs:
-            if tab.name == name:
-                if (typ and isinstance(tab, typ)) or\
-                        not typ:
-                    return tab
+        for tab in self.tabs_by_name.get(name, ()):
+            if not typ or isinstance(tab, typ):
+                return tab
         return None
 
     def get_tab_by_number(self, number):
@@ -971,9 +1033,47 @@ class Core(object):
         focus it if focus==True
         """
         self.tabs.append(new_tab)
+        self.register_tab(new_tab)
         if focus:
             self.command_win("%s" % new_tab.nb)
 
+    def register_tab(self, tab):
+        """
+        Add a new tab to the indexes of the tabs
+        """
+        self.tabs_by_name.setdefault(tab.name, []).append(tab)
+        self.tabs_by_class.setdefault(type(tab), []).append(tab)
+
+    def unregister_tab(self, tab):
+        """
+        Remove a closed tab from the indexes of the tabs
+        """
+        self._remove_from_index(self.tabs_by_name, tab.name, tab)
+        self._remove_from_index(self.tabs_by_class, type(tab), tab)
+
+    def on_tab_renamed(self, tab, old_name):
+        """
+        Called when the name of a tab changes, to index it under its new
+        name if it is opened
+        """
+        if self._remove_from_index(self.tabs_by_name, old_name, tab):
+            self.tabs_by_name.setdefault(tab.name, []).append(tab)
+
+    @staticmethod
+    def _remove_from_index(index, key, tab):
+        """
+        Remove a tab from the list of an index of the tabs, return False if
+        it was not there
+        """
+        index_tabs = index.get(key, [])
+        for i, other in enumerate(index_tabs):
+            if other is tab:
+                del index_tabs[i]
+                if not index_tabs:
+                    del index[key]
+                return True
+        return False
+
     def insert_tab_nogaps(self, old_pos, new_pos):
         """
         Move tabs without creating gaps
@@ -1139,12 +1239,11 @@ class Core(object):
 
     def focus_tab_named(self, tab_name, type_=None):
         """Returns True if it found a tab to focus on"""
-        for tab in self.tabs:
-            if tab.name == tab_name:
-                if (type_ and (isinstance(tab, type_))) or not type_:
-                    self.command_win('%s' % (tab.nb,))
-                return True
-        return False
+        tab = self.get_tab_by_name(tab_name, type_)
+        if tab is None:
+            return False
+        self.command_win('%s' % (tab.nb,))
+        return True
 
     @property
     def current_tab_nb(self):
@@ -1165,6 +1264,9 @@ class Core(object):
         else:
             self._current_tab_nb = value
         if old != self._current_tab_nb:
+            windows.Win.screen_generation += 1
+            # the windows of the previous tab must not be drawn anymore
+            self.pending_refreshes.clear()
             self.events.trigger('tab_change', old, self._current_tab_nb)
 
     ### Opening actions ###
@@ -1294,6 +1396,7 @@ class Core(object):
         del tab.key_func      # Remove self references
         del tab.commands      # and make the object collectable
         tab.on_close()
+        self.unregister_tab(tab)
         nb = tab.nb
         if was_current:
             if self.previous_tab_nb != nb:
@@ -1310,10 +1413,8 @@ class Core(object):
                 self.tabs[nb] = tabs.GapTab()
         else:
             self.tabs.remove(tab)
-        if tab and tab.name in logger.fds:
-            logger.fds[tab.name].close()
-            log.debug("Log file for %s closed.", tab.name)
-            del logger.fds[tab.name]
+        if tab:
+            logger.close(tab.name)
         if self.current_tab_nb >= len(self.tabs):
             self.current_tab_nb = len(self.tabs) - 1
         while not self.tabs[self.current_tab_nb]:
@@ -1336,7 +1437,7 @@ class Core(object):
         if tab:
             tab.add_message(msg, typ=2)
             if self.current_tab() is tab:
-                self.refresh_window()
+                self.refresh_window_later()
 
 
 ####################### Curses and ui-related stuff ###########################
@@ -1347,6 +1448,115 @@ class Core(object):
             return
         curses.doupdate()
 
+    def refresh_later(self, func, *args):
+        """
+        Call func(*args), usually the refresh() of a window of the
+        current tab, in the next frame instead of now, then do a curses
+        update. A function scheduled several times before the frame is
+        only called once, with the last arguments.
+
+        The frames are at most max_fps per second, so that a burst of
+        stanzas (e.g. the presences when joining a room) does not redraw
+        the screen for each of them. Use the immediate refresh functions
+        for what must be visible right away (e.g. the input).
+        """
+        self.pending_refreshes[func] = args
+        self.schedule_frame()
+
+    def refresh_window_later(self):
+        "Like refresh_window(), but in the next frame"
+        self.pending_refresh_window = True
+        self.schedule_frame()
+
+    def schedule_frame(self):
+        "Schedule the next frame, if it is not already"
+        if self.frame_handle:
+            return
+        max_fps = config.get('max_fps')
+        loop = asyncio.get_event_loop()
+        delay = 0
+        if max_fps > 0:
+            delay = self.last_frame + 1 / max_fps - loop.time()
+        if delay > 0:
+            self.frame_handle = loop.call_later(delay, self.render_frame)
+        else:
+            self.frame_handle = loop.call_soon(self.render_frame)
+
+    def render_frame(self):
+        "Do the refreshes scheduled since the last frame"
+        self.frame_handle = None
+        self.last_frame = asyncio.get_event_loop().time()
+        if self.pending_refresh_window:
+            return self.refresh_window()
+        pending = self.pending_refreshes
+        self.pending_refreshes = collections.OrderedDict()
+        for func, args in pending.items():
+            func(*args)
+        # the cursor must be left in the input
+        if self.current_tab().input:
+            self.current_tab().input.refresh()
+        self.doupdate()
+
+    def start_presence_batch(self):
+        """
+        Batch the presences received during the presence_batch_window
+        seconds following the login: the roster view is updated and the
+        roster changes are written in roster.log once per batch (every
+        second) instead of once per presence.
+
+        The contacts themselves are still updated by each presence, since
+        the handlers, the other tabs and the plugins read their state as
+        soon as the presence is received.
+        """
+        window = config.get('presence_batch_window')
+        if window <= 0 or self.presence_batch is not None:
+            return
+        now = asyncio.get_event_loop().time()
+        self.presence_batch = {'start': now, 'end': now + window,
+                               'batches': 0, 'events': 0,
+                               'handling_time': 0, 'refresh': False}
+        logger.start_roster_batch()
+        self.presence_batch_handle = asyncio.get_event_loop().call_later(
+                min(1, window), self.flush_presence_batch)
+
+    def flush_presence_batch(self):
+        """
+        End the current batch of presences: write the roster changes and
+        update the roster view, then start the next batch, if the window is
+        not over
+        """
+        batch = self.presence_batch
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        over = now >= batch['end']
+        batch['batches'] += 1
+        if not logger.flush_roster(stop_batch=over):
+            self.information(_('Unable to write in the log file'), 'Error')
+        if batch['refresh']:
+            batch['refresh'] = False
+            if isinstance(self.current_tab(), tabs.RosterInfoTab):
+                self.refresh_window_later()
+        if not over:
+            self.presence_batch_handle = loop.call_later(
+                    min(1, batch['end'] - now), self.flush_presence_batch)
+            return
+        self.presence_batch = None
+        self.presence_batch_handle = None
+        log.debug('%s presence events received in %.1fs after the login, '
+                  'handled in %.3fs, in %s batches',
+                  batch['events'], now - batch['start'],
+                  batch['handling_time'], batch['batches'])
+
+    def refresh_roster_later(self):
+        """
+        Refresh the roster tab with the next frame, or at the end of the
+        current batch of presences
+        """
+        if self.presence_batch is not None:
+            self.presence_batch['refresh'] = True
+        else:
+            self.refresh_window_later()
+
     def information(self, msg, typ=''):
         """
         Displays an informational message in the "Info" buffer
@@ -1363,14 +1573,13 @@ class Core(object):
                                                        nick_color=color)
         popup_on = config.get('information_buffer_popup_on').split()
         if isinstance(self.current_tab(), tabs.RosterInfoTab):
-            self.refresh_window()
+            self.refresh_roster_later()
         elif typ != '' and typ.lower() in popup_on:
             popup_time = config.get('popup_time') + (nb_lines - 1) * 2
             self.pop_information_win_up(nb_lines, popup_time)
         else:
             if self.information_win_size != 0:
-                self.information_win.refresh()
-                self.current_tab().input.refresh()
+                self.refresh_later(self.information_win.refresh)
         return True
 
     def init_curses(self, stdscr):
@@ -1407,6 +1616,12 @@ class Core(object):
         """
         Refresh everything
         """
+        self.pending_refresh_window = False
+        self.pending_refreshes.clear()
+        if self.current_tab() is not self.last_drawn_tab:
+            # the windows of the previous tab were drawn on the screen
+            windows.Win.screen_generation += 1
+            self.last_drawn_tab = self.current_tab()
         self.current_tab().state = 'current'
         self.current_tab().refresh()
         self.doupdate()
@@ -1617,6 +1832,7 @@ class Core(object):
         Completely erase and redraw the screen
         """
         self.stdscr.clear()
+        windows.Win.screen_generation += 1
         self.refresh_window()
 
     def call_for_resize(self):
@@ -1869,6 +2085,26 @@ class Core(object):
                 completion=self.completion_runkey)
         self.register_command('self', self.command_self,
                 shortdesc=_('Remind you of who you are.'))
+        self.register_command('search', self.command_search,
+                usage=_('<query>'),
+                desc=_('Search the logs of all the conversations, and list '
+                       'the matching messages in a new tab. The query can '
+                       'contain several words, "quoted phrases", OR, NOT, '
+                       'prefixes like word*, and be restricted to a column '
+                       'with nick:word or room:word.'),
+                shortdesc=_('Search the logs.'))
+        self.register_command('log_stats', self.command_log_stats,
+                desc=_('Show how many log files are opened, and how often '
+                       'they had to be opened or closed.'),
+                shortdesc=_('Show statistics about the log files.'))
+        self.register_command('config_stats', self.command_config_stats,
+                desc=_('Show how many values of the tab-specific options '
+                       'are cached, and how often the cache was used.'),
+                shortdesc=_('Show statistics about the options cache.'))
+        self.register_command('memory', self.command_memory,
+                desc=_('Show the approximate memory used by the messages '
+                       'and the lines of each tab.'),
+                shortdesc=_('Show the memory used by the tabs.'))
         self.register_command('last_activity', self.command_last_activity,
                 usage='<jid>',
                 desc=_('Informs you of the last activity of a JID.'),
@@ -2000,6 +2236,10 @@ class Core(object):
     command_xml_tab = commands.command_xml_tab
     command_adhoc = commands.command_adhoc
     command_self = commands.command_self
+    command_log_stats = commands.command_log_stats
+    command_config_stats = commands.command_config_stats
+    command_memory = commands.command_memory
+    command_search = commands.command_search
     completion_help = completions.completion_help
     completion_status = completions.completion_status
     completion_presence = completions.completion_presence
@@ -48,6 +48,24 @@ try:
 except ImportError:
     PYGMENTS = False
 
+def batched_presence(func):
+    """
+    Count the time spent in a presence handler while the presences are
+    batched after the login (see Core.start_presence_batch)
+    """
+    @functools.wraps(func)
+    def wrapper(self, presence):
+        batch = self.presence_batch
+        if batch is None:
+            return func(self, presence)
+        start = time.time()
+        try:
+            return func(self, presence)
+        finally:
+            batch['events'] += 1
+            batch['handling_time'] += time.time() - start
+    return wrapper
+
 def on_session_start_features(self, _):
     """
     Enable carbons & blocking on session start if wanted and possible
@@ -287,9 +305,9 @@ def on_normal_message(self, message):
             curses.beep()
     if self.current_tab() is not conversation:
         conversation.state = 'private'
-        self.refresh_tab_win()
+        self.refresh_later(self.current_tab().refresh_tab_win)
     else:
-        self.refresh_window()
+        self.refresh_window_later()
 
 def on_nick_received(self, message):
     """
@@ -304,6 +322,8 @@ def on_nick_received(self, message):
         contact.name = item['nick']['nick']
     else:
         contact.name = ''
+    roster.search_index.update(contact)
+    roster.modified(contact.bare_jid)
 
 def on_gaming_event(self, message):
     """
@@ -347,7 +367,7 @@ def on_mood_event(self, message):
     contact = roster[message['from'].bare]
     if not contact:
         return
-    roster.modified()
+    roster.modified(contact.bare_jid)
     item = message['pubsub_event']['items']['item']
     old_mood = contact.mood
     if item.xml.find('{http://jabber.org/protocol/mood}mood'):
@@ -380,7 +400,7 @@ def on_activity_event(self, message):
     contact = roster[message['from'].bare]
     if not contact:
         return
-    roster.modified()
+    roster.modified(contact.bare_jid)
     item = message['pubsub_event']['items']['item']
     old_activity = contact.activity
     if item.xml.find('{http://jabber.org/protocol/activity}activity'):
@@ -419,7 +439,7 @@ def on_tune_event(self, message):
     contact = roster[message['from'].bare]
     if not contact:
         return
-    roster.modified()
+    roster.modified(contact.bare_jid)
     item = message['pubsub_event']['items']['item']
     old_tune = contact.tune
     if item.xml.find('{http://jabber.org/protocol/tune}tune'):
@@ -499,16 +519,10 @@ def on_groupchat_message(self, message):
         tab.last_sent_message = message
 
     if tab is self.current_tab():
-        tab.text_win.refresh()
-        tab.info_header.refresh(tab, tab.text_win)
-        tab.input.refresh()
-        self.doupdate()
+        self.refresh_later(tab.text_win.refresh)
+        self.refresh_later(tab.info_header.refresh, tab, tab.text_win)
     elif tab.state != old_state:
-        self.refresh_tab_win()
-        current = self.current_tab()
-        if hasattr(current, 'input') and current.input:
-            current.input.refresh()
-        self.doupdate()
+        self.refresh_later(self.current_tab().refresh_tab_win)
 
     if 'message' in config.get('beep_on').split():
         if (not config.get_by_tabname('disable_beep', room_from)
@@ -581,10 +595,10 @@ def on_groupchat_private_message(self, message):
         if not config.get_by_tabname('disable_beep', jid.full):
             curses.beep()
     if tab is self.current_tab():
-        self.refresh_window()
+        self.refresh_window_later()
     else:
         tab.state = 'private'
-        self.refresh_tab_win()
+        self.refresh_later(self.current_tab().refresh_tab_win)
 
 ### Chatstates ###
 
@@ -716,7 +730,7 @@ def on_subscription_authorized(self, presence):
     if contact.pending_out:
         contact.pending_out = False
 
-    roster.modified()
+    roster.modified(jid)
 
     if isinstance(self.current_tab(), tabs.RosterInfoTab):
         self.refresh_window()
@@ -727,7 +741,7 @@ def on_subscription_remove(self, presence):
     contact = roster[jid]
     if not contact:
         return
-    roster.modified()
+    roster.modified(jid)
     self.information('%s does not want to receive your status anymore.' % jid, 'Roster')
     self.get_tab_by_number(0).state = 'highlight'
     if isinstance(self.current_tab(), tabs.RosterInfoTab):
@@ -739,7 +753,7 @@ def on_subscription_removed(self, presence):
     contact = roster[jid]
     if not contact:
         return
-    roster.modified()
+    roster.modified(jid)
     if contact.pending_out:
         self.information('%s rejected your contact proposal' % jid, 'Roster')
         contact.pending_out = False
@@ -751,6 +765,7 @@ def on_subscription_removed(self, presence):
 
 ### Presence-related handlers ###
 
+@batched_presence
 def on_presence(self, presence):
     if presence.match('presence/muc') or presence.xml.find('{http://jabber.org/protocol/muc#user}x'):
         return
@@ -764,28 +779,28 @@ def on_presence(self, presence):
             tab.unlock()
     if contact is None:
         return
-    roster.modified()
+    roster.modified(jid.bare)
     contact.error = None
     self.events.trigger('normal_presence', presence, contact[jid.full])
     tab = self.get_conversation_by_jid(jid, create=False)
     if isinstance(self.current_tab(), tabs.RosterInfoTab):
-        self.refresh_window()
+        self.refresh_roster_later()
     elif self.current_tab() == tab:
-        tab.refresh()
-        self.doupdate()
+        self.refresh_later(tab.refresh)
 
 def on_presence_error(self, presence):
     jid = presence['from']
     contact = roster[jid.bare]
     if not contact:
         return
-    roster.modified()
+    roster.modified(jid.bare)
     contact.error = presence['error']['type'] + ': ' + presence['error']['condition']
     # reset chat states status on presence error
     tab = self.get_tab_by_name(jid.full, tabs.ConversationTab)
     if tab:
         tab.remote_wants_chatstates = None
 
+@batched_presence
 def on_got_offline(self, presence):
     """
     A JID got offline
@@ -801,10 +816,11 @@ def on_got_offline(self, presence):
         self.add_information_message_to_conversation_tab(jid.full, '\x195}%s is \x191}offline' % (jid.full))
     self.add_information_message_to_conversation_tab(jid.bare, '\x195}%s is \x191}offline' % (jid.bare))
     self.information('\x193}%s \x195}is \x191}offline' % (jid.bare), 'Roster')
-    roster.modified()
+    roster.modified(jid.bare)
     if isinstance(self.current_tab(), tabs.RosterInfoTab):
-        self.refresh_window()
+        self.refresh_roster_later()
 
+@batched_presence
 def on_got_online(self, presence):
     """
     A JID got online
@@ -816,7 +832,7 @@ def on_got_online(self, presence):
     if contact is None:
         # Todo, handle presence coming from contacts not in roster
         return
-    roster.modified()
+    roster.modified(jid.bare)
     if not logger.log_roster_change(jid.bare, 'got online'):
         self.information(_('Unable to write in the log file'), 'Error')
     resource = Resource(jid.full, {
@@ -834,7 +850,7 @@ def on_got_online(self, presence):
             self.information("\x193}%s \x195}is \x194}online\x195}" % safeJID(resource.jid).bare, "Roster")
         self.add_information_message_to_conversation_tab(jid.bare, '\x195}%s is \x194}online' % (jid.bare))
     if isinstance(self.current_tab(), tabs.RosterInfoTab):
-        self.refresh_window()
+        self.refresh_roster_later()
 
 def on_groupchat_presence(self, presence):
     """
@@ -911,6 +927,7 @@ def on_session_start(self, event):
     Called when we are connected and authenticated
     """
     self.connection_time = time.time()
+    self.start_presence_batch()
     if not self.plugins_autoloaded: # Do not reload plugins on reconnection
         self.autoload_plugins()
     self.information(_("Authentication success."), 'Info')
@@ -1079,16 +1096,12 @@ def on_attention(self, message):
     """
     jid_from = message['from']
     self.information('%s requests your attention!' % jid_from, 'Info')
-    for tab in self.tabs:
-        if tab.name == jid_from:
-            tab.state = 'attention'
-            self.refresh_tab_win()
-            return
-    for tab in self.tabs:
-        if tab.name == jid_from.bare:
-            tab.state = 'attention'
-            self.refresh_tab_win()
-            return
+    tab = (self.get_tab_by_name(jid_from.full) or
+           self.get_tab_by_name(jid_from.bare))
+    if tab:
+        tab.state = 'attention'
+        self.refresh_tab_win()
+        return
     self.information('%s tab not found.' % jid_from, 'Error')
 
 def room_error(self, error, room_name):
@@ -1096,6 +1109,9 @@ def room_error(self, error, room_name):
     Display the error in the tab
     """
     tab = self.get_tab_by_name(room_name, tabs.MucTab)
+    # the join failed, drop the presences received until then
+    if not tab.joined:
+        tab.joining_presences.clear()
     error_message = self.get_error_message(error)
     tab.add_message(error_message, highlight=True, nickname='Error',
                     nick_color=get_theme().COLOR_ERROR_MSG, typ=2)
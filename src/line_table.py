@@ -0,0 +1,198 @@
+"""
+Defines the LineTable class, in which the text windows keep their built
+lines as rows of machine ints instead of one object per line, and the
+table of the attributes carried over to the wrapped lines, that the rows
+refer to by id.
+
+A row is a (message, start, end, prepend) tuple: the number of the message
+in the window, the positions delimiting the text of the line in that
+message, and the id of the attributes to set before writing it (see
+get_prepend_id).
+"""
+
+from array import array
+
+# Number of ints in a row
+ROW_SIZE = 4
+
+# The row of the line separator, the only one with a negative prepend id
+SEPARATOR = (0, 0, 0, -1)
+
+# The attributes carried over to the wrapped lines, and their ids (their
+# index in prepends). The ids are kept in the rows, so the table is never
+# emptied: once it is full, the attributes of the new ones are dropped.
+prepends = ['']
+prepend_ids = {'': 0}
+PREPENDS_LIMIT = 4096
+
+def get_prepend_id(prepend):
+    """
+    Return the id of a prepend string, adding it to the table if needed
+    """
+    try:
+        return prepend_ids[prepend]
+    except KeyError:
+        if len(prepends) >= PREPENDS_LIMIT:
+            return 0
+        prepend_ids[prepend] = len(prepends)
+        prepends.append(prepend)
+        return prepend_ids[prepend]
+
+class LineTable(object):
+    """
+    A sequence of rows, bounded by maxlen, stored in an array of ints used
+    as a ring buffer, so that appending a row to a full table drops the
+    oldest one in constant time, as with a RingBuffer. The array grows
+    with the number of rows, up to maxlen rows.
+
+    It has the methods of a deque used by the text windows, and can be
+    sliced like a list. The rows are returned as tuples.
+    """
+    __slots__ = ('maxlen', 'rows', 'first', 'length')
+
+    def __init__(self, rows=(), maxlen=None):
+        self.maxlen = maxlen
+        # the ints of the rows, from the row at index first
+        self.rows = array('i')
+        self.first = 0
+        self.length = 0
+        self.extend(rows)
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length != 0
+
+    def __repr__(self):
+        return 'LineTable(%r, maxlen=%r)' % (list(self), self.maxlen)
+
+    @property
+    def capacity(self):
+        "The number of rows the array can hold"
+        return len(self.rows) // ROW_SIZE
+
+    def _offset(self, index):
+        "Offset in the array of the row at index, in range(length)"
+        return (self.first + index) % self.capacity * ROW_SIZE
+
+    def _check_index(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('LineTable index out of range')
+        return index
+
+    def _grow(self):
+        """
+        Make room for one more row, return False if the table is full
+        """
+        capacity = self.capacity
+        if self.length < capacity:
+            return True
+        if self.maxlen is not None and capacity >= self.maxlen:
+            return False
+        new_capacity = max(16, capacity * 2)
+        if self.maxlen is not None:
+            new_capacity = min(new_capacity, self.maxlen)
+        rows = array('i')
+        for row in self:
+            rows.extend(row)
+        rows.extend([0] * ((new_capacity - self.length) * ROW_SIZE))
+        self.rows = rows
+        self.first = 0
+        return True
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+        offset = self._offset(self._check_index(index))
+        return tuple(self.rows[offset:offset + ROW_SIZE])
+
+    def __setitem__(self, index, row):
+        offset = self._offset(self._check_index(index))
+        self.rows[offset:offset + ROW_SIZE] = array('i', row)
+
+    def __iter__(self):
+        rows = self.rows
+        for i in range(self.length):
+            offset = self._offset(i)
+            yield tuple(rows[offset:offset + ROW_SIZE])
+
+    def __reversed__(self):
+        for i in range(self.length - 1, -1, -1):
+            yield self[i]
+
+    def __contains__(self, row):
+        return any(item == row for item in self)
+
+    def index(self, row):
+        """
+        Return the index of the first occurence of row
+        """
+        row = tuple(row)
+        for i, item in enumerate(self):
+            if item == row:
+                return i
+        raise ValueError('%r is not in the LineTable' % (row,))
+
+    def append(self, row):
+        """
+        Add a row at the end, dropping the first one if the table is full
+        """
+        if self.maxlen == 0:
+            return
+        if not self._grow():
+            self.popleft()
+        self.length += 1
+        self[self.length - 1] = row
+
+    def appendleft(self, row):
+        """
+        Add a row at the start, dropping the last one if the table is full
+        """
+        if self.maxlen == 0:
+            return
+        if not self._grow():
+            self.pop()
+        self.first = (self.first - 1) % self.capacity
+        self.length += 1
+        self[0] = row
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def extendleft(self, rows):
+        "Add the rows at the start, in reverse order, like a deque"
+        for row in rows:
+            self.appendleft(row)
+
+    def pop(self):
+        """
+        Remove and return the last row
+        """
+        if not self.length:
+            raise IndexError('pop from an empty LineTable')
+        row = self[-1]
+        self.length -= 1
+        return row
+
+    def popleft(self):
+        """
+        Remove and return the first row
+        """
+        if not self.length:
+            raise IndexError('pop from an empty LineTable')
+        row = self[0]
+        self.first = (self.first + 1) % self.capacity
+        self.length -= 1
+        return row
+
+    def clear(self):
+        """
+        Remove all the rows, and free the array
+        """
+        self.rows = array('i')
+        self.first = 0
+        self.length = 0
@@ -0,0 +1,209 @@
+"""
+Sidecar indexes for the conversation logs.
+
+Each room log file (see :py:mod:`logger`) gets an index file with the
+same name in the ``.index`` subdirectory of the log dir. The index is a
+flat array of fixed-size records, one per logged message, so that the
+record of the message number n lives at ``n * RECORD.size``. A record
+contains:
+
+- the byte offset of the first line of the message in the log file
+- the UTC timestamp (in seconds) of the message, clamped so that it is
+  never lower than the one of the previous record. That way the
+  timestamp column is sorted and can be bisected to jump to a date,
+  even when a delayed message is logged after more recent ones.
+
+Loading the last n messages of a log thus only needs one record and the
+bytes that are returned, and finding the first message of a given date
+is a binary search over the index.
+
+Records are appended in memory and written along with the messages
+they point to (see :py:meth:`Logger.flush`).
+
+The index is checked against the log file each time it is opened: new
+messages appended by someone else are indexed from the last known
+position, and a log file that does not match the index anymore (for
+example after a rotation) triggers a full rebuild.
+"""
+
+import logging
+
+log = logging.getLogger(__name__)
+
+import calendar
+import mmap
+import os
+import struct
+
+# (offset of the message in the log file, UTC timestamp)
+RECORD = struct.Struct('<QI')
+
+INDEX_DIR = '.index'
+
+def parse_timestamp(header):
+    """
+    Get the UTC timestamp of a message from the beginning of its
+    first line in the log file (b'MR 20140101T12:00:00Z …').
+    Returns 0 if the line is malformed.
+    """
+    try:
+        return calendar.timegm((int(header[3:7]), int(header[7:9]),
+                                int(header[9:11]), int(header[12:14]),
+                                int(header[15:17]), int(header[18:20]),
+                                0, 0, 0))
+    except ValueError:
+        return 0
+
+def scan_messages(data, start=0):
+    """
+    Generate the (offset, timestamp) of each message that begins in
+    data at or after start.
+    """
+    if start == 0 and data[:1] == b'M':
+        yield 0, parse_timestamp(data[:21])
+    pos = data.find(b'\nM', max(start - 1, 0))
+    while pos != -1:
+        pos += 1
+        yield pos, parse_timestamp(data[pos:pos+21])
+        pos = data.find(b'\nM', pos)
+
+class LogIndex(object):
+    """
+    The index of one log file. Use :py:meth:`open` before anything else,
+    and :py:meth:`append` each time a message is added to the log.
+    """
+    def __init__(self, log_path, index_path):
+        self.log_path = log_path
+        self.index_path = index_path
+        self.fd = None
+        # records of the messages not yet written in the log file
+        self.pending = []
+        # number of indexed messages
+        self.count = 0
+        # size of the log file covered by the index
+        self.log_size = 0
+        # timestamp of the last indexed message
+        self.last_timestamp = 0
+
+    def open(self):
+        """
+        Open the index file, and bring it up to date with the log file.
+        Returns False if the index can not be used.
+        """
+        try:
+            self.fd = open(self.index_path, 'a+b')
+            log_size = os.path.getsize(self.log_path)
+        except OSError:
+            log.error('Unable to open the log index (%s)',
+                      self.index_path, exc_info=True)
+            self.close()
+            return False
+        index_size = os.fstat(self.fd.fileno()).st_size
+        self.count = index_size // RECORD.size
+        if index_size % RECORD.size:
+            # a record was partially written, drop it
+            self.fd.truncate(self.count * RECORD.size)
+        self.log_size = log_size
+        if not log_size:
+            self.reset()
+            return True
+        with open(self.log_path, 'rb') as log_fd:
+            data = mmap.mmap(log_fd.fileno(), 0, prot=mmap.PROT_READ)
+            with data:
+                start = 0
+                if self.count:
+                    offset, self.last_timestamp = self.record(self.count - 1)
+                    if (offset < log_size and data[offset:offset+1] == b'M'
+                            and (offset == 0 or
+                                 data[offset-1:offset] == b'\n')):
+                        start = offset + 1
+                    else:
+                        log.debug('Log index of %s is stale, rebuilding it',
+                                  self.log_path)
+                        self.reset()
+                self.extend(scan_messages(data, start))
+        self.log_size = log_size
+        return True
+
+    def close(self):
+        "Close the index file, dropping the pending records"
+        self.pending = []
+        if self.fd:
+            try:
+                self.fd.close()
+            except OSError:
+                pass
+        self.fd = None
+
+    def reset(self):
+        "Remove all the records"
+        self.fd.truncate(0)
+        self.count = 0
+        self.last_timestamp = 0
+
+    def extend(self, entries):
+        "Add several (offset, timestamp) records"
+        records = []
+        for offset, timestamp in entries:
+            timestamp = max(timestamp, self.last_timestamp)
+            records.append(RECORD.pack(offset, timestamp))
+            self.last_timestamp = timestamp
+            if len(records) == 4096:
+                self.fd.write(b''.join(records))
+                self.count += len(records)
+                records = []
+        if records:
+            self.fd.write(b''.join(records))
+            self.count += len(records)
+        self.fd.flush()
+
+    def append(self, timestamp, size):
+        """
+        Index a message of size bytes, that will be written at the end
+        of the log file. The record is kept in memory until
+        :py:meth:`flush` is called, which must be done after the message
+        has been written.
+        """
+        timestamp = max(timestamp, self.last_timestamp)
+        self.pending.append(RECORD.pack(self.log_size, timestamp))
+        self.last_timestamp = timestamp
+        self.log_size += size
+        self.count += 1
+
+    def flush(self):
+        "Write the pending records in the index file"
+        if self.pending:
+            self.fd.write(b''.join(self.pending))
+            self.fd.flush()
+            self.pending = []
+
+    def record(self, number):
+        "Get the (offset, timestamp) record of the given message number"
+        written = self.count - len(self.pending)
+        if number >= written:
+            return RECORD.unpack(self.pending[number - written])
+        self.fd.seek(number * RECORD.size)
+        return RECORD.unpack(self.fd.read(RECORD.size))
+
+    def offset(self, number):
+        """
+        Get the offset of the given message number in the log file, or
+        the size of the log file if there is no such message yet.
+        """
+        if number >= self.count:
+            return self.log_size
+        return self.record(number)[0]
+
+    def find(self, timestamp):
+        """
+        Get the number of the first message logged at or after the
+        given timestamp (or the number of messages if there is none).
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.record(middle)[1] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
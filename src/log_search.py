@@ -0,0 +1,256 @@
+"""
+Full-text search over the conversation logs.
+
+The messages are indexed in an SQLite FTS4 table, stored in
+``search.db`` next to the logs directory. The index is fed by the
+:py:class:`logger.Logger` each time a batch of messages is written in a
+log file, and the log files that are not (fully) indexed yet are indexed
+in the background when poezio starts.
+
+For each log file, the size that has already been indexed is stored, so
+that a message is never indexed twice, and a log file that shrank (e.g.
+because it was rotated) is indexed again from the start.
+
+The docids of the messages follow their time (see DOCID_SHIFT), so the
+FTS table returns the matches from the most recent one, and a search
+only reads the rows it returns instead of sorting all the matches.
+
+All the database accesses are done in a single dedicated thread, so
+neither indexing nor searching ever block the interface:
+:py:meth:`SearchIndex.search` takes a callback, which is called from the
+main loop with the results.
+"""
+
+import logging
+
+log = logging.getLogger(__name__)
+
+import asyncio
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import sqlite3
+    SQLITE = True
+except ImportError:
+    SQLITE = False
+
+from config import LOG_DIR
+from log_index import parse_timestamp, scan_messages
+from logger import log_dir, message_log_re, info_log_re
+
+SearchResult = collections.namedtuple('SearchResult', 'room time nick txt')
+
+# Size of the chunks of a log file that are indexed at once
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Files of the log dir that are not conversation logs
+IGNORED_FILES = ('roster.log',)
+
+# The docid of a message is its timestamp shifted by DOCID_SHIFT bits, plus
+# its rank among the messages of the same second, so that the docid order
+# (in which the FTS table returns the matches) is the chronological order
+DOCID_SHIFT = 20
+
+# Version of the layout of the database, an index built by a previous
+# version is built again
+INDEX_VERSION = 1
+
+def parse_messages(data):
+    """
+    Generate the (timestamp, nick, text) of each message in data, which
+    is a part of a log file that begins with a message.
+    """
+    offsets = [offset for offset, _ in scan_messages(data)]
+    offsets.append(len(data))
+    for start, end in zip(offsets, offsets[1:]):
+        lines = bytes(data[start:end]).decode(errors='replace').splitlines()
+        if not lines:
+            continue
+        match = message_log_re.match(lines[0])
+        if match:
+            nick, first_line = match.group(8, 9)
+        else:
+            match = info_log_re.match(lines[0])
+            if not match:
+                continue
+            nick, first_line = '', match.group(8)
+        text = [first_line.rstrip()]
+        text.extend(line[1:] for line in lines[1:])
+        yield (parse_timestamp(data[start:start+21]), nick, '\n'.join(text))
+
+class SearchIndex(object):
+    """
+    The full-text index of all the logs.
+    """
+    def __init__(self, path=None):
+        self.path = path or os.path.join(LOG_DIR, 'search.db')
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # only used from the executor thread
+        self.db = None
+        # Set when poezio exits, to interrupt the background indexing
+        self.stopped = False
+
+    def feed(self, room, offset, data):
+        """
+        Index the messages that were just written at offset in the log
+        file of room. Called by the Logger.
+        """
+        if self.stopped:
+            return
+        self.executor.submit(self._run, self._index_data, room, offset, data)
+
+    def index_all(self):
+        """
+        Index, in the background, all the log files that were written
+        while the search index was disabled (or before it existed).
+        """
+        if self.stopped:
+            return
+        self.executor.submit(self._run, self._index_all)
+
+    def search(self, query, callback, limit=1000):
+        """
+        Search the logs. callback is called in the main loop with a list
+        of SearchResults (from the most recent), and an error message
+        (None if the query succeeded).
+        """
+        if self.stopped:
+            return
+        future = asyncio.get_event_loop().run_in_executor(
+                self.executor, self._run, self._search, query, limit)
+        future.add_done_callback(
+                lambda future: callback(*(future.result() or ([], 'Error'))))
+
+    def stop(self):
+        """
+        Interrupt the indexing, and stop the thread once the current
+        operation is finished (on exit)
+        """
+        self.stopped = True
+        self.executor.shutdown(wait=False)
+
+    ### Everything below runs in the executor thread ###
+
+    def _run(self, func, *args):
+        "Run func, logging the exceptions"
+        try:
+            if self.db is None:
+                self._connect()
+            return func(*args)
+        except:
+            log.error('Error in the log search index', exc_info=True)
+
+    def _connect(self):
+        "Open the database, and create the tables if needed"
+        self.db = sqlite3.connect(self.path)
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version != INDEX_VERSION:
+            # the docids of the older indexes are not chronological
+            self.db.execute('DROP TABLE IF EXISTS messages')
+            self.db.execute('DROP TABLE IF EXISTS files')
+            self.db.execute('PRAGMA user_version = %d' % INDEX_VERSION)
+        self.db.execute('CREATE TABLE IF NOT EXISTS files '
+                        '(room TEXT PRIMARY KEY, size INTEGER)')
+        try:
+            self.db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS messages '
+                            'USING fts4(room, nick, txt, time, order=DESC, '
+                            'notindexed=time, tokenize=unicode61)')
+        except sqlite3.OperationalError: # no unicode61 tokenizer
+            self.db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS messages '
+                            'USING fts4(room, nick, txt, time, order=DESC, '
+                            'notindexed=time)')
+        self.db.commit()
+
+    def _get_size(self, room):
+        "Get the size of the log file of room that is already indexed"
+        row = self.db.execute('SELECT size FROM files WHERE room = ?',
+                              (room,)).fetchone()
+        return row[0] if row else 0
+
+    def _next_docid(self, timestamp):
+        """
+        Get the first docid not used yet by the messages of that second
+        (a lookup on the primary key of the content table of the index)
+        """
+        first = timestamp << DOCID_SHIFT
+        row = self.db.execute('SELECT max(docid) FROM messages_content '
+                              'WHERE docid >= ? AND docid < ?',
+                              (first, first + (1 << DOCID_SHIFT))).fetchone()
+        return first if row[0] is None else row[0] + 1
+
+    def _insert(self, room, data, size):
+        """
+        Index the messages in data, and set the indexed size of the log
+        file to size
+        """
+        next_docids = {}
+        rows = []
+        for timestamp, nick, txt in parse_messages(data):
+            docid = next_docids.get(timestamp)
+            if docid is None:
+                docid = self._next_docid(timestamp)
+            next_docids[timestamp] = docid + 1
+            rows.append((docid, room, nick, txt, timestamp))
+        self.db.executemany('INSERT INTO messages '
+                            '(docid, room, nick, txt, time) '
+                            'VALUES (?, ?, ?, ?, ?)', rows)
+        self.db.execute('INSERT OR REPLACE INTO files (room, size) '
+                        'VALUES (?, ?)', (room, size))
+        self.db.commit()
+
+    def _index_data(self, room, offset, data):
+        "Index data if it directly follows what was already indexed"
+        if offset != self._get_size(room):
+            return self._index_file(room)
+        self._insert(room, data, offset + len(data))
+
+    def _index_file(self, room):
+        "Index the part of the log file of room that is not indexed yet"
+        path = os.path.join(log_dir, room)
+        size = os.path.getsize(path)
+        indexed = self._get_size(room)
+        if size < indexed:
+            log.debug('The log file %s shrank, indexing it again', path)
+            self.db.execute('DELETE FROM messages WHERE room = ?', (room,))
+            indexed = 0
+        if size == indexed:
+            return
+        with open(path, 'rb') as fd:
+            fd.seek(indexed)
+            while indexed < size and not self.stopped:
+                data = fd.read(CHUNK_SIZE)
+                if not data:
+                    break
+                if indexed + len(data) < size:
+                    # do not cut a message in two
+                    end = data.rfind(b'\nM') + 1
+                    if end > 0:
+                        data = data[:end]
+                        fd.seek(indexed + end)
+                self._insert(room, data, indexed + len(data))
+                indexed += len(data)
+
+    def _index_all(self):
+        "Index all the log files"
+        for room in os.listdir(log_dir):
+            if self.stopped:
+                return
+            if (room.startswith('.') or room in IGNORED_FILES or
+                    not os.path.isfile(os.path.join(log_dir, room))):
+                continue
+            self._index_file(room)
+        log.debug('All the log files are indexed')
+
+    def _search(self, query, limit):
+        "Run a full-text query"
+        try:
+            rows = self.db.execute('SELECT room, time, nick, txt FROM messages '
+                                   'WHERE messages MATCH ? '
+                                   'ORDER BY docid DESC LIMIT ?',
+                                   (query, limit)).fetchall()
+        except sqlite3.OperationalError as exc:
+            return [], str(exc)
+        return [SearchResult(*row) for row in rows], None
@@ -10,6 +10,9 @@ The logger module that handles logging of the poezio
 conversations and roster changes
 """
 
+import asyncio
+import calendar
+import collections
 import mmap
 import os
 import re
@@ -18,6 +21,8 @@ from datetime import datetime
 
 import common
 from config import config
+from log_index import LogIndex, INDEX_DIR, scan_messages
+from string_pool import string_pool
 from xhtml import clean_text
 from theming import dump_tuple, get_theme
 
@@ -28,6 +33,7 @@ log = logging.getLogger(__name__)
 from config import LOG_DIR
 
 log_dir = os.path.join(LOG_DIR, 'logs')
+index_dir = os.path.join(log_dir, INDEX_DIR)
 
 message_log_re = re.compile(r'MR (\d{4})(\d{2})(\d{2})T'
                             r'(\d{2}):(\d{2}):(\d{2})Z '
@@ -43,6 +49,46 @@ def parse_message_line(msg):
         return [i for i in re.split(info_log_re, msg) if i]
     return False
 
+def parse_log_lines(lines):
+    """
+    Convert the lines of a log file into message dicts, that can be
+    given to TextBuffer.add_message()
+    """
+    messages = []
+    color = '\x19%s}' % dump_tuple(get_theme().COLOR_LOG_MSG)
+
+    # now convert that data into actual Message objects
+    idx = 0
+    while idx < len(lines):
+        if lines[idx].startswith(' '): # should not happen ; skip
+            idx += 1
+            log.debug('fail?')
+            continue
+        tup = parse_message_line(lines[idx])
+        idx += 1
+        if not tup or 7 > len(tup) > 10: # skip
+            log.debug('format? %s', tup)
+            continue
+        time = [int(i) for index, i in enumerate(tup) if index < 6]
+        message = {'lines': [],
+                   'history': True,
+                   'time': common.get_local_time(datetime(*time))}
+        size = int(tup[6])
+        if len(tup) == 8: #info line
+            message['lines'].append(color+tup[7])
+        else: # message line
+            message['nickname'] = string_pool.intern(tup[7])
+            message['lines'].append(color+tup[8])
+        while size != 0 and idx < len(lines):
+            message['lines'].append(lines[idx][1:])
+            size -= 1
+            idx += 1
+        message['txt'] = '\n'.join(message['lines'])
+        del message['lines']
+        messages.append(message)
+
+    return messages
+
 
 class Logger(object):
     """
@@ -52,26 +98,197 @@ class Logger(object):
     def __init__(self):
         self.logfile = config.get('logfile')
         self.roster_logfile = None
-        # a dict of 'groupchatname': file-object (opened)
-        self.fds = dict()
+        # an ordered dict of 'groupchatname': file-object opened to append
+        # to the log file (None if only its index is opened), from the
+        # least to the most recently used room. At most max_open_log_files
+        # files are kept opened, see close_unused()
+        self.fds = collections.OrderedDict()
+        # a dict of 'groupchatname': LogIndex (opened), only for rooms
+        # that are in self.fds
+        self.indexes = dict()
+        # counters of the file handles pool
+        self.fds_hits = 0
+        self.fds_misses = 0
+        self.fds_evictions = 0
+        # whether the log dir is known to exist
+        self.log_dir_exists = False
+        # a dict of 'groupchatname': bytearray of the messages waiting
+        # to be written in the log file (see flush())
+        self.buffers = dict()
+        # the asyncio handle of the next scheduled flush_all()
+        self.flush_handle = None
+        # functions called with (room, offset, data) each time some data
+        # is written at offset in the log file of room
+        self.write_handlers = []
+        # the roster changes waiting to be written in roster.log while
+        # they are batched (see start_roster_batch()), None otherwise
+        self.roster_buffer = None
 
     def __del__(self):
+        for room in list(self.buffers):
+            self.flush(room)
         for opened_file in self.fds.values():
             if opened_file:
                 try:
                     opened_file.close()
                 except: # Can't close? too bad
                     pass
+        for index in self.indexes.values():
+            index.close()
 
     def reload_all(self):
-        """Close and reload all the file handles (on SIGHUP)"""
+        """
+        Close all the file handles (on SIGUSR1), they will be opened
+        again when needed
+        """
+        self.flush_all()
         for opened_file in self.fds.values():
             if opened_file:
                 opened_file.close()
+        self.fds.clear()
+        for index in self.indexes.values():
+            index.close()
+        # the log files may have been rotated, the indexes will be
+        # checked again when they are needed
+        self.indexes.clear()
+        self.log_dir_exists = False
         log.debug('All log file handles closed')
-        for room in self.fds:
-            self.fds[room] = self.check_and_create_log_dir(room)
-            log.debug('Log handle for %s re-created', room)
+
+    def close(self, room):
+        """Close the file handles of a room (when its tab is closed)"""
+        self.flush(room)
+        if room in self.fds:
+            if self.fds[room]:
+                self.fds[room].close()
+            del self.fds[room]
+            log.debug('Log file for %s closed.', room)
+        if room in self.indexes:
+            self.indexes.pop(room).close()
+
+    def get_fd(self, room):
+        """
+        Get the file handle used to append to the log file of a room,
+        opening it if needed. Opening a file may close the least recently
+        used ones (see close_unused).
+        """
+        fd = self.fds.get(room)
+        if fd:
+            self.fds.move_to_end(room)
+            self.fds_hits += 1
+            return fd
+        self.fds_misses += 1
+        fd = self.check_and_create_log_dir(room)
+        if not fd:
+            return None
+        self.fds.move_to_end(room)
+        self.close_unused()
+        return fd
+
+    def count_opened(self):
+        "Number of files opened for the rooms: the log files and indexes"
+        return (sum(1 for fd in self.fds.values() if fd) +
+                len(self.indexes))
+
+    def close_unused(self):
+        """
+        Close the files of the least recently used rooms, until at most
+        max_open_log_files files are opened. The files of the most
+        recently used room are always kept.
+        """
+        limit = max(config.get('max_open_log_files'), 1)
+        opened = self.count_opened()
+        while len(self.fds) > 1 and opened > limit:
+            room = next(iter(self.fds))
+            opened -= bool(self.fds[room]) + (room in self.indexes)
+            self.close(room)
+            self.fds_evictions += 1
+
+    def get_fds_stats(self):
+        """
+        Get the state of the pool of file handles, as a dict
+        """
+        return {'opened': self.count_opened(),
+                'max': config.get('max_open_log_files'),
+                'hits': self.fds_hits,
+                'misses': self.fds_misses,
+                'evictions': self.fds_evictions}
+
+    def get_index(self, room):
+        """
+        Get the index of the log file of a room, opening it and bringing
+        it up to date if needed.
+        Returns None if the index can not be used.
+        """
+        if room in self.indexes:
+            self.fds.move_to_end(room)
+            return self.indexes[room]
+        if not config.get_by_tabname('use_log', room):
+            return None
+        self.check_and_create_log_dir(room, open_fd=False)
+        if not self.log_dir_exists:
+            return None
+        # the index is checked against what is on the disk
+        self.flush(room)
+        index = LogIndex(os.path.join(log_dir, room),
+                         os.path.join(index_dir, room))
+        if not index.open():
+            return None
+        self.indexes[room] = index
+        # the log file itself is only opened to append to it (see get_fd),
+        # reading it does not need a handle of the pool
+        if room not in self.fds:
+            self.fds[room] = None
+        self.fds.move_to_end(room)
+        self.close_unused()
+        return index
+
+    def flush(self, room):
+        """
+        Write the buffered messages of a room in its log file, and then
+        their records in the index.
+        Returns False if the messages could not be written.
+        """
+        data = self.buffers.pop(room, None)
+        if not data:
+            return True
+        try:
+            fd = self.fds[room]
+            if self.write_handlers:
+                offset = fd.tell()
+            fd.write(data)
+            fd.flush()
+        except:
+            log.error('Unable to write in the log file (%s)',
+                    os.path.join(log_dir, room),
+                    exc_info=True)
+            if room in self.indexes:
+                # the index does not match the file anymore
+                self.indexes.pop(room).close()
+            return False
+        if room in self.indexes:
+            try:
+                self.indexes[room].flush()
+            except:
+                log.error('Unable to write in the log index (%s)',
+                        os.path.join(index_dir, room),
+                        exc_info=True)
+                self.indexes.pop(room).close()
+        for handler in self.write_handlers:
+            handler(room, offset, data)
+        return True
+
+    def flush_all(self):
+        """
+        Write all the buffered messages (called every log_flush_interval
+        seconds, and on exit)
+        """
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        for room in list(self.buffers):
+            self.flush(room)
+        if self.roster_buffer:
+            self.flush_roster()
 
     def check_and_create_log_dir(self, room, open_fd=True):
         """
@@ -80,42 +297,56 @@ class Logger(object):
         """
         if not config.get_by_tabname('use_log', room):
             return
-        try:
-            makedirs(log_dir)
-        except OSError as e:
-            if e.errno != 17: # file exists
+        if not self.log_dir_exists:
+            try:
+                makedirs(index_dir)
+            except OSError as e:
+                if e.errno != 17: # file exists
+                    log.error('Unable to create the log dir', exc_info=True)
+                else:
+                    self.log_dir_exists = True
+            except:
                 log.error('Unable to create the log dir', exc_info=True)
-        except:
-            log.error('Unable to create the log dir', exc_info=True)
-            return
+                return
+            else:
+                self.log_dir_exists = True
         if not open_fd:
             return
         try:
-            fd = open(os.path.join(log_dir, room), 'a')
+            fd = open(os.path.join(log_dir, room), 'ab')
             self.fds[room] = fd
             return fd
         except IOError:
+            # the log dir may have been removed
+            self.log_dir_exists = False
             log.error('Unable to open the log file (%s)',
                     os.path.join(log_dir, room),
                     exc_info=True)
 
-    def get_logs(self, jid, nb=10):
+    def get_logs(self, jid, nb=10, since=None):
         """
         Get the nb last messages from the log history for the given jid.
+        If since (a local datetime) is given, get the nb first messages
+        logged at or after that date instead.
         Note that a message may be more than one line in these files, so
         this function is a little bit more complicated than “read the last
-        nb lines”.
+        nb lines”: the offset of each message is taken from the index of
+        the log file (see :py:mod:`log_index`).
+        The load_log and use_log options only apply to the history (when
+        since is not given): the messages logged at a date are always read.
         """
-        if config.get_by_tabname('load_log', jid) <= 0:
-            return
+        if since is None:
+            if config.get_by_tabname('load_log', jid) <= 0:
+                return
 
-        if not config.get_by_tabname('use_log', jid):
-            return
+            if not config.get_by_tabname('use_log', jid):
+                return
 
         if nb <= 0:
             return
 
         self.check_and_create_log_dir(jid, open_fd=False)
+        self.flush(jid)
 
         try:
             fd = open(os.path.join(log_dir, jid), 'rb')
@@ -127,17 +358,52 @@ class Logger(object):
         if not fd:
             return
 
+        timestamp = None
+        if since is not None:
+            timestamp = calendar.timegm(
+                    common.get_utc_time(since).timetuple())
+
+        index = self.get_index(jid)
+        with fd:
+            if index is not None:
+                if timestamp is None:
+                    first = max(index.count - nb, 0)
+                    fd.seek(index.offset(first))
+                    data = fd.read()
+                else:
+                    first = index.find(timestamp)
+                    start = index.offset(first)
+                    fd.seek(start)
+                    data = fd.read(index.offset(first + nb) - start)
+            else:
+                data = self._scan_logs(fd, jid, nb, timestamp)
+                if data is None:
+                    return
+
+        lines = data.decode(errors='replace').splitlines()
+        return parse_log_lines(lines)[:nb]
+
+    def _scan_logs(self, fd, jid, nb, timestamp):
+        """
+        Fallback for get_logs() when the log index can not be used: find
+        the data to return by scanning the whole log file.
+        """
         # read the needed data from the file, we just search nb messages by
         # searching "\nM" nb times from the end of the file.  We use mmap to
         # do that efficiently, instead of seek()s and read()s which are costly.
-        with fd:
-            try:
-                m = mmap.mmap(fd.fileno(), 0, prot=mmap.PROT_READ)
-            except Exception: # file probably empty
-                log.error('Unable to mmap the log file for (%s)',
-                        os.path.join(log_dir, jid),
-                        exc_info=True)
-                return
+        try:
+            m = mmap.mmap(fd.fileno(), 0, prot=mmap.PROT_READ)
+        except Exception: # file probably empty
+            log.error('Unable to mmap the log file for (%s)',
+                    os.path.join(log_dir, jid),
+                    exc_info=True)
+            return
+        with m:
+            if timestamp is not None:
+                for pos, time in scan_messages(m):
+                    if time >= timestamp:
+                        return m[pos:]
+                return b''
             pos = m.rfind(b"\nM") # start of messages begin with MI or MR,
                                   # after a \n
             # number of message found so far
@@ -148,42 +414,7 @@ class Logger(object):
             if pos == -1:       # If we don't have enough lines in the file
                 pos = 1         # 1, because we do -1 just on the next line
                                 # to get 0 (start of the file)
-            lines = m[pos-1:].decode(errors='replace').splitlines()
-
-        messages = []
-        color = '\x19%s}' % dump_tuple(get_theme().COLOR_LOG_MSG)
-
-        # now convert that data into actual Message objects
-        idx = 0
-        while idx < len(lines):
-            if lines[idx].startswith(' '): # should not happen ; skip
-                idx += 1
-                log.debug('fail?')
-                continue
-            tup = parse_message_line(lines[idx])
-            idx += 1
-            if not tup or 7 > len(tup) > 10: # skip
-                log.debug('format? %s', tup)
-                continue
-            time = [int(i) for index, i in enumerate(tup) if index < 6]
-            message = {'lines': [],
-                       'history': True,
-                       'time': common.get_local_time(datetime(*time))}
-            size = int(tup[6])
-            if len(tup) == 8: #info line
-                message['lines'].append(color+tup[7])
-            else: # message line
-                message['nickname'] = tup[7]
-                message['lines'].append(color+tup[8])
-            while size != 0 and idx < len(lines):
-                message['lines'].append(lines[idx][1:])
-                size -= 1
-                idx += 1
-            message['txt'] = '\n'.join(message['lines'])
-            del message['lines']
-            messages.append(message)
-
-        return messages
+            return m[pos-1:]
 
     def log_message(self, jid, nick, msg, date=None, typ=1):
         """
@@ -199,18 +430,15 @@ class Logger(object):
         jid = str(jid).replace('/', '\\')
         if not config.get_by_tabname('use_log', jid):
             return True
-        if jid in self.fds.keys():
-            fd = self.fds[jid]
-        else:
-            fd = self.check_and_create_log_dir(jid)
-        if not fd:
+        if not self.get_fd(jid):
             return True
         try:
             msg = clean_text(msg)
             if date is None:
-                str_time = common.get_utc_time().strftime('%Y%m%dT%H:%M:%SZ')
+                utc_time = common.get_utc_time()
             else:
-                str_time = common.get_utc_time(date).strftime('%Y%m%dT%H:%M:%SZ')
+                utc_time = common.get_utc_time(date)
+            str_time = utc_time.strftime('%Y%m%dT%H:%M:%SZ')
             if typ == 1:
                 prefix = 'MR'
             else:
@@ -221,24 +449,32 @@ class Logger(object):
 
             if nick:
                 nick = '<' + nick + '>'
-                fd.write(' '.join((prefix, str_time, nb_lines, nick, ' '+first_line, '\n')))
+                entry = [' '.join((prefix, str_time, nb_lines, nick, ' '+first_line, '\n'))]
             else:
-                fd.write(' '.join((prefix, str_time, nb_lines, first_line, '\n')))
+                entry = [' '.join((prefix, str_time, nb_lines, first_line, '\n'))]
             for line in lines:
-                fd.write(' %s\n' % line)
+                entry.append(' %s\n' % line)
+            data = ''.join(entry).encode('utf-8')
+            index = self.get_index(jid)
+            if index is not None:
+                index.append(calendar.timegm(utc_time.timetuple()), len(data))
+            if jid not in self.buffers:
+                self.buffers[jid] = bytearray()
+            buffer = self.buffers[jid]
+            buffer += data
         except:
             log.error('Unable to write in the log file (%s)',
                     os.path.join(log_dir, jid),
                     exc_info=True)
             return False
-        else:
-            try:
-                fd.flush()          # TODO do something better here?
-            except:
-                log.error('Unable to flush the log file (%s)',
-                        os.path.join(log_dir, jid),
-                        exc_info=True)
-                return False
+        # The messages are written by batches, either when enough of them
+        # are buffered, or at most log_flush_interval seconds later
+        interval = config.get('log_flush_interval')
+        if interval <= 0 or len(buffer) >= config.get('log_buffer_size'):
+            return self.flush(jid)
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_event_loop().call_later(
+                    interval, self.flush_all)
         return True
 
     def log_roster_change(self, jid, message):
@@ -247,6 +483,43 @@ class Logger(object):
         """
         if not config.get_by_tabname('use_log', jid):
             return True
+        str_time = common.get_utc_time().strftime('%Y%m%dT%H:%M:%SZ')
+        message = clean_text(message)
+        lines = message.split('\n')
+        first_line = lines.pop(0)
+        nb_lines = str(len(lines)).zfill(3)
+        entry = ['MI %s %s %s %s\n' % (str_time, nb_lines, jid, first_line)]
+        for line in lines:
+            entry.append(' %s\n' % line)
+        if self.roster_buffer is not None:
+            self.roster_buffer.extend(entry)
+            return True
+        return self.write_roster_log(''.join(entry))
+
+    def start_roster_batch(self):
+        """
+        Keep the roster changes in memory until flush_roster() is called,
+        instead of writing them in roster.log one by one
+        """
+        if self.roster_buffer is None:
+            self.roster_buffer = []
+
+    def flush_roster(self, stop_batch=False):
+        """
+        Write the batched roster changes in roster.log, and stop batching
+        them if stop_batch is True.
+        Returns False if they could not be written.
+        """
+        entries = self.roster_buffer
+        self.roster_buffer = None if stop_batch else []
+        if not entries:
+            return True
+        return self.write_roster_log(''.join(entries))
+
+    def write_roster_log(self, data):
+        """
+        Append some entries to roster.log
+        """
         self.check_and_create_log_dir('', open_fd=False)
         if not self.roster_logfile:
             try:
@@ -257,14 +530,7 @@ class Logger(object):
                         exc_info=True)
                 return False
         try:
-            str_time = common.get_utc_time().strftime('%Y%m%dT%H:%M:%SZ')
-            message = clean_text(message)
-            lines = message.split('\n')
-            first_line = lines.pop(0)
-            nb_lines = str(len(lines)).zfill(3)
-            self.roster_logfile.write('MI %s %s %s %s\n' % (str_time, nb_lines, jid, first_line))
-            for line in lines:
-                self.roster_logfile.write(' %s\n' % line)
+            self.roster_logfile.write(data)
             self.roster_logfile.flush()
         except:
             log.error('Unable to write in the log file (%s)',
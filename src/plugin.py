@@ -41,6 +41,7 @@ class PluginConfig(config.Config):
 
     def read(self):
         """Read the config file"""
+        self.clear_cache()
         RawConfigParser.read(self, self.file_name)
         if not self.has_section(self.module_name):
             self.add_section(self.module_name)
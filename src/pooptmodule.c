@@ -314,6 +314,344 @@ static PyObject* poopt_cut_by_columns(PyObject* self, PyObject* args)
   return Py_BuildValue("s#", start, ptr - start);
 }
 
+/**
+   parse_runs: takes a python string containing poezio formatting
+   sequences (\x19 followed by a char, or by a color and a closing '}')
+   and returns a list of three-tuples (start, end, attr).
+
+   Each tuple is a run of text, text[start:end], to be written with the
+   attribute attr, the formatting sequence preceding it: a lowercased
+   char ("o", "u", "b", etc) or a color without its \x19 and '}'
+   ("1", "12,-1,b", etc).  The first run has an empty attr.  Only the part
+   of the string between the optional start and end positions is parsed,
+   as if it was the whole string, so lines can be parsed without being
+   copied.
+
+   For example,
+   poopt_parse_runs("a\x19bb\x1912}c");
+   will return [(0, 1, ""), (3, 4, "b"), (8, 9, "12")]
+*/
+PyDoc_STRVAR(poopt_parse_runs_doc, "parse_runs(text[, start[, end]])\n\n\nReturn a list of three-tuples (start, end, attr): the runs of text between the formatting sequences, each with the attribute of the sequence preceding it.");
+
+static int append_run(PyObject* retlist, Py_ssize_t start, Py_ssize_t end,
+                      PyObject* attr)
+{
+    PyObject* tmp = Py_BuildValue("nnO", start, end, attr);
+    if (tmp == NULL)
+        return -1;
+    const int res = PyList_Append(retlist, tmp);
+    Py_DECREF(tmp);
+    return res;
+}
+
+static PyObject* poopt_parse_runs(PyObject* self, PyObject* args)
+{
+    PyObject* text;
+    Py_ssize_t start = 0;
+    Py_ssize_t end = PY_SSIZE_T_MAX;
+
+    if (PyArg_ParseTuple(args, "U|nn", &text, &start, &end) == 0)
+        return NULL;
+
+    const Py_ssize_t len = PyUnicode_GET_LENGTH(text);
+    const int kind = PyUnicode_KIND(text);
+    const void* const data = PyUnicode_DATA(text);
+
+    if (start < 0)
+        start = 0;
+    if (end > len)
+        end = len;
+    if (start > end)
+        start = end;
+
+    /* The list of tuples that we return */
+    PyObject* retlist = PyList_New(0);
+    if (retlist == NULL)
+        return NULL;
+
+    /* The attribute of the current run, and the position where it starts */
+    PyObject* attr = PyUnicode_New(0, 0);
+    if (attr == NULL)
+        goto error;
+    Py_ssize_t run_start = start;
+
+    Py_ssize_t pos = start;
+    while (pos < end)
+    {
+        if (PyUnicode_READ(kind, data, pos) != 25)   /* \x19 */
+        {
+            pos++;
+            continue;
+        }
+        /* The end of the current run */
+        if (append_run(retlist, run_start, pos, attr) == -1)
+            goto error;
+        Py_DECREF(attr);
+        attr = NULL;
+
+        Py_ssize_t next;
+        if (pos + 1 >= end)
+        {   /* A \x19 at the end of the string, without any attribute */
+            attr = PyUnicode_New(0, 0);
+            next = end;
+        }
+        else
+        {
+            Py_UCS4 c = PyUnicode_READ(kind, data, pos + 1);
+            if ((c >= '0' && c <= '9') || c == '-')
+            {   /* A color, until the next '}' (or the last char) */
+                Py_ssize_t color_end = pos + 2;
+                while (color_end < end &&
+                       PyUnicode_READ(kind, data, color_end) != '}')
+                    color_end++;
+                if (color_end == end)
+                    color_end = end - 1;
+                attr = PyUnicode_Substring(text, pos + 1, color_end);
+                next = color_end + 1;
+            }
+            else
+            {
+                if (c >= 'A' && c <= 'Z')
+                    c += 'a' - 'A';
+                attr = PyUnicode_FromOrdinal(c);
+                next = pos + 2;
+            }
+        }
+        if (attr == NULL)
+            goto error;
+        run_start = next;
+        pos = next;
+    }
+    /* The last run, until the end of the string */
+    if (append_run(retlist, run_start, end, attr) == -1)
+        goto error;
+    Py_DECREF(attr);
+    return retlist;
+ error:
+    Py_XDECREF(attr);
+    Py_DECREF(retlist);
+    return NULL;
+}
+
+/**
+   layout_message: takes a python string containing poezio formatting
+   sequences and a width, and returns a list of three-tuples
+   (start, end, prepend), one for each line.
+
+   The lines are cut like cut_text does it (on the last space if possible,
+   and on each \n), reading the characters directly from the python
+   string instead of decoding it again.  The formatting sequences are
+   parsed like parse_runs does it, without being counted in the width of
+   the lines, and prepend is the string of the attributes carried over to
+   the line from the previous ones: the underline and bold attributes and
+   the colors set since the last \x19o, each preceded by a \x19 (the
+   colors end with a '}'), or an empty string.
+
+   For example,
+   poopt_layout_message("\x19bfoo \x191}bar baz", 5);
+   will return [(0, 5, ""), (6, 12, "\x19b"), (13, 16, "\x19b\x191}")]
+*/
+PyDoc_STRVAR(poopt_layout_message_doc, "layout_message(text, width)\n\n\nReturn a list of three-tuples (start, end, prepend): the start and end positions of each line, and the attributes carried over to it from the previous lines.");
+
+static int append_line(PyObject* retlist, Py_ssize_t start, Py_ssize_t end,
+                       PyObject* prepend)
+{
+    PyObject* tmp = Py_BuildValue("nnO", start, end, prepend);
+    if (tmp == NULL)
+        return -1;
+    const int res = PyList_Append(retlist, tmp);
+    Py_DECREF(tmp);
+    return res;
+}
+
+static PyObject* poopt_layout_message(PyObject* self, PyObject* args)
+{
+    PyObject* text;
+    Py_ssize_t width;
+
+    if (PyArg_ParseTuple(args, "Un", &text, &width) == 0)
+        return NULL;
+    if (width < 0)
+        width = PY_SSIZE_T_MAX;
+
+    const Py_ssize_t len = PyUnicode_GET_LENGTH(text);
+    const int kind = PyUnicode_KIND(text);
+    const void* const data = PyUnicode_DATA(text);
+
+    /* The list of tuples that we return */
+    PyObject* retlist = PyList_New(0);
+    if (retlist == NULL)
+        return NULL;
+
+    /* The attributes carried over to the current line, the ones set so
+     * far, and the ones set before the last space of the line */
+    PyObject* prepend = PyUnicode_New(0, 0);
+    PyObject* attrs = prepend;
+    PyObject* space_attrs = prepend;
+    Py_XINCREF(attrs);
+    Py_XINCREF(space_attrs);
+    if (prepend == NULL)
+        goto error;
+
+    /* The position in the python string */
+    Py_ssize_t pos = 0;
+    /* The start position of the current line */
+    Py_ssize_t start_pos = 0;
+    /* The position of the last space seen in the current line, and the
+     * number of columns taken by the chars between start_pos and it */
+    Py_ssize_t last_space = -1;
+    Py_ssize_t cols_until_space = 0;
+    /* Number of columns taken to display the current line so far */
+    Py_ssize_t columns = 0;
+
+    while (pos < len)
+    {
+        const Py_UCS4 c = PyUnicode_READ(kind, data, pos);
+        if (c == 25)   /* \x19 */
+        {
+            /* A formatting sequence, not displayed: update the attributes */
+            if (pos + 1 >= len)
+                break;
+            /* The string to add to the attributes, if any */
+            PyObject* added = NULL;
+            Py_ssize_t next;
+            Py_UCS4 attr_char = PyUnicode_READ(kind, data, pos + 1);
+            if ((attr_char >= '0' && attr_char <= '9') || attr_char == '-')
+            {   /* A color, until the next '}' (or the last char) */
+                Py_ssize_t color_end = pos + 2;
+                while (color_end < len &&
+                       PyUnicode_READ(kind, data, color_end) != '}')
+                    color_end++;
+                if (color_end == len)
+                {
+                    color_end = len - 1;
+                    if (color_end > pos + 1)
+                    {
+                        PyObject* color = PyUnicode_Substring(text, pos,
+                                                              color_end);
+                        if (color == NULL)
+                            goto error;
+                        added = PyUnicode_FromFormat("%U}", color);
+                        Py_DECREF(color);
+                        if (added == NULL)
+                            goto error;
+                    }
+                }
+                else
+                {
+                    added = PyUnicode_Substring(text, pos, color_end + 1);
+                    if (added == NULL)
+                        goto error;
+                }
+                next = color_end + 1;
+            }
+            else
+            {
+                if (attr_char == 'o' || attr_char == 'O')
+                {
+                    Py_DECREF(attrs);
+                    attrs = PyUnicode_New(0, 0);
+                    if (attrs == NULL)
+                        goto error;
+                }
+                else if (attr_char == 'u' || attr_char == 'U')
+                    added = PyUnicode_FromString("\x19u");
+                else if (attr_char == 'b' || attr_char == 'B')
+                    added = PyUnicode_FromString("\x19" "b");
+                if (attr_char != 'o' && attr_char != 'O' && added == NULL &&
+                    PyErr_Occurred())
+                    goto error;
+                next = pos + 2;
+            }
+            if (added != NULL)
+            {
+                PyObject* tmp = PyUnicode_Concat(attrs, added);
+                Py_DECREF(added);
+                if (tmp == NULL)
+                    goto error;
+                Py_DECREF(attrs);
+                attrs = tmp;
+            }
+            pos = next;
+            continue;
+        }
+
+        /* This is one condition to end the line: an explicit \n is found */
+        if (c == '\n')
+        {
+            pos++;
+            if (append_line(retlist, start_pos, pos, prepend) == -1)
+                goto error;
+            /* And then initiate a new line */
+            Py_INCREF(attrs);
+            Py_DECREF(prepend);
+            prepend = attrs;
+            start_pos = pos;
+            last_space = -1;
+            columns = 0;
+            continue;
+        }
+
+        /* Get the number of columns needed to display this character. May be 0, 1 or 2 */
+        const Py_ssize_t cols = xwcwidth((wchar_t)c);
+
+        /* This is the second condition to end the line: we have consumed
+         * enough columns to fill a whole line */
+        if (columns + cols > width)
+        {   /* If possible, cut on a space */
+            if (last_space != -1)
+            {
+                if (append_line(retlist, start_pos, last_space, prepend) == -1)
+                    goto error;
+                Py_INCREF(space_attrs);
+                Py_DECREF(prepend);
+                prepend = space_attrs;
+                start_pos = last_space + 1;
+                last_space = -1;
+                columns -= (cols_until_space + 1);
+            }
+            else
+            {
+                /* Otherwise, cut in the middle of a word */
+                if (append_line(retlist, start_pos, pos, prepend) == -1)
+                    goto error;
+                Py_INCREF(attrs);
+                Py_DECREF(prepend);
+                prepend = attrs;
+                start_pos = pos;
+                columns = 0;
+            }
+        }
+        /* We save the position of the last space seen in this line, the
+           number of columns we have until now, and the attributes set
+           before it, which will be carried over to the next line if we
+           cut on it */
+        if (c == ' ')
+        {
+            last_space = pos;
+            cols_until_space = columns;
+            Py_INCREF(attrs);
+            Py_DECREF(space_attrs);
+            space_attrs = attrs;
+        }
+        columns += cols;
+        pos++;
+    }
+    /* We are at the end of the string, append the last line, not finished */
+    if (append_line(retlist, start_pos, len, prepend) == -1)
+        goto error;
+    Py_DECREF(prepend);
+    Py_DECREF(attrs);
+    Py_DECREF(space_attrs);
+    return retlist;
+ error:
+    Py_XDECREF(prepend);
+    Py_XDECREF(attrs);
+    Py_XDECREF(space_attrs);
+    Py_DECREF(retlist);
+    return NULL;
+}
+
 /***
     Module initialization. Just taken from the xxmodule.c template from the
     python sources.
@@ -419,6 +757,8 @@ static PyMethodDef poopt_methods[] = {
   {"cut_text", poopt_cut_text, METH_VARARGS, poopt_cut_text_doc},
   {"wcswidth", poopt_wcswidth, METH_VARARGS, poopt_wcswidth_doc},
   {"cut_by_columns", poopt_cut_by_columns, METH_VARARGS, poopt_cut_by_columns_doc},
+  {"parse_runs", poopt_parse_runs, METH_VARARGS, poopt_parse_runs_doc},
+  {"layout_message", poopt_layout_message, METH_VARARGS, poopt_layout_message_doc},
   {}           /* sentinel */
 };
 
@@ -0,0 +1,98 @@
+"""
+Defines the RecentWords class, an index of the words recently said in a
+tab, used by the recent words completion (see
+ChatTab.last_words_completion).
+
+Each TextBuffer feeds the words of its new messages to its index.  Every
+word has a score, its number of occurrences weighted by their age: an
+occurrence counts for 1 when it is added, and its weight halves every
+HALF_LIFE messages, so that the words said often and recently are proposed
+first.  Only the max_recent_words best words are kept.
+"""
+
+import bisect
+import itertools
+import string
+
+import xhtml
+
+# Number of messages after which an occurrence of a word counts half
+HALF_LIFE = 32
+
+# Only the words at least that long are completed
+MIN_LENGTH = 4
+
+# The characters separating the words, in addition to the whitespaces
+SEPARATORS = str.maketrans(dict.fromkeys(string.punctuation + '’„“”…«»',
+                                         ' '))
+
+# The weights are stored relatively to the message they were added at,
+# and rescaled when they become too big
+MAX_WEIGHT = 2 ** 512
+
+class RecentWords(object):
+    """
+    The words recently said in a tab, with their scores
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        # word -> score
+        self.scores = {}
+        # The (lowercased word, word), sorted, to find the words starting
+        # with a prefix
+        self.keys = []
+        # weight of an occurrence in the current message
+        self.weight = 1.0
+
+    def __len__(self):
+        return len(self.scores)
+
+    def clear(self):
+        self.scores.clear()
+        self.keys = []
+        self.weight = 1.0
+
+    def add_message(self, txt):
+        """
+        Add the words of a message (with the xhtml-im attributes)
+        """
+        words = xhtml.clean_text(txt).translate(SEPARATORS).split()
+        for word in words:
+            if len(word) < MIN_LENGTH:
+                continue
+            if word not in self.scores:
+                self.scores[word] = 0
+                bisect.insort(self.keys, (word.lower(), word))
+            self.scores[word] += self.weight
+        self.weight *= 2 ** (1 / HALF_LIFE)
+        if self.weight > MAX_WEIGHT:
+            for word in self.scores:
+                self.scores[word] /= self.weight
+            self.weight = 1.0
+        if len(self.scores) > self.limit:
+            self.drop_words()
+
+    def drop_words(self):
+        """
+        Drop the lowest scored words, down to three quarters of the limit
+        so that it is not done on every message
+        """
+        kept = sorted(self.scores, key=self.scores.__getitem__,
+                      reverse=True)[:self.limit * 3 // 4]
+        self.scores = {word: self.scores[word] for word in kept}
+        self.keys = sorted((word.lower(), word) for word in kept)
+
+    def get_completions(self, prefix):
+        """
+        Return the words starting with prefix (case insensitive), the best
+        scored first
+        """
+        prefix = prefix.lower()
+        index = bisect.bisect_left(self.keys, (prefix,))
+        words = []
+        for key, word in itertools.islice(self.keys, index, None):
+            if not key.startswith(prefix):
+                break
+            words.append(word)
+        words.sort(key=self.scores.__getitem__, reverse=True)
+        return words
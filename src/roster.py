@@ -14,7 +14,9 @@ log = logging.getLogger(__name__)
 
 from config import config
 from contact import Contact
-from roster_sorting import SORTING_METHODS, GROUP_SORTING_METHODS
+from roster_search import RosterSearchIndex
+from roster_sorting import get_sort_key, get_group_sort_key
+from string_pool import string_pool
 
 from os import path as p
 from datetime import datetime
@@ -33,9 +35,12 @@ class Roster(object):
         node: the RosterSingle from slixmpp
         """
         self.__node = None
-        self.contact_filter = None # A tuple(function, *args)
-                                    # function to filter contacts,
-                                    # on search, for example
+        self.contact_filter = None # A tuple(function, text)
+                                    # function returning the contacts
+                                    # matching text, on search (see
+                                    # RosterSearchIndex.search)
+        # index of the JIDs, names and groups of the contacts
+        self.search_index = RosterSearchIndex()
         self.folded_groups = set(config.get('folded_roster_groups',
                                             section='var').split(':'))
         self.groups = {}
@@ -44,9 +49,56 @@ class Roster(object):
         # Used for caching roster infos
         self.last_built = datetime.now()
         self.last_modified = datetime.now()
-
-    def modified(self):
+        # Whether anything may have changed since the last time the
+        # roster view was built, or only the contacts whose bare JID is in
+        # modified_contacts
+        self.full_rebuild = True
+        self.modified_contacts = set()
+        # The bare JIDs of the connected contacts (None if it has to be
+        # computed again) and of the contacts that may have been connected
+        # or disconnected since
+        self.connected = None
+        self.uncounted_contacts = set()
+        # Cached result of jids()
+        self._jids = None
+
+    def modified(self, jid=None):
+        """
+        Tell the roster view that it has to be updated: only for the
+        contact with the given JID, whose presence or information has
+        changed, or entirely if no JID is given.
+        """
         self.last_modified = datetime.now()
+        if jid is None:
+            self.full_rebuild = True
+            self.modified_contacts.clear()
+            self.connected = None
+            self.uncounted_contacts.clear()
+            self._jids = None
+            for group in self.groups.values():
+                group.nb_connected = None
+            return
+        jid = safeJID(jid).bare
+        if not self.full_rebuild:
+            self.modified_contacts.add(jid)
+        if self.connected is not None:
+            self.uncounted_contacts.add(jid)
+        contact = self.contacts.get(jid)
+        if contact:
+            for name in contact.groups:
+                if name in self.groups:
+                    self.groups[name].nb_connected = None
+
+    def pop_modifications(self):
+        """
+        Return whether the roster view has to be built entirely, and the
+        bare JIDs of the contacts modified since the last call otherwise
+        """
+        full_rebuild = self.full_rebuild
+        modified_contacts = self.modified_contacts
+        self.full_rebuild = False
+        self.modified_contacts = set()
+        return full_rebuild, modified_contacts
 
     @property
     def needs_rebuild(self):
@@ -57,10 +109,8 @@ class Roster(object):
         key = safeJID(key).bare
         if key in self.contacts and self.contacts[key] is not None:
             return self.contacts[key]
-        if key in self.jids():
-            contact = Contact(self.__node[key])
-            self.contacts[key] = contact
-            return contact
+        if self.is_listed(key):
+            return self.contacts[key]
 
     def __setitem__(self, key, value):
         """Set the a Contact value for the bare jid key"""
@@ -83,6 +133,7 @@ class Roster(object):
         if not contact:
             return
         del self.contacts[contact.bare_jid]
+        self.search_index.remove(contact.bare_jid)
 
         for group in list(self.groups.values()):
             group.remove(contact)
@@ -96,7 +147,7 @@ class Roster(object):
 
     def __contains__(self, key):
         """True if the bare jid is in the roster, false otherwise"""
-        return safeJID(key).bare in self.jids()
+        return self.is_listed(safeJID(key).bare)
 
     @property
     def jid(self):
@@ -105,6 +156,7 @@ class Roster(object):
 
     def get_and_set(self, jid):
         if not jid in self.contacts:
+            jid = string_pool.intern(jid)
             contact = Contact(self.__node[jid])
             self.contacts[jid] = contact
             return contact
@@ -113,21 +165,12 @@ class Roster(object):
     def set_node(self, value):
         """Set the slixmpp RosterSingle for our roster"""
         self.__node = value
+        self.modified()
 
     def get_groups(self, sort=''):
         """Return a list of the RosterGroups"""
-        group_list = sorted(
-                (group for group in self.groups.values() if group),
-                key=lambda x: x.name.lower() if x.name else ''
-            )
-
-        for sorting in sort.split(':'):
-            if sorting == 'reverse':
-                group_list = list(reversed(group_list))
-            else:
-                method = GROUP_SORTING_METHODS.get(sorting, lambda x: 0)
-                group_list = sorted(group_list, key=method)
-        return group_list
+        return sorted((group for group in self.groups.values() if group),
+                      key=get_group_sort_key(sort))
 
     def get_group(self, name):
         """Return a group or create it if not present"""
@@ -139,14 +182,20 @@ class Roster(object):
         """Subscribe to a jid"""
         self.__node.subscribe(jid)
 
+    def is_listed(self, key):
+        """
+        Whether the bare JID is one of jids(), without listing them
+        """
+        if key == self.jid or key not in self.__node.keys():
+            return False
+        return self.exists(self.get_and_set(key))
+
     def jids(self):
         """List of the contact JIDS"""
-        l = []
-        for key in self.__node.keys():
-            contact = self.get_and_set(key)
-            if key != self.jid and (contact and self.exists(contact)):
-                l.append(key)
-        return l
+        if self._jids is None:
+            self._jids = [key for key in self.__node.keys()
+                              if self.is_listed(key)]
+        return list(self._jids)
 
     def get_contacts(self):
         """
@@ -156,24 +205,18 @@ class Roster(object):
 
     def get_contacts_sorted_filtered(self, sort=''):
         """
-        Return a list of all the contacts sorted with a criteria
+        Return a list of all the contacts sorted with a criteria, the
+        best matches first if they are filtered
         """
-        contact_list = []
-        for contact in self.get_contacts():
-            if contact.bare_jid != self.jid:
-                if self.contact_filter:
-                    if self.contact_filter[0](contact, self.contact_filter[1]):
-                        contact_list.append(contact)
-                else:
-                    contact_list.append(contact)
-        contact_list = sorted(contact_list, key=SORTING_METHODS['name'])
-
-        for sorting in sort.split(':'):
-            if sorting == 'reverse':
-                contact_list = list(reversed(contact_list))
-            else:
-                method = SORTING_METHODS.get(sorting, lambda x: 0)
-                contact_list = sorted(contact_list, key=method)
+        if not self.contact_filter:
+            return sorted(self.get_contacts(), key=get_sort_key(sort))
+        search, txt = self.contact_filter
+        scores = search(txt)
+        contact_list = [self.contacts[jid] for jid in scores
+                            if self.is_listed(jid)]
+        contact_list.sort(key=get_sort_key(sort))
+        contact_list.sort(key=lambda contact: scores[contact.bare_jid],
+                          reverse=True)
         return contact_list
 
     def save_to_config_file(self):
@@ -188,13 +231,21 @@ class Roster(object):
 
     def get_nb_connected_contacts(self):
         """
-        Get the number of connected contacts
+        Get the number of connected contacts, counting only the contacts
+        modified since the last call
         """
-        n = 0
-        for contact in self:
-            if self.exists(contact) and len(contact):
-                n += 1
-        return n
+        if self.connected is None:
+            self.connected = set(contact.bare_jid for contact in self
+                                    if self.exists(contact) and len(contact))
+            self.uncounted_contacts.clear()
+        for jid in self.uncounted_contacts:
+            contact = self.contacts.get(jid)
+            if contact and self.exists(contact) and len(contact):
+                self.connected.add(jid)
+            else:
+                self.connected.discard(jid)
+        self.uncounted_contacts.clear()
+        return len(self.connected)
 
     def update_contact_groups(self, contact):
         """Regenerate the RosterGroups when receiving a contact update"""
@@ -202,6 +253,7 @@ class Roster(object):
             contact = self.get_and_set(contact)
         if not contact:
             return
+        self.modified()
         for name, group in self.groups.items():
             if name in contact.groups and contact not in group:
                 group.add(contact)
@@ -212,6 +264,7 @@ class Roster(object):
             if not group in self.groups:
                 self.groups[group] = RosterGroup(group, folded=group in self.folded_groups)
                 self.groups[group].add(contact)
+        self.search_index.update(contact)
 
     def __len__(self):
         """
@@ -219,7 +272,9 @@ class Roster(object):
         (used to return the display size, but now we have
         the display cache in RosterWin for that)
         """
-        return len(self.jids())
+        if self._jids is None:
+            self.jids()
+        return len(self._jids)
 
     def __repr__(self):
         ret = '== Roster:\nContacts:\n'
@@ -266,6 +321,8 @@ class RosterGroup(object):
         self.contacts = set(contacts)
         self.name = name if name is not None else ''
         self.folded = folded    # if the group content is to be shown
+        # Cached number of connected contacts, None when it is unknown
+        self.nb_connected = None
 
     def __iter__(self):
         """Iterate over the contacts"""
@@ -287,25 +344,19 @@ class RosterGroup(object):
     def add(self, contact):
         """Add a contact to the group"""
         self.contacts.add(contact)
+        self.nb_connected = None
 
     def remove(self, contact):
         """Remove a contact from the group if present"""
         if contact in self.contacts:
             self.contacts.remove(contact)
+            self.nb_connected = None
 
     def get_contacts(self, contact_filter=None, sort=''):
         """Return the group contacts, filtered and sorted"""
         contact_list = self.contacts.copy() if not contact_filter\
             else [contact for contact in self.contacts.copy() if contact_filter[0](contact, contact_filter[1])]
-        contact_list = sorted(contact_list, key=SORTING_METHODS['name'])
-
-        for sorting in sort.split(':'):
-            if sorting == 'reverse':
-                contact_list = list(reversed(contact_list))
-            else:
-                method = SORTING_METHODS.get(sorting, lambda x: 0)
-                contact_list = sorted(contact_list, key=method)
-        return contact_list
+        return sorted(contact_list, key=get_sort_key(sort))
 
     def toggle_folded(self):
         """Fold/unfold the group in the roster"""
@@ -319,7 +370,10 @@ class RosterGroup(object):
 
     def get_nb_connected_contacts(self):
         """Return the number of connected contacts"""
-        return len([1 for contact in self.contacts if len(contact)])
+        if self.nb_connected is None:
+            self.nb_connected = len([1 for contact in self.contacts
+                                         if len(contact)])
+        return self.nb_connected
 
 def create_roster():
     "Create the global roster object"
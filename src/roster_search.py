@@ -0,0 +1,118 @@
+"""
+Defines the RosterSearchIndex class, used to search the contacts of the
+roster by JID, name or group (see RosterInfoTab.start_search).
+
+The fields of the contacts are cut into bigrams (two consecutive
+characters) and skip-bigrams (two characters separated by another one),
+each of them pointing to the fields containing it.  An exact search only
+checks the fields containing all the bigrams of the text, and a fuzzy
+search scores the fields by the proportion of the grams of the text they
+contain, which tolerates a typo or two swapped letters.
+"""
+
+import collections
+from itertools import chain
+
+# Proportion of the grams of the text that a field must contain to be a
+# fuzzy match
+FUZZY_THRESHOLD = 0.7
+
+def get_grams(text, skip=True):
+    """
+    Return the set of the bigrams of a text, with its skip-bigrams if skip
+    is True
+    """
+    grams = set(text[i:i+2] for i in range(len(text) - 1))
+    if skip:
+        grams.update(text[i] + text[i+2] for i in range(len(text) - 2))
+    return grams
+
+class RosterSearchIndex(object):
+    """
+    An index of the JIDs, names and groups of the contacts
+    """
+    def __init__(self):
+        # bare JID -> tuple of the lowercased fields of the contact
+        self.fields = {}
+        # gram -> set of the (bare JID, field number) containing it
+        self.postings = collections.defaultdict(set)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def update(self, contact):
+        """
+        Index a new contact, or a contact whose name or groups changed
+        """
+        jid = contact.bare_jid
+        fields = tuple(field.lower()
+                           for field in chain((jid, contact.name),
+                                              contact.groups)
+                           if field)
+        if self.fields.get(jid) == fields:
+            return
+        self.remove(jid)
+        self.fields[jid] = fields
+        for number, field in enumerate(fields):
+            key = (jid, number)
+            for gram in get_grams(field):
+                self.postings[gram].add(key)
+
+    def remove(self, jid):
+        """
+        Remove a contact from the index
+        """
+        fields = self.fields.pop(jid, None)
+        if fields is None:
+            return
+        for number, field in enumerate(fields):
+            key = (jid, number)
+            for gram in get_grams(field):
+                keys = self.postings[gram]
+                keys.discard(key)
+                if not keys:
+                    del self.postings[gram]
+
+    def search(self, txt):
+        """
+        Return the contacts with txt in their JID, name or one of their
+        groups (case insensitive), as a dict of bare JID -> score (1)
+        """
+        txt = txt.lower()
+        if not txt:
+            return dict.fromkeys(self.fields, 1)
+        grams = get_grams(txt, skip=False)
+        if grams:
+            postings = sorted((self.postings.get(gram, set())
+                                   for gram in grams),
+                              key=len)
+            candidates = postings[0].intersection(*postings[1:])
+            jids = (jid for jid, number in candidates
+                        if txt in self.fields[jid][number])
+        else:
+            jids = (jid for jid, fields in self.fields.items()
+                        if any(txt in field for field in fields))
+        return dict.fromkeys(jids, 1)
+
+    def search_fuzzy(self, txt):
+        """
+        Return the contacts whose JID, name or one of their groups
+        approximately contains txt, as a dict of bare JID -> score, the
+        proportion of the grams of txt found in the best field
+        """
+        txt = txt.lower()
+        grams = get_grams(txt)
+        if len(grams) < 3:
+            # too short to be approximated
+            return self.search(txt)
+        counts = collections.Counter(
+                chain.from_iterable(self.postings.get(gram, ())
+                                        for gram in grams))
+        minimum = FUZZY_THRESHOLD * len(grams)
+        scores = {}
+        for (jid, number), count in counts.items():
+            if count >= minimum and count > scores.get(jid, 0):
+                scores[jid] = count
+        for jid in scores:
+            scores[jid] /= len(grams)
+        return scores
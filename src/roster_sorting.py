@@ -52,6 +52,13 @@ SORTING_METHODS = {
     'online': sort_online,
 }
 
+def get_sort_key(sort):
+    """
+    Return the key function sorting the contacts like the sort methods
+    (e.g. 'jid:show') applied one after the other, in a single pass
+    """
+    return chain_sort_key(sort, SORTING_METHODS, sort_name)
+
 
 ######################## Roster Groups sorting ##########################
 
@@ -88,3 +95,50 @@ GROUP_SORTING_METHODS = {
         'sname': sort_group_sname,
 }
 
+def get_group_sort_key(sort):
+    """
+    Return the key function sorting the groups like the sort methods
+    applied one after the other, in a single pass
+    """
+    return chain_sort_key(sort, GROUP_SORTING_METHODS,
+                          lambda group: group.name.lower() if group.name else '')
+
+
+############################## Sort keys ################################
+
+class ReverseKey(object):
+    """
+    Wrap a sort key to invert its order
+    """
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+def chain_sort_key(sort, methods, base_method):
+    """
+    Build a key function equivalent to sorting with base_method, then
+    with each method of the sort string (stable sorts), the last one
+    being the most significant, 'reverse' inverting the order obtained
+    so far.
+    """
+    key_methods = []
+    reverse = False
+    for sorting in reversed(sort.split(':')):
+        if sorting == 'reverse':
+            reverse = not reverse
+        elif sorting in methods:
+            key_methods.append((methods[sorting], reverse))
+    key_methods.append((base_method, reverse))
+
+    def key(item):
+        return tuple(ReverseKey(method(item)) if reverse else method(item)
+                        for method, reverse in key_methods)
+    return key
+
@@ -0,0 +1,91 @@
+"""
+Defines the StringPool class, and string_pool, the pool shared by the
+whole process, used to keep a single copy of the strings repeated in many
+objects: the nicks of the messages and of the logs, the nick, affiliation,
+role and show of the users of the rooms, and the bare JIDs and names of
+the roster contacts.
+
+A weak-valued mapping would drop the strings nothing uses anymore by
+itself, but a str can not be weakly referenced.  So the pool holds
+strong references instead, and is trimmed from time to time: the strings
+only referenced by the pool (as told by sys.getrefcount) are dropped.
+This is done when the pool has doubled in size since the previous trim,
+which keeps the cost of interning constant on average.
+"""
+
+import sys
+
+# No trim is done until the pool holds that many strings
+MIN_TRIM_SIZE = 1024
+
+# Number of references to a string when it is only in the pool, during a
+# trim: the key and the value in the pool, the loop variable, and the
+# argument of sys.getrefcount
+POOL_REFS = 4
+
+class StringPool(object):
+    """
+    A pool of shared strings, with statistics about its use
+    """
+    def __init__(self):
+        # string -> the same string
+        self.strings = {}
+        # the pool is trimmed when it holds that many strings
+        self.trim_size = MIN_TRIM_SIZE
+        # number of strings replaced by the copy in the pool, and the
+        # number of bytes those copies saved
+        self.hits = 0
+        self.saved = 0
+        # number of strings added to the pool
+        self.misses = 0
+        # number of trims, and the number of strings they dropped
+        self.trims = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, string):
+        """
+        Return the copy of string in the pool, adding it if needed.
+        Anything but a non-empty string is returned as is.
+        """
+        if not string or not isinstance(string, str):
+            return string
+        pooled = self.strings.get(string)
+        if pooled is None:
+            self.strings[string] = string
+            self.misses += 1
+            if len(self.strings) >= self.trim_size:
+                self.trim()
+            return string
+        if pooled is not string:
+            self.hits += 1
+            self.saved += sys.getsizeof(string)
+        return pooled
+
+    def trim(self):
+        """
+        Drop the strings that are only referenced by the pool
+        """
+        unused = [string for string in self.strings
+                      if sys.getrefcount(string) <= POOL_REFS]
+        for string in unused:
+            del self.strings[string]
+        self.trims += 1
+        self.dropped += len(unused)
+        self.trim_size = max(MIN_TRIM_SIZE, 2 * len(self.strings))
+
+    def get_stats(self):
+        """
+        Get the state of the pool, as a dict
+        """
+        return {'strings': len(self.strings),
+                'size': sum(map(sys.getsizeof, self.strings)),
+                'hits': self.hits,
+                'saved': self.saved,
+                'misses': self.misses,
+                'trims': self.trims,
+                'dropped': self.dropped}
+
+string_pool = StringPool()
@@ -9,4 +9,5 @@ from . xmltab import XMLTab
 from . listtab import ListTab
 from . muclisttab import MucListTab
 from . adhoc_commands_list import AdhocCommandsListTab
+from . searchtab import SearchTab
 from . data_forms import DataFormsTab
@@ -19,7 +19,6 @@ import logging
 log = logging.getLogger(__name__)
 
 import singleton
-import string
 import time
 import weakref
 from datetime import datetime, timedelta
@@ -101,6 +100,21 @@ class Tab(object):
         self.commands = {}      # and their own commands
 
 
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        """
+        Rename the tab, updating the index of the tabs by name of the core
+        """
+        old_name = getattr(self, '_name', None)
+        self._name = value
+        if (old_name is not None and old_name != value and
+                Tab.tab_core is not None):
+            Tab.tab_core.on_tab_renamed(self, old_name)
+
     @property
     def size(self):
         if not Tab.size_manager:
@@ -520,20 +534,18 @@ class ChatTab(Tab):
         """
         Complete the input with words recently said
         """
-        # build the list of the recent words
-        char_we_dont_want = string.punctuation+' ’„“”…«»'
-        words = list()
-        for msg in self._text_buffer.messages[:-40:-1]:
-            if not msg:
-                continue
-            txt = xhtml.clean_text(msg.txt)
-            for char in char_we_dont_want:
-                txt = txt.replace(char, ' ')
-            for word in txt.split():
-                if len(word) >= 4 and word not in words:
-                    words.append(word)
-        words.extend([word for word in config.get('words').split(':') if word])
-        self.input.auto_completion(words, ' ', quotify=False)
+        recent_words = self._text_buffer.recent_words
+        words = [word for word in config.get('words').split(':') if word]
+        def get_completions(prefix):
+            hits = []
+            if recent_words is not None:
+                hits = recent_words.get_completions(prefix)
+            prefix = prefix.lower()
+            hits.extend(word for word in words
+                            if word.lower().startswith(prefix)
+                                and word not in hits)
+            return hits
+        self.input.auto_completion(get_completions, ' ', quotify=False)
 
     def on_enter(self):
         txt = self.input.key_enter()
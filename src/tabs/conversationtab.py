@@ -249,8 +249,7 @@ class ConversationTab(OneToOneTab):
 
         self.text_win.resize(self.height - 2 - bar_height - info_win_height
                                 - tab_win_height,
-                             self.width, bar_height, 0)
-        self.text_win.rebuild_everything(self._text_buffer)
+                             self.width, bar_height, 0, room=self._text_buffer)
         if display_bar:
             self.upper_bar.resize(1, self.width, 0, 0)
         self.info_header.resize(1, self.width,
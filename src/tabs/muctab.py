@@ -12,7 +12,10 @@ from gettext import gettext as _
 import logging
 log = logging.getLogger(__name__)
 
+import bisect
+import collections
 import curses
+import itertools
 import os
 import random
 import re
@@ -30,6 +33,7 @@ import xhtml
 from common import safeJID
 from config import config
 from decorators import refresh_wrapper, command_args_parser
+from line_table import SEPARATOR
 from logger import logger
 from roster import roster
 from theming import get_theme, dump_tuple
@@ -62,7 +66,21 @@ class MucTab(ChatTab):
             self._state = 'disconnected'
         self.own_nick = nick
         self.name = jid
-        self.users = []
+        # The users, sorted by role and nick, along with their sort keys
+        # and an index by nick
+        self._users = []
+        self.users_keys = []
+        self.users_by_nick = {}
+        # The (lowercased nick, nick) of the users, sorted, used to find
+        # the nicks starting with a prefix when completing
+        self.completion_keys = []
+        # The presences of the occupants received before ours when joining
+        # the room: nick -> (presence, affiliation, show, status, role, jid)
+        self.joining_presences = collections.OrderedDict()
+        # The compiled regex matching the highlights, and the nick it was
+        # built for.  Reset when the highlight_on option changes
+        self.highlight_regex = None
+        self.highlight_nick = None
         self.privates = [] # private conversations
         self.topic = ''
         self.topic_from = ''
@@ -519,7 +537,7 @@ class MucTab(ChatTab):
         if args is None:
             return self.core.command_help('version')
         nick = args[0]
-        if nick in [user.nick for user in self.users]:
+        if nick in self.users_by_nick:
             jid = safeJID(self.name).bare
             jid = safeJID(jid + '/' + nick)
         else:
@@ -590,6 +608,9 @@ class MucTab(ChatTab):
             if self == self.core.current_tab():
                 self.refresh()
             self.core.doupdate()
+        else:
+            # leaving while the join is in progress
+            self.joining_presences.clear()
 
     @command_args_parser.raw
     def command_close(self, msg):
@@ -736,7 +757,7 @@ class MucTab(ChatTab):
             msg = ''
         nick = args[0]
 
-        if nick in [user.nick for user in self.users]:
+        if nick in self.users_by_nick:
             res = muc.set_user_affiliation(self.core.xmpp, self.name,
                                            'outcast', nick=nick,
                                            callback=callback, reason=msg)
@@ -798,7 +819,7 @@ class MucTab(ChatTab):
             return self.core.information(_('The affiliation must be one of ' + ', '.join(valid_affiliations)),
                                          _('Error'))
 
-        if nick in [user.nick for user in self.users]:
+        if nick in self.users_by_nick:
             res = muc.set_user_affiliation(self.core.xmpp, self.name,
                                            affiliation, nick=nick,
                                            callback=callback)
@@ -930,8 +951,7 @@ class MucTab(ChatTab):
 
         self.text_win.resize(self.height - 3 - info_win_height
                                 - tab_win_height,
-                             text_width, 1, 0)
-        self.text_win.rebuild_everything(self._text_buffer)
+                             text_width, 1, 0, room=self._text_buffer)
         self.info_header.resize(1, self.width,
                                 self.height - 2 - info_win_height
                                     - tab_win_height,
@@ -980,11 +1000,6 @@ class MucTab(ChatTab):
 
         # If we are not completing a command or a command argument,
         # complete a nick
-        compare_users = lambda x: x.last_talked
-        word_list = []
-        for user in sorted(self.users, key=compare_users, reverse=True):
-            if user.nick != self.own_nick:
-                word_list.append(user.nick)
         after = config.get('after_completion') + ' '
         input_pos = self.input.pos
         if ' ' not in self.input.get_text()[:input_pos] or (
@@ -997,7 +1012,8 @@ class MucTab(ChatTab):
                 add_after = ''
             else:
                 add_after = ' '
-        self.input.auto_completion(word_list, add_after, quotify=False)
+        self.input.auto_completion(self.get_nick_completions, add_after,
+                                   quotify=False)
         empty_after = self.input.get_text() == ''
         empty_after = empty_after or (self.input.get_text().startswith('/')
                                       and not
@@ -1029,7 +1045,7 @@ class MucTab(ChatTab):
 
     def on_gain_focus(self):
         self.state = 'current'
-        if (self.text_win.built_lines and self.text_win.built_lines[-1] is None
+        if (self.text_win.built_lines and self.text_win.built_lines[-1] == SEPARATOR
                 and not config.get('show_useless_separator')):
             self.text_win.remove_line_separator()
         curses.curs_set(1)
@@ -1076,20 +1092,20 @@ class MucTab(ChatTab):
         role = presence['muc']['role']
         jid = presence['muc']['jid']
         typ = presence['type']
-        deterministic = config.get_by_tabname('deterministic_nick_colors', self.name)
-        color = self.search_for_color(from_nick)
         if not self.joined:     # user in the room BEFORE us.
             # ignore redondant presence message, see bug #1509
-            if (from_nick not in [user.nick for user in self.users]
-                    and typ != "unavailable"):
-                new_user = User(from_nick, affiliation, show,
-                                status, role, jid, deterministic, color)
-                self.users.append(new_user)
-                self.core.events.trigger('muc_join', presence, self)
+            if (from_nick not in self.joining_presences
+                    and typ != "unavailable"
+                    and not self.get_user_by_name(from_nick)):
+                # The occupants are only added to the user list once our
+                # own presence is received, all at once
+                self.joining_presences[from_nick] = (presence, affiliation,
+                                                     show, status, role, jid)
                 if '110' in status_codes or self.own_nick == from_nick:
                     # second part of the condition is a workaround for old
                     # ejabberd or every gateway in the world that just do
                     # not send a 110 status code with the presence
+                    new_user = self.add_joining_occupants(from_nick)
                     self.own_nick = from_nick
                     self.joined = True
                     if self.name in self.core.initial_joins:
@@ -1145,10 +1161,11 @@ class MucTab(ChatTab):
                                      'warn_col': warn_col},
                             typ=0)
                     if self.core.current_tab() is not self:
-                        self.refresh_tab_win()
-                        self.core.current_tab().input.refresh()
-                        self.core.doupdate()
+                        self.core.refresh_later(
+                                self.core.current_tab().refresh_tab_win)
                     self.core.enable_private_tabs(self.name)
+                else:
+                    return
         else:
             change_nick = '303' in status_codes
             kick = '307' in status_codes and typ == 'unavailable'
@@ -1160,7 +1177,7 @@ class MucTab(ChatTab):
             if not user:
                 self.core.events.trigger('muc_join', presence, self)
                 self.on_user_join(from_nick, affiliation, show, status, role,
-                                  jid, color)
+                                  jid, self.search_for_color(from_nick))
             # nick change
             elif change_nick:
                 self.core.events.trigger('muc_nickchange', presence, self)
@@ -1191,11 +1208,10 @@ class MucTab(ChatTab):
                 self.on_user_change_status(user, from_nick, from_room,
                                            affiliation, role, show, status)
         if self.core.current_tab() is self:
-            self.text_win.refresh()
-            self.user_win.refresh(self.users)
-            self.info_header.refresh(self, self.text_win)
-            self.input.refresh()
-            self.core.doupdate()
+            self.core.refresh_later(self.text_win.refresh)
+            self.core.refresh_later(self.user_win.refresh, self.users)
+            self.core.refresh_later(self.info_header.refresh, self,
+                                    self.text_win)
 
     def on_non_member_kicked(self):
         """We have been kicked because the MUC is members-only"""
@@ -1215,6 +1231,32 @@ class MucTab(ChatTab):
             typ=2)
         self.disconnect()
 
+    def add_joining_occupants(self, own_nick):
+        """
+        Add the occupants whose presence was received before ours to the
+        user list, in one pass, and return our own user (the one whose
+        nick is own_nick, i.e. the nick of the presence with the 110
+        status code)
+        """
+        deterministic = config.get_by_tabname('deterministic_nick_colors',
+                                              self.name)
+        new_users = []
+        own_user = None
+        for nick, (presence, affiliation, show, status, role,
+                   jid) in self.joining_presences.items():
+            user = User(nick, affiliation, show, status, role, jid,
+                        deterministic, self.search_for_color(nick))
+            if nick == own_nick:
+                own_user = user
+            new_users.append(user)
+        for user in new_users:
+            self.add_user(user)
+        presences = list(self.joining_presences.values())
+        self.joining_presences.clear()
+        for presence in presences:
+            self.core.events.trigger('muc_join', presence[0], self)
+        return own_user
+
     def on_user_join(self, from_nick, affiliation, show, status, role, jid, color):
         """
         When a new user joins the groupchat
@@ -1222,7 +1264,7 @@ class MucTab(ChatTab):
         deterministic = config.get_by_tabname('deterministic_nick_colors', self.name)
         user = User(from_nick, affiliation,
                     show, status, role, jid, deterministic, color)
-        self.users.append(user)
+        self.add_user(user)
         hide_exit_join = config.get_by_tabname('hide_exit_join',
                                                self.general_jid)
         if hide_exit_join != 0:
@@ -1268,7 +1310,9 @@ class MucTab(ChatTab):
                 deterministic = config.get_by_tabname('deterministic_nick_colors',
                                                       self.name)
                 user.change_color(color, deterministic)
+        self.remove_user(user)
         user.change_nick(new_nick)
+        self.add_user(user)
 
         if config.get_by_tabname('display_user_color_in_join_part',
                                  self.general_jid):
@@ -1288,7 +1332,7 @@ class MucTab(ChatTab):
         """
         When someone is banned from a muc
         """
-        self.users.remove(user)
+        self.remove_user(user)
         by = presence.find('{%s}x/{%s}item/{%s}actor' %
                             (NS_MUC_USER, NS_MUC_USER, NS_MUC_USER))
         reason = presence.find('{%s}x/{%s}item/{%s}reason' %
@@ -1356,7 +1400,7 @@ class MucTab(ChatTab):
         """
         When someone is kicked from a muc
         """
-        self.users.remove(user)
+        self.remove_user(user)
         actor_elem = presence.find('{%s}x/{%s}item/{%s}actor' %
                                      (NS_MUC_USER, NS_MUC_USER, NS_MUC_USER))
         reason = presence.find('{%s}x/{%s}item/{%s}reason' %
@@ -1424,7 +1468,7 @@ class MucTab(ChatTab):
         """
         When an user leaves a groupchat
         """
-        self.users.remove(user)
+        self.remove_user(user)
         if self.own_nick == user.nick:
             # We are now out of the room.
             # Happens with some buggy (? not sure) servers
@@ -1535,7 +1579,12 @@ class MucTab(ChatTab):
                                                       (from_room, from_nick),
                                                     msg)
         # finally, effectively change the user status
-        user.update(affiliation, show, status, role)
+        if role != user.role:
+            self.remove_user(user)
+            user.update(affiliation, show, status, role)
+            self.add_user(user)
+        else:
+            user.update(affiliation, show, status, role)
 
     def disconnect(self):
         """
@@ -1543,6 +1592,7 @@ class MucTab(ChatTab):
         we can know if we can join it, send messages to it, etc
         """
         self.users = []
+        self.joining_presences.clear()
         if self is not self.core.current_tab():
             self.state = 'disconnected'
         self.joined = False
@@ -1569,21 +1619,10 @@ class MucTab(ChatTab):
         """
         highlighted = False
         if not time and nickname and nickname != self.own_nick and self.joined:
-
-            if re.search(r'\b' + self.own_nick.lower() + r'\b', txt.lower()):
+            if self.get_highlight_regex().search(txt):
                 if self.state != 'current':
                     self.state = 'highlight'
                 highlighted = True
-            else:
-                highlight_words = config.get_by_tabname('highlight_on',
-                                                        self.general_jid)
-                highlight_words = highlight_words.split(':')
-                for word in highlight_words:
-                    if word and word.lower() in txt.lower():
-                        if self.state != 'current':
-                            self.state = 'highlight'
-                        highlighted = True
-                        break
         if highlighted:
             beep_on = config.get('beep_on').split()
             if 'highlight' in beep_on and 'message' not in beep_on:
@@ -1591,14 +1630,94 @@ class MucTab(ChatTab):
                     curses.beep()
         return highlighted
 
+    def get_highlight_regex(self):
+        """
+        Return the regex matching our own nick as a whole word, or any of
+        the words of highlight_on, compiled only when one of them changed
+        """
+        if self.highlight_regex is None or self.highlight_nick != self.own_nick:
+            words = config.get_by_tabname('highlight_on', self.general_jid)
+            patterns = [re.escape(word) for word in words.split(':') if word]
+            if self.own_nick:
+                patterns.insert(0, r'(?<!\w)%s(?!\w)' %
+                                   re.escape(self.own_nick))
+            if not patterns:
+                patterns = [r'(?!)'] # never matches
+            self.highlight_regex = re.compile('|'.join(patterns),
+                                              re.IGNORECASE)
+            self.highlight_nick = self.own_nick
+        return self.highlight_regex
+
+    @property
+    def users(self):
+        """
+        The users in the room, sorted by role and nick
+        """
+        return self._users
+
+    @users.setter
+    def users(self, users):
+        self._users = sorted(users, key=User.sort_key)
+        self.users_keys = [user.sort_key() for user in self._users]
+        self.users_by_nick = {user.nick: user for user in self._users}
+        self.completion_keys = sorted((user.nick.lower(), user.nick)
+                                          for user in self._users)
+
+    def add_user(self, user):
+        """
+        Insert an user in the user list, at its place
+        """
+        key = user.sort_key()
+        index = bisect.bisect_right(self.users_keys, key)
+        self.users_keys.insert(index, key)
+        self._users.insert(index, user)
+        if user.nick not in self.users_by_nick:
+            bisect.insort(self.completion_keys, (user.nick.lower(), user.nick))
+        self.users_by_nick[user.nick] = user
+
+    def remove_user(self, user):
+        """
+        Remove an user from the user list, before it is dropped or its
+        nick or role is changed
+        """
+        index = bisect.bisect_left(self.users_keys, user.sort_key())
+        while index < len(self._users) and self._users[index] is not user:
+            index += 1
+        if index == len(self._users):
+            # the user has been changed without being removed first
+            index = next(i for i, other in enumerate(self._users)
+                            if other is user)
+        del self.users_keys[index]
+        del self._users[index]
+        if self.users_by_nick.get(user.nick) is user:
+            del self.users_by_nick[user.nick]
+            key = (user.nick.lower(), user.nick)
+            index = bisect.bisect_left(self.completion_keys, key)
+            if (index < len(self.completion_keys) and
+                    self.completion_keys[index] == key):
+                del self.completion_keys[index]
+
+    def get_nick_completions(self, prefix):
+        """
+        Return the nicks (except ours) starting with prefix (case
+        insensitive), the ones who talked most recently first
+        """
+        prefix = prefix.lower()
+        index = bisect.bisect_left(self.completion_keys, (prefix,))
+        hits = []
+        for key, nick in itertools.islice(self.completion_keys, index, None):
+            if not key.startswith(prefix):
+                break
+            if nick != self.own_nick:
+                hits.append(self.users_by_nick[nick])
+        hits.sort(key=lambda user: user.last_talked, reverse=True)
+        return [user.nick for user in hits]
+
     def get_user_by_name(self, nick):
         """
         Gets the user associated with the given nick, or None if not found
         """
-        for user in self.users:
-            if user.nick == nick:
-                return user
-        return None
+        return self.users_by_nick.get(nick)
 
     def add_message(self, txt, time=None, nickname=None, **kwargs):
         """
@@ -1691,7 +1810,6 @@ class MucTab(ChatTab):
             return color
         nick_color_aliases = config.get_by_tabname('nick_color_aliases', self.name)
         if nick_color_aliases:
-            nick_alias = re.sub('^_*', '', nick)
-            nick_alias = re.sub('_*$', '', nick_alias)
+            nick_alias = nick.strip('_')
             color = config.get_by_tabname(nick_alias, 'muc_colors')
         return color
@@ -232,8 +232,7 @@ class PrivateTab(OneToOneTab):
             tab_win_height = Tab.tab_win_height()
 
         self.text_win.resize(self.height - 2 - info_win_height - tab_win_height,
-                             self.width, 0, 0)
-        self.text_win.rebuild_everything(self._text_buffer)
+                             self.width, 0, 0, room=self._text_buffer)
         self.info_header.resize(1, self.width,
                                 self.height - 2 - info_win_height
                                     - tab_win_height,
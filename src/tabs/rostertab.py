@@ -12,7 +12,6 @@ log = logging.getLogger(__name__)
 
 import base64
 import curses
-import difflib
 import os
 import ssl
 from os import getenv, path
@@ -1190,13 +1189,13 @@ class RosterInfoTab(Tab):
         return True
 
     def set_roster_filter_slow(self, txt):
-        roster.contact_filter = (jid_and_name_match_slow, txt)
+        roster.contact_filter = (roster.search_index.search_fuzzy, txt)
         roster.modified()
         self.refresh()
         return False
 
     def set_roster_filter(self, txt):
-        roster.contact_filter = (jid_and_name_match, txt)
+        roster.contact_filter = (roster.search_index.search, txt)
         roster.modified()
         self.refresh()
         return False
@@ -1211,45 +1210,3 @@ class RosterInfoTab(Tab):
 
     def on_close(self):
         return
-
-def diffmatch(search, string):
-    """
-    Use difflib and a loop to check if search_pattern can
-    be 'almost' found INSIDE a string.
-    'almost' being defined by difflib
-    """
-    if len(search) > len(string):
-        return False
-    l = len(search)
-    ratio = 0.7
-    for i in range(len(string) - l + 1):
-        if difflib.SequenceMatcher(None, search, string[i:i+l]).ratio() >= ratio:
-            return True
-    return False
-
-def jid_and_name_match(contact, txt):
-    """
-    Match jid with text precisely
-    """
-    if not txt:
-        return True
-    txt = txt.lower()
-    if txt in safeJID(contact.bare_jid).bare.lower():
-        return True
-    if txt in contact.name.lower():
-        return True
-    return False
-
-def jid_and_name_match_slow(contact, txt):
-    """
-    A function used to know if a contact in the roster should
-    be shown in the roster
-    """
-    if not txt:
-        return True             # Everything matches when search is empty
-    user = safeJID(contact.bare_jid).bare
-    if diffmatch(txt, user):
-        return True
-    if contact.name and diffmatch(txt, contact.name):
-        return True
-    return False
@@ -0,0 +1,95 @@
+"""
+A SearchTab lists the results of a full-text search in the logs (see
+the /search command and the log_search module).
+
+Selecting a result jumps to the message in the tab of its conversation,
+if it is still in memory, or displays it, along with the messages that
+follow it in the logs, in the information buffer.
+"""
+from gettext import gettext as _
+
+import logging
+log = logging.getLogger(__name__)
+
+from datetime import datetime
+
+from . import ListTab, ChatTab
+
+from common import get_local_time
+from logger import logger
+
+class SearchTab(ListTab):
+    """
+    A tab listing the messages matching a query in the logs
+    """
+    plugin_commands = {}
+    plugin_keys = {}
+
+    def __init__(self, query):
+        ListTab.__init__(self, 'Search: %s' % query,
+                         "“Enter”: jump to the message.",
+                         _('Search results for “%s” (Loading)') % query,
+                         (('date', 0), ('room', 1), ('nick', 2),
+                          ('message', 3)))
+        self.query = query
+        self.key_func['^M'] = self.jump_to_selected
+
+    def get_columns_sizes(self):
+        return {'date': 20,
+                'room': int((self.width - 20) * 2 / 8),
+                'nick': int((self.width - 20) / 8),
+                'message': self.width - 20 - int((self.width - 20) * 2 / 8)
+                - int((self.width - 20) / 8)}
+
+    def on_results_received(self, results, error):
+        """
+        Callback called with the result of SearchIndex.search()
+        """
+        if self not in self.core.tabs: # closed before the search ended
+            return
+        if error:
+            self.set_error(_('Invalid query'), '', error)
+            return
+        lines = []
+        for result in results:
+            time = get_local_time(datetime.utcfromtimestamp(result.time))
+            lines.append((time.strftime('%Y-%m-%d %H:%M:%S'),
+                          result.room.replace('\\', '/'),
+                          result.nick,
+                          result.txt.replace('\n', ' '),
+                          result.room, time))
+        self.listview.set_lines(lines)
+        self.info_header.message = _('Search results for “%s” (%s)') % (
+                self.query, len(lines))
+        if self.core.current_tab() is self:
+            self.refresh()
+        else:
+            self.state = 'highlight'
+            self.refresh_tab_win()
+        self.core.doupdate()
+
+    def jump_to_selected(self):
+        row = self.listview.get_selected_row()
+        if not row:
+            return
+        name, nick, log_name, time = row[1], row[2], row[4], row[5]
+        tab = self.core.get_tab_by_name(name, ChatTab)
+        if tab:
+            for message in reversed(tab._text_buffer.messages):
+                if (message.time.replace(microsecond=0) == time and
+                        (message.nickname or '') == nick):
+                    tab.text_win.scroll_to_message(message)
+                    self.core.focus_tab_named(tab.name)
+                    return
+        messages = logger.get_logs(log_name, 5, since=time)
+        if not messages:
+            self.core.information(_('The message is not in the logs '
+                                    'anymore'), _('Error'))
+            return
+        lines = [_('Messages in %s:') % name]
+        lines.extend('%s %s%s' % (message['time'].strftime('%Y-%m-%d %H:%M:%S'),
+                                  '%s> ' % message['nickname']
+                                    if message.get('nickname') else '',
+                                  message['txt'])
+                     for message in messages)
+        self.core.information('\n'.join(lines), _('Info'))
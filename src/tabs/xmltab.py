@@ -63,7 +63,7 @@ class XMLTab(Tab):
         self.filters = []
 
         self.core_buffer = self.core.xml_buffer
-        self.filtered_buffer = text_buffer.TextBuffer()
+        self.filtered_buffer = text_buffer.TextBuffer(words_nb_limit=0)
 
         self.info_header = windows.XMLInfoWin()
         self.text_win = windows.XMLTextWin()
@@ -313,8 +313,7 @@ class XMLTab(Tab):
             tab_win_height = Tab.tab_win_height()
 
         self.text_win.resize(self.height - info_win_size - tab_win_height - 2,
-                             self.width, 0, 0)
-        self.text_win.rebuild_everything(self.core.xml_buffer)
+                             self.width, 0, 0, room=self.core.xml_buffer)
         self.info_header.resize(1, self.width,
                                 self.height - 2 - info_win_size
                                     - tab_win_height,
@@ -2,7 +2,7 @@
 Define the TextBuffer class
 
 A text buffer contains a list of intermediate representations of messages
-(not xml stanzas, but neither the Lines used in windows.py.
+(not xml stanzas, but neither the lines built by the text windows).
 
 Each text buffer can be linked to multiple windows, that will be rendered
 independantly by their TextWins.
@@ -11,68 +11,193 @@ independantly by their TextWins.
 import logging
 log = logging.getLogger(__name__)
 
-import collections
-
 from datetime import datetime
+from common import RingBuffer, get_size
 from config import config
+from recent_words import RecentWords
+from string_pool import string_pool
 from theming import get_theme, dump_tuple
 
 message_fields = ('txt nick_color time str_time nickname user identifier'
                   ' highlight me old_message revisions jid ack')
-Message = collections.namedtuple('Message', message_fields)
 
-class CorrectionError(Exception):
-    pass
+# Bits of Message.flags
+HIGHLIGHT = 1
+ME = 2
+ACK = 4
+# The time of the message is written with its date (e.g. in the history),
+# or is not written at all
+LONG_TIME = 8
+NO_TIME = 16
 
-def other_elems(self):
-    "Helper for the repr_message function"
-    acc = ['Message(']
-    fields = message_fields.split()
-    fields.remove('old_message')
-    for field in fields:
-        acc.append('%s=%s' % (field, repr(getattr(self, field))))
-    return ', '.join(acc) + ', old_message='
+TIME_FORMATS = {0: '%H:%M:%S', LONG_TIME: '%Y-%m-%d %H:%M:%S', NO_TIME: ''}
+TIME_WIDTHS = {0: 8, LONG_TIME: 19, NO_TIME: 0}
 
-def repr_message(self):
+# (time, time format) -> the formatted time (see Message.str_time), so that
+# drawing a message does not format its time again. Emptied when full.
+str_times = {}
+STR_TIMES_LIMIT = 4096
+
+class Message(object):
     """
-    repr() for the Message class, for debug purposes, since the default
-    repr() is recursive, so it can stack overflow given too many revisions
-    of a message
+    A message of a TextBuffer. The booleans and the format of the time
+    are kept in a single int, and str_time is only formatted when it is
+    needed (and then cached in str_times), so that a message is much
+    smaller than a namedtuple of all its fields.
+
+    A message is never modified once it is in a TextBuffer: a new one
+    replaces it (see _replace), so that the windows know it changed.
     """
-    init = other_elems(self)
-    acc = [init]
-    next_message = self.old_message
-    rev = 1
-    while next_message:
-        acc.append(other_elems(next_message))
-        next_message = next_message.old_message
-        rev += 1
-    acc.append('None')
-    while rev:
-        acc.append(')')
-        rev -= 1
-    return ''.join(acc)
-
-Message.__repr__ = repr_message
-Message.__str__ = repr_message
+    __slots__ = ('txt', 'nick_color', 'time', 'nickname', 'user',
+                 'identifier', 'old_message', 'revisions', 'jid', 'flags')
+
+    def __init__(self, txt, nick_color, time, nickname, user, identifier,
+                 highlight=False, me=False, old_message=None, revisions=0,
+                 jid=None, ack=False, time_format=0):
+        self.txt = txt
+        self.nick_color = nick_color
+        self.time = time
+        self.nickname = nickname
+        self.user = user
+        self.identifier = identifier
+        self.old_message = old_message
+        self.revisions = revisions
+        self.jid = jid
+        self.flags = ((HIGHLIGHT if highlight else 0) | (ME if me else 0) |
+                      (ACK if ack else 0) | time_format)
+
+    @property
+    def highlight(self):
+        return bool(self.flags & HIGHLIGHT)
+
+    @property
+    def me(self):
+        return bool(self.flags & ME)
+
+    @property
+    def ack(self):
+        return bool(self.flags & ACK)
+
+    @property
+    def time_format(self):
+        "LONG_TIME, NO_TIME, or 0 for the time alone"
+        return self.flags & (LONG_TIME | NO_TIME)
+
+    @property
+    def str_time(self):
+        "The time as it is written before the message"
+        time_format = self.time_format
+        if time_format == NO_TIME:
+            return ''
+        key = (self.time, time_format)
+        str_time = str_times.get(key)
+        if str_time is None:
+            str_time = self.time.strftime(TIME_FORMATS[time_format])
+            if len(str_times) >= STR_TIMES_LIMIT:
+                str_times.clear()
+            str_times[key] = str_time
+        return str_time
+
+    @property
+    def time_width(self):
+        "len(self.str_time), without formatting it"
+        return TIME_WIDTHS[self.time_format]
+
+    def _replace(self, **changes):
+        """
+        Return a copy of the message, with the given fields changed (like
+        the _replace of a namedtuple)
+        """
+        fields = {'txt': self.txt, 'nick_color': self.nick_color,
+                  'time': self.time, 'nickname': self.nickname,
+                  'user': self.user, 'identifier': self.identifier,
+                  'highlight': self.highlight, 'me': self.me,
+                  'old_message': self.old_message,
+                  'revisions': self.revisions, 'jid': self.jid,
+                  'ack': self.ack, 'time_format': self.time_format}
+        fields.update(changes)
+        return Message(**fields)
+
+    def __repr__(self):
+        """
+        repr() for debug purposes. The previous revisions are walked
+        without recursion, since there can be many of them.
+        """
+        acc = []
+        message = self
+        while message:
+            acc.append('Message(%s, old_message=' % ', '.join(
+                '%s=%r' % (field, getattr(message, field))
+                for field in message_fields.split()
+                if field != 'old_message'))
+            message = message.old_message
+        return ''.join(acc) + 'None' + ')' * len(acc)
+
+    __str__ = __repr__
+
+class CorrectionError(Exception):
+    pass
 
 class TextBuffer(object):
     """
     This class just keep trace of messages, in a list with various
     informations and attributes.
     """
-    def __init__(self, messages_nb_limit=None):
+    def __init__(self, messages_nb_limit=None, words_nb_limit=None):
 
         if messages_nb_limit is None:
             messages_nb_limit = config.get('max_messages_in_memory')
         self.messages_nb_limit = messages_nb_limit
-        # Message objects
-        self.messages = []
+        if words_nb_limit is None:
+            words_nb_limit = config.get('max_recent_words')
+        # The words recently said, for the completion, or None if they
+        # are not kept
+        if words_nb_limit > 0:
+            self.recent_words = RecentWords(words_nb_limit)
+        else:
+            self.recent_words = None
+        # Message objects, the oldest ones are dropped when the limit
+        # is reached
+        self._messages = RingBuffer(maxlen=messages_nb_limit)
+        # Number of messages dropped from the start of self.messages, so
+        # that the message number n is at self.messages[n - nb_dropped]
+        self.nb_dropped = 0
+        # identifier -> number of the last message with that identifier
+        self.identifiers = {}
         # we keep track of one or more windows
         # so we can pass the new messages to them, as they are added, so
         # they (the windows) can build the lines from the new message
         self.windows = []
 
+    @property
+    def messages(self):
+        return self._messages
+
+    @messages.setter
+    def messages(self, messages):
+        self._messages = RingBuffer(messages, maxlen=self.messages_nb_limit)
+        self.nb_dropped = 0
+        self.identifiers = {msg.identifier: i
+                                for i, msg in enumerate(self._messages)
+                                if msg.identifier is not None}
+        if self.recent_words is not None:
+            self.recent_words.clear()
+            for msg in self._messages:
+                self.recent_words.add_message(msg.txt)
+
+    def get_size(self, seen):
+        """
+        Approximate number of bytes used by the messages and their
+        previous revisions (see common.get_size)
+        """
+        size = get_size((self._messages,), seen)
+        for msg in self._messages:
+            while msg is not None:
+                size += get_size((msg, msg.txt, msg.time, msg.nickname,
+                                  msg.identifier, msg.nick_color), seen)
+                msg = msg.old_message
+        return size
+
     def add_window(self, win):
         self.windows.append(win)
 
@@ -99,18 +224,18 @@ class TextBuffer(object):
         if history:
             txt = txt.replace('\x19o', '\x19o\x19%s}' %
                                 dump_tuple(get_theme().COLOR_LOG_MSG))
-            str_time = time.strftime("%Y-%m-%d %H:%M:%S")
+            time_format = LONG_TIME
+        elif str_time is None:
+            time_format = 0
         else:
-            if str_time is None:
-                str_time = time.strftime("%H:%M:%S")
-            else:
-                str_time = ''
+            time_format = NO_TIME
 
+        # the same nicks are in many messages, share them
+        nickname = string_pool.intern(nickname)
         msg = Message(
                 txt='%s\x19o'%(txt.replace('\t', '    '),),
                 nick_color=nick_color,
                 time=time,
-                str_time=str_time,
                 nickname=nickname,
                 user=user,
                 identifier=identifier,
@@ -119,7 +244,8 @@ class TextBuffer(object):
                 old_message=old_message,
                 revisions=revisions,
                 jid=jid,
-                ack=ack)
+                ack=ack,
+                time_format=time_format)
         log.debug('Set message %s with %s.', identifier, msg)
         return msg
 
@@ -132,10 +258,18 @@ class TextBuffer(object):
         msg = self.make_message(txt, time, nickname, nick_color, history,
                                 user, identifier, str_time=str_time,
                                 highlight=highlight, jid=jid, ack=ack)
+        if self.messages and len(self.messages) == self.messages.maxlen:
+            # the oldest message is about to be dropped
+            oldest = self.messages[0]
+            if self.identifiers.get(oldest.identifier) == self.nb_dropped:
+                del self.identifiers[oldest.identifier]
+            self.nb_dropped += 1
         self.messages.append(msg)
-
-        while len(self.messages) > self.messages_nb_limit:
-            self.messages.pop(0)
+        if identifier is not None:
+            self.identifiers[identifier] = (self.nb_dropped +
+                                            len(self.messages) - 1)
+        if self.recent_words is not None:
+            self.recent_words.add_message(msg.txt)
 
         ret_val = None
         show_timestamps = config.get('show_timestamps')
@@ -155,11 +289,10 @@ class TextBuffer(object):
         """
         Find a message in the text buffer from its message id
         """
-        for i in range(len(self.messages) -1, -1, -1):
-            msg = self.messages[i]
-            if msg.identifier == old_id:
-                return i
-        return -1
+        number = self.identifiers.get(old_id)
+        if number is None:
+            return -1
+        return number - self.nb_dropped
 
     def ack_message(self, old_id):
         """
@@ -168,10 +301,7 @@ class TextBuffer(object):
         i = self._find_message(old_id)
         if i == -1:
             return
-        msg = self.messages[i]
-        new_msg = list(msg)
-        new_msg[12] = True
-        new_msg = Message(*new_msg)
+        new_msg = self.messages[i]._replace(ack=True)
         self.messages[i] = new_msg
         return new_msg
 
@@ -192,7 +322,7 @@ class TextBuffer(object):
 
         if msg.user and msg.user is not user:
             raise CorrectionError("Different users")
-        elif len(msg.str_time) > 8: # ugly
+        elif msg.time_format == LONG_TIME:
             raise CorrectionError("Delayed message")
         elif not msg.user and (msg.jid is None or jid is None):
             raise CorrectionError('Could not check the '
@@ -211,6 +341,9 @@ class TextBuffer(object):
                                     revisions=msg.revisions + 1,
                                     jid=jid)
         self.messages[i] = message
+        del self.identifiers[old_id]
+        if new_id is not None:
+            self.identifiers[new_id] = i + self.nb_dropped
         log.debug('Replacing message %s with %s.', old_id, new_id)
         return message
 
@@ -362,6 +362,19 @@ theme = Theme()
 # the next time.
 curses_colors_dict = {}
 
+# a dict "color tuple -> curses attr", the results of to_curses_attr, so
+# that they are computed only once for each tuple.  Emptied when the
+# theme is reloaded
+curses_attrs = {}
+
+# True once all the curses color pairs are used (see find_color_pair), so
+# that it is only logged once
+color_pairs_full = False
+
+# a dict "nick -> deterministic color of that nick in the current theme"
+# (see user.get_deterministic_color), emptied when the theme is reloaded
+nick_colors = {}
+
 table_256_to_16 = [
          0,  1,  2,  3,  4,  5,  6,  7,  8,  9, 10, 11, 12, 13, 14, 15,
          0,  4,  4,  4, 12, 12,  2,  6,  4,  4, 12, 12,  2,  2,  6,  4,
@@ -407,6 +420,46 @@ def to_curses_attr(color_tuple):
     Takes a color tuple (as defined at the top of this file) and
     returns a valid curses attr that can be passed directly to attron() or attroff()
     """
+    try:
+        return curses_attrs[color_tuple]
+    except KeyError:
+        attr = make_curses_attr(color_tuple)
+        curses_attrs[color_tuple] = attr
+        return attr
+
+def find_color_pair(colors):
+    """
+    Return the number of the color pair of a (fg, bg) tuple, creating it
+    if needed. Once all the pairs are used, a pair with the same
+    foreground is returned instead, or the default pair 0 if there is
+    none: the pairs are never reassigned, since the attrs already
+    computed still use them.
+    """
+    global color_pairs_full
+    # check if we already used these colors
+    try:
+        return curses_colors_dict[colors]
+    except KeyError:
+        pass
+    pair = len(curses_colors_dict) + 1
+    if pair < curses.COLOR_PAIRS:
+        curses.init_pair(pair, colors[0], colors[1])
+        curses_colors_dict[colors] = pair
+        return pair
+    if not color_pairs_full:
+        color_pairs_full = True
+        log.warning('All the %s color pairs are used, the new colors are '
+                    'replaced by the nearest ones', curses.COLOR_PAIRS)
+    for (fg, _), pair in curses_colors_dict.items():
+        if fg == colors[0]:
+            return pair
+    return 0
+
+def make_curses_attr(color_tuple):
+    """
+    Compute the curses attr of a color tuple, creating its color pair if
+    needed (see to_curses_attr)
+    """
     # extract the color from that tuple
     if len(color_tuple) == 3:
         colors = (color_tuple[0], color_tuple[1])
@@ -424,14 +477,7 @@ def to_curses_attr(color_tuple):
         if colors[1] >= 8:
             colors = (colors[0], colors[1] - 8)
 
-    # check if we already used these colors
-    try:
-        pair = curses_colors_dict[colors]
-    except KeyError:
-        pair = len(curses_colors_dict) + 1
-        curses.init_pair(pair, colors[0], colors[1])
-        curses_colors_dict[colors] = pair
-    curses_pair = curses.color_pair(pair)
+    curses_pair = curses.color_pair(find_color_pair(colors))
     if len(color_tuple) == 3:
         additional_val = color_tuple[2]
         if 'b' in additional_val or bold is True:
@@ -491,6 +537,8 @@ def update_themes_dir(option=None, value=None):
 def reload_theme():
     theme_name = config.get('theme')
     global theme
+    nick_colors.clear()
+    curses_attrs.clear()
     if theme_name == 'default' or not theme_name.strip():
         theme = Theme()
         return
@@ -13,8 +13,12 @@ An user is a MUC participant, not a roster contact (see contact.py)
 from random import choice
 from datetime import timedelta, datetime
 from hashlib import md5
+import zlib
 import xhtml
 
+import theming
+from config import config
+from string_pool import string_pool
 from theming import get_theme
 
 import logging
@@ -28,6 +32,27 @@ ROLE_DICT = {
     'moderator':3
     }
 
+# The number of nicks whose deterministic color is kept
+NICK_COLORS_LIMIT = 4096
+
+def get_deterministic_color(nick):
+    """
+    Return the color of a nick, always the same for a given nick and theme
+    """
+    color = theming.nick_colors.get(nick)
+    if color is None:
+        colors = get_theme().LIST_COLOR_NICKNAMES
+        if config.get('nick_color_hash') == 'crc32':
+            nick_hash = zlib.crc32(nick.encode('utf-8'))
+        else:
+            nick_hash = int.from_bytes(md5(nick.encode('utf-8')).digest(),
+                                       'big')
+        color = colors[nick_hash % len(colors)]
+        if len(theming.nick_colors) >= NICK_COLORS_LIMIT:
+            theming.nick_colors.clear()
+        theming.nick_colors[nick] = color
+    return color
+
 class User(object):
     """
     keep trace of an user in a Room
@@ -47,21 +72,18 @@ class User(object):
         self.chatstate = None
 
     def set_deterministic_color(self):
-        theme = get_theme()
-        mod = len(theme.LIST_COLOR_NICKNAMES)
-        nick_pos = int(md5(self.nick.encode('utf-8')).hexdigest(), 16) % mod
-        self.color = theme.LIST_COLOR_NICKNAMES[nick_pos]
+        self.color = get_deterministic_color(self.nick)
 
     def update(self, affiliation, show, status, role):
-        self.affiliation = affiliation
-        self.show = show
+        self.affiliation = string_pool.intern(affiliation)
+        self.show = string_pool.intern(show)
         self.status = status
         if role not in ROLE_DICT: # avoid unvalid roles
             role = ''
-        self.role = role
+        self.role = string_pool.intern(role)
 
     def change_nick(self, nick):
-        self.nick = nick
+        self.nick = string_pool.intern(nick)
 
     def change_color(self, color_name, deterministic=False):
         color = xhtml.colors.get(color_name)
@@ -92,6 +114,13 @@ class User(object):
             return False
         return True
 
+    def sort_key(self):
+        """
+        Key giving the order of the users in the user list: by role, then
+        by nick
+        """
+        return (-ROLE_DICT[self.role], self.nick.lower())
+
     def __repr__(self):
         return ">%s<" % (self.nick)
 
@@ -10,12 +10,12 @@ A Tab (see the src/tabs module) is composed of multiple Windows
 import logging
 log = logging.getLogger(__name__)
 
-import collections
 import curses
 import string
 from threading import RLock
 
 import core
+import poopt
 import singleton
 from theming import to_curses_attr, read_tuple
 
@@ -28,10 +28,6 @@ format_chars = ['\x0E', '\x0F', '\x10', '\x11', '\x12', '\x13',
 # different colors allowed in the input
 allowed_color_digits = ('0', '1', '2', '3', '4', '5', '6', '7')
 
-# msg is a reference to the corresponding Message tuple. text_start and
-# text_end are the position delimiting the text in this line.
-Line = collections.namedtuple('Line', 'msg start_pos end_pos prepend')
-
 LINES_NB_LIMIT = 4096
 
 class DummyWin(object):
@@ -47,6 +43,10 @@ class DummyWin(object):
 class Win(object):
     _win_core = None
     _tab_win = None
+    # Incremented each time the screen may not show what the windows
+    # drew anymore (another tab was drawn over them, or the screen was
+    # cleared), for the windows that only draw what changed
+    screen_generation = 0
     def __init__(self):
         self._win = None
         self.height, self.width = 0, 0
@@ -99,37 +99,30 @@ class Win(object):
         except:
             self._win.move(0, 0)
 
-    def addstr_colored(self, text, y=None, x=None):
+    def addstr_colored(self, text, y=None, x=None, start=0, end=None):
         """
         Write a string on the window, setting the
         attributes as they are in the string.
         For example:
         \x19bhello → hello in bold
         \x191}Bonj\x192}our → 'Bonj' in red and 'our' in green
-        next_attr_char is the \x19 delimiter
-        attr_char is the char following it, it can be
-        one of 'u', 'b', 'c[0-9]'
+        The attributes are one of 'o', 'u', 'b', or a color (see
+        poopt.parse_runs).  Only text[start:end] is written.
         """
         if y is not None and x is not None:
             self.move(y, x)
-        next_attr_char = text.find(FORMAT_CHAR)
-        while next_attr_char != -1 and text:
-            if next_attr_char + 1 < len(text):
-                attr_char = text[next_attr_char+1].lower()
-            else:
-                attr_char = str()
-            if next_attr_char != 0:
-                self.addstr(text[:next_attr_char])
-            if attr_char == 'o':
+        if end is None:
+            end = len(text)
+        for run_start, run_end, attr in poopt.parse_runs(text, start, end):
+            if attr == 'o':
                 self._win.attrset(0)
-            elif attr_char == 'u':
+            elif attr == 'u':
                 self._win.attron(curses.A_UNDERLINE)
-            elif attr_char == 'b':
+            elif attr == 'b':
                 self._win.attron(curses.A_BOLD)
-            if (attr_char in string.digits or attr_char == '-') and attr_char != '':
-                color_str = text[next_attr_char+1:text.find('}', next_attr_char)]
-                if ',' in color_str:
-                    tup, char = read_tuple(color_str)
+            elif attr and (attr[0] in string.digits or attr[0] == '-'):
+                if ',' in attr:
+                    tup, char = read_tuple(attr)
                     self._win.attron(to_curses_attr(tup))
                     if char:
                         if char == 'o':
@@ -138,13 +131,18 @@ class Win(object):
                             self._win.attron(curses.A_UNDERLINE)
                         elif char == 'b':
                             self._win.attron(curses.A_BOLD)
-                elif color_str:
-                    self._win.attron(to_curses_attr((int(color_str), -1)))
-                text = text[next_attr_char+len(color_str)+2:]
+                else:
+                    self._win.attron(to_curses_attr((int(attr), -1)))
+            if run_end <= run_start:
+                continue
+            # A run at the start of the text is written with addnstr,
+            # without copying it. Otherwise a str can only be written from
+            # its start, and text[run_start:] would copy the whole rest of
+            # the text for each run, so only the run is copied.
+            if run_start == 0:
+                self.addnstr(text, run_end)
             else:
-                text = text[next_attr_char+2:]
-            next_attr_char = text.find(FORMAT_CHAR)
-        self.addstr(text)
+                self.addstr(text[run_start:run_end])
 
     def finish_line(self, color=None):
         """
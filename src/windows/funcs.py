@@ -4,8 +4,9 @@ Standalone functions used by the modules
 
 import string
 
+import poopt
 from config import config
-from . base_wins import FORMAT_CHAR, format_chars
+from . base_wins import format_chars
 
 def find_first_format_char(text, chars=None):
     if chars is None:
@@ -27,30 +28,25 @@ def truncate_nick(nick, size=None):
         return nick[:size]+'…'
     return nick
 
+def update_attrs(attrs, attr):
+    """
+    Update the attributes carried over to the next line with an attribute
+    of a run (see poopt.parse_runs), return them
+    """
+    if attr == 'o':
+        return []
+    if attr == 'u' or attr == 'b':
+        attrs.append(attr)
+    elif attr and (attr[0] in string.digits or attr[0] == '-'):
+        attrs.append(attr + '}')
+    return attrs
+
 def parse_attrs(text, previous=None):
-    next_attr_char = text.find(FORMAT_CHAR)
     if previous:
         attrs = previous
     else:
         attrs = []
-    while next_attr_char != -1 and text:
-        if next_attr_char + 1 < len(text):
-            attr_char = text[next_attr_char+1].lower()
-        else:
-            attr_char = str()
-        if attr_char == 'o':
-            attrs = []
-        elif attr_char == 'u':
-            attrs.append('u')
-        elif attr_char == 'b':
-            attrs.append('b')
-        if attr_char in string.digits and attr_char != '':
-            color_str = text[next_attr_char+1:text.find('}', next_attr_char)]
-            if color_str:
-                attrs.append(color_str + '}')
-            text = text[next_attr_char+len(color_str)+2:]
-        else:
-            text = text[next_attr_char+2:]
-        next_attr_char = text.find(FORMAT_CHAR)
+    for _, _, attr in poopt.parse_runs(text):
+        attrs = update_attrs(attrs, attr)
     return attrs
 
@@ -250,8 +250,10 @@ class Input(Win):
         if add_after is None, we use the value defined in completion
         plus a space, after the completion. If it's a string, we use it after the
         completion (with no additional space)
+        word_list can also be a function returning the matching words for
+        the prefix being completed, in the order they should be proposed
         """
-        if quotify:
+        if quotify and not callable(word_list):
             for i, word in enumerate(word_list[:]):
                 word_list[i] = '"' + word + '"'
         self.normal_completion(word_list, add_after)
@@ -395,12 +397,15 @@ class Input(Win):
                 begin = self.text[space_before_cursor+1:pos]
             else:
                 begin = self.text[:pos]
-            hit_list = []       # list of matching hits
-            for word in word_list:
-                if word.lower().startswith(begin.lower()):
-                    hit_list.append(word)
-                elif word.startswith('"') and word.lower()[1:].startswith(begin.lower()):
-                    hit_list.append(word)
+            if callable(word_list):
+                hit_list = word_list(begin)
+            else:
+                hit_list = []       # list of matching hits
+                for word in word_list:
+                    if word.lower().startswith(begin.lower()):
+                        hit_list.append(word)
+                    elif word.startswith('"') and word.lower()[1:].startswith(begin.lower()):
+                        hit_list.append(word)
             if len(hit_list) == 0:
                 return
             self.hit_list = hit_list
@@ -6,6 +6,7 @@ import logging
 log = logging.getLogger(__name__)
 
 import curses
+from itertools import islice
 
 from . import Win
 
@@ -33,6 +34,10 @@ class UserList(Win):
         self.addstr(y, self.width-2, '++', to_curses_attr(get_theme().COLOR_MORE_INDICATOR))
 
     def refresh(self, users):
+        """
+        users must be already sorted by role and nick, the way MucTab.users
+        is
+        """
         log.debug('Refresh: %s', self.__class__.__name__)
         if config.get('hide_user_list'):
             return # do not refresh if this win is hidden.
@@ -40,16 +45,14 @@ class UserList(Win):
         if config.get('user_list_sort').lower() == 'asc':
             y, x = self._win.getmaxyx()
             y -= 1
-            users = sorted(users)
         else:
             y = 0
-            users = sorted(users)
 
         if len(users) < self.height:
             self.pos = 0
         elif self.pos >= len(users) - self.height and self.pos != 0:
             self.pos = len(users) - self.height
-        for user in users[self.pos:]:
+        for user in islice(users, self.pos, self.pos + self.height):
             self.draw_role_affiliation(y, user)
             self.draw_status_chatstate(y, user)
             self.addstr(y, 2,
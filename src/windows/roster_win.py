@@ -5,6 +5,7 @@ one showing detailed info on the current selection)
 import logging
 log = logging.getLogger(__name__)
 
+import bisect
 from datetime import datetime
 
 from . import Win
@@ -13,9 +14,65 @@ import common
 from config import config
 from contact import Contact, Resource
 from roster import RosterGroup
+from roster_sorting import get_sort_key
 from theming import get_theme, to_curses_attr
 
 
+class RosterGroupView(object):
+    """
+    The contacts of a group, kept sorted for the roster display, along
+    with the rows they take in it (the contact and its resources)
+    """
+    def __init__(self, group, sort_key, show_offline):
+        self.group = group
+        self.sort_key = sort_key
+        self.show_offline = show_offline
+        self.contact_keys = {contact: sort_key(contact)
+                                for contact in group.contacts}
+        # the contacts and their sort keys, sorted
+        self.contacts = sorted(group.contacts, key=self.contact_keys.get)
+        self.keys = [self.contact_keys[contact] for contact in self.contacts]
+        self.contact_rows = {contact: self.build_rows(contact)
+                                for contact in self.contacts}
+        self.rows = None
+
+    def build_rows(self, contact):
+        if not self.show_offline and len(contact) == 0:
+            return [] # ignore offline contacts
+        if contact.folded(self.group.name):
+            return [contact]
+        return [contact] + contact.get_resources()
+
+    def update(self, contact):
+        """
+        Move a modified contact at its new place
+        """
+        if contact in self.contact_keys:
+            key = self.contact_keys[contact]
+            index = bisect.bisect_left(self.keys, key)
+            while self.contacts[index] is not contact:
+                index += 1
+            del self.keys[index]
+            del self.contacts[index]
+        key = self.sort_key(contact)
+        index = bisect.bisect_right(self.keys, key)
+        self.keys.insert(index, key)
+        self.contacts.insert(index, contact)
+        self.contact_keys[contact] = key
+        self.contact_rows[contact] = self.build_rows(contact)
+        self.rows = None
+
+    def get_rows(self):
+        """
+        The rows of all the contacts of the group, in order
+        """
+        if self.rows is None:
+            self.rows = []
+            for contact in self.contacts:
+                self.rows.extend(self.contact_rows[contact])
+        return self.rows
+
+
 class RosterWin(Win):
 
     def __init__(self):
@@ -24,6 +81,10 @@ class RosterWin(Win):
         self.start_pos = 1      # position of the start of the display
         self.selected_row = None
         self.roster_cache = []
+        # group name -> RosterGroupView, updated when only a few
+        # contacts are modified, and the key used to sort their contacts
+        self.group_views = {}
+        self.sort_key = None
 
     @property
     def roster_len(self):
@@ -91,33 +152,46 @@ class RosterWin(Win):
         """
         if not roster.needs_rebuild:
             return
-        log.debug('The roster has changed, rebuilding the cache…')
+        full_rebuild, modified_contacts = roster.pop_modifications()
         # This is a search
         if roster.contact_filter:
+            log.debug('The roster has changed, rebuilding the cache…')
+            self.group_views = {}
             self.roster_cache = []
             sort = config.get('roster_sort', 'jid:show') or 'jid:show'
             for contact in roster.get_contacts_sorted_filtered(sort):
                 self.roster_cache.append(contact)
         else:
             show_offline = config.get('roster_show_offline') or roster.contact_filter
-            sort = config.get('roster_sort') or 'jid:show'
             group_sort = config.get('roster_group_sort') or 'name'
+            if full_rebuild or not self.group_views:
+                log.debug('The roster has changed, rebuilding the cache…')
+                sort = config.get('roster_sort') or 'jid:show'
+                self.sort_key = get_sort_key(sort)
+                self.group_views = {}
+            else:
+                log.debug('%s contacts have changed, updating the cache…',
+                          len(modified_contacts))
+                for jid in modified_contacts:
+                    contact = roster.contacts.get(jid)
+                    if not contact:
+                        continue
+                    for name in contact.groups:
+                        if name in self.group_views:
+                            self.group_views[name].update(contact)
             self.roster_cache = []
             # build the cache
             for group in roster.get_groups(group_sort):
-                contacts_filtered = group.get_contacts(roster.contact_filter)
-                if (not show_offline and group.get_nb_connected_contacts() == 0) or not contacts_filtered:
+                if (not show_offline and group.get_nb_connected_contacts() == 0) or not group:
                     continue    # Ignore empty groups
                 self.roster_cache.append(group)
                 if group.folded:
                     continue # ignore folded groups
-                for contact in group.get_contacts(roster.contact_filter, sort):
-                    if not show_offline and len(contact) == 0:
-                        continue # ignore offline contacts
-                    self.roster_cache.append(contact)
-                    if not contact.folded(group.name):
-                        for resource in contact.get_resources():
-                            self.roster_cache.append(resource)
+                view = self.group_views.get(group.name)
+                if view is None or view.group is not group:
+                    view = RosterGroupView(group, self.sort_key, show_offline)
+                    self.group_views[group.name] = view
+                self.roster_cache.extend(view.get_rows())
         roster.last_built = datetime.now()
         if self.selected_row in self.roster_cache:
             if self.pos < self.roster_len and self.roster_cache[self.pos] != self.selected_row:
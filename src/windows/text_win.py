@@ -6,15 +6,19 @@ Can be locked, scrolled, has a separator, etc…
 import logging
 log = logging.getLogger(__name__)
 
+import collections
 import curses
+from array import array
 from math import ceil, log10
 
 from . import Win
-from . base_wins import FORMAT_CHAR, Line
-from . funcs import truncate_nick, parse_attrs
+from . base_wins import FORMAT_CHAR
+from . funcs import truncate_nick
 
 import poopt
+from common import get_size
 from config import config
+from line_table import LineTable, SEPARATOR, get_prepend_id, prepends
 from theming import to_curses_attr, get_theme, dump_tuple
 
 
@@ -25,13 +29,79 @@ class BaseTextWin(Win):
         Win.__init__(self)
         self.lines_nb_limit = lines_nb_limit
         self.pos = 0
-        self.built_lines = []   # Each new message is built and kept here.
+        # Each new message is built and kept here, the oldest lines are
+        # dropped when the limit is reached.
         # on resize, we rebuild all the messages
+        # A line is a (message number, start, end, prepend id) row, see
+        # the line_table module
+        self.built_lines = LineTable(maxlen=lines_nb_limit)
+        # Number of lines dropped from the start of self.built_lines, so
+        # that the line number n is at self.built_lines[n - nb_dropped]
+        self.nb_dropped = 0
+        # The messages of the built lines, and the number of the first one:
+        # the line (n, start, end, prepend) is in self.messages[n -
+        # messages_dropped]. A message is dropped with its last line.
+        self.messages = collections.deque()
+        self.messages_dropped = 0
+        # message identifier -> [number of its first line, number of lines]
+        self.message_lines = {}
+        # The TextBuffer whose messages are built, and the number (in that
+        # buffer) of the oldest message built: the older ones are only
+        # built when they are needed, e.g. when scrolling up. Once lines
+        # were dropped, it is 0: the older messages are not built anymore,
+        # they would be shown before the ones whose lines were dropped.
+        self.room = None
+        self.first_built = 0
+        # What the current lines depend on (see get_build_key), and the
+        # lines built for the previous key, so that going back to it (for
+        # example when the user list is toggled) does not build them again:
+        # key -> {id(message): (message, array of the lines of build_message)}
+        self.build_key = None
+        self.lines_cache = {}
 
         self.lock = False
+        # (message, lines) built while the window is locked
         self.lock_buffer = []
         self.separator_after = None
 
+    def get_size(self, seen):
+        """
+        Approximate number of bytes used by the built lines, including the
+        cached ones, but not their messages (see common.get_size)
+        """
+        size = get_size((self.built_lines, self.built_lines.rows,
+                         self.messages, self.lines_cache), seen)
+        for lines_by_message in self.lines_cache.values():
+            size += get_size((lines_by_message,), seen)
+            for entry in lines_by_message.values():
+                size += get_size((entry, entry[1]), seen)
+        return size
+
+    def get_message(self, line):
+        "The message of a built line"
+        return self.messages[line[0] - self.messages_dropped]
+
+    def get_message_number(self, message):
+        """
+        The number of a message in self.messages, or None if none of its
+        lines is built
+        """
+        number = self.messages_dropped + len(self.messages)
+        for msg in reversed(self.messages):
+            number -= 1
+            if msg is message:
+                return number
+        return None
+
+    def make_lines(self, message, lines):
+        """
+        Add a message at the end of self.messages, and return its lines
+        (the result of build_message) as rows of the line table
+        """
+        number = self.messages_dropped + len(self.messages)
+        self.messages.append(message)
+        return [(number,) + line for line in lines]
+
     def toggle_lock(self):
         if self.lock:
             self.release_lock()
@@ -43,13 +113,79 @@ class BaseTextWin(Win):
         self.lock = True
 
     def release_lock(self):
-        for line in self.lock_buffer:
-            self.built_lines.append(line)
+        for message, lines in self.lock_buffer:
+            self.append_lines(self.make_lines(message, lines))
+        self.lock_buffer = []
         self.lock = False
 
+    def drop_oldest_line(self):
+        """
+        Drop the first built line, and its message if it was the last
+        line of that message
+        """
+        built_lines = self.built_lines
+        oldest = built_lines.popleft()
+        if oldest != SEPARATOR:
+            identifier = self.get_message(oldest).identifier
+            entry = self.message_lines.get(identifier)
+            if entry and entry[0] == self.nb_dropped:
+                if entry[1] == 1:
+                    del self.message_lines[identifier]
+                else:
+                    entry[0] += 1
+                    entry[1] -= 1
+            if (not built_lines or built_lines[0] == SEPARATOR or
+                    built_lines[0][0] != oldest[0]):
+                while self.messages and self.messages_dropped <= oldest[0]:
+                    self.messages.popleft()
+                    self.messages_dropped += 1
+        self.nb_dropped += 1
+        self.first_built = 0
+
+    def append_lines(self, lines):
+        """
+        Add lines at the end of built_lines, dropping the oldest ones if
+        needed, and keep the index of the lines of each message up to date
+        """
+        built_lines = self.built_lines
+        message_lines = self.message_lines
+        for line in lines:
+            if built_lines and len(built_lines) == built_lines.maxlen:
+                self.drop_oldest_line()
+            built_lines.append(line)
+            if line == SEPARATOR:
+                continue
+            identifier = self.get_message(line).identifier
+            if identifier is None:
+                continue
+            number = self.nb_dropped + len(built_lines) - 1
+            entry = message_lines.get(identifier)
+            if (line[1] == 0 or entry is None
+                    or entry[0] + entry[1] != number):
+                message_lines[identifier] = [number, 1]
+            else:
+                entry[1] += 1
+
+    def replace_lines(self, number, nb, lines):
+        """
+        Replace the nb lines starting at the line number number by lines.
+        The lines that follow them are taken out and added back, so this
+        is cheap for the last messages.
+        """
+        position = number - self.nb_dropped
+        after = []
+        while len(self.built_lines) > position + nb:
+            after.append(self.built_lines.pop())
+        while len(self.built_lines) > position:
+            self.built_lines.pop()
+        after.reverse()
+        self.append_lines(lines)
+        self.append_lines(after)
+
     def scroll_up(self, dist=14):
         pos = self.pos
         self.pos += dist
+        self.build_older(self.pos + 2 * self.height)
         if self.pos + self.height > len(self.built_lines):
             self.pos = len(self.built_lines) - self.height
             if self.pos < 0:
@@ -70,32 +206,43 @@ class BaseTextWin(Win):
         message.
         """
         lines = self.build_message(message, timestamp=timestamp)
+        if not lines:
+            return 0
         if self.lock:
-            self.lock_buffer.extend(lines)
+            self.lock_buffer.append((message, lines))
         else:
-            self.built_lines.extend(lines)
-        if not lines or not lines[0]:
-            return 0
-        if clean:
-            while len(self.built_lines) > self.lines_nb_limit:
-                self.built_lines.pop(0)
+            self.append_lines(self.make_lines(message, lines))
         return len(lines)
 
     def build_message(self, message, timestamp=False):
         """
-        Build a list of lines from a message, without adding it
-        to a list
+        Build the lines of a message, as a list of (start, end, prepend id)
+        tuples, without adding them to the built lines
         """
         pass
 
+    def layout_message(self, message, offset, default_color=None):
+        """
+        Cut the text of a message in lines fitting in the width of the
+        window after offset columns, see build_message
+        """
+        lines = poopt.layout_message(message.txt, self.width-offset-1)
+        # the attributes carried over from the previous lines, if any
+        return [(start, end, get_prepend_id(prepend or default_color or ''))
+                for start, end, prepend in lines]
+
     def refresh(self):
         pass
 
-    def write_text(self, y, x, txt):
+    def write_text(self, y, x, txt, start=0, end=None, prepend=''):
         """
-        write the text of a line.
+        write the text of a line: txt[start:end], after the attributes
+        of prepend.
         """
-        self.addstr_colored(txt, y, x)
+        if prepend:
+            self.addstr_colored(prepend, y, x)
+            y = x = None
+        self.addstr_colored(txt, y, x, start, end)
 
     def write_time(self, time):
         """
@@ -106,13 +253,12 @@ class BaseTextWin(Win):
             self.addstr(' ')
 
     def resize(self, height, width, y, x, room=None):
-        if hasattr(self, 'width'):
-            old_width = self.width
-        else:
-            old_width = None
         self._resize(height, width, y, x)
-        if room and self.width != old_width:
+        if room is not None and (room is not self.room or
+                                 self.get_build_key() != self.build_key):
             self.rebuild_everything(room)
+        else:
+            self.build_older(self.pos + 2 * self.height)
 
         # reposition the scrolling after resize
         # (see #2450)
@@ -122,15 +268,140 @@ class BaseTextWin(Win):
             if self.pos < 0:
                 self.pos = 0
 
+    def get_build_key(self):
+        """
+        Everything the lines built by build_message depend on, besides
+        the messages themselves
+        """
+        return (self.width, config.get('show_timestamps'), get_theme(),
+                config.get('max_nick_length'))
+
+    def get_lines_by_message(self):
+        """
+        Group the built lines by message, for the lines cache.
+        The messages whose first lines were dropped are skipped.
+        """
+        lines_by_message = {}
+        current = None
+        for line in self.built_lines:
+            if line == SEPARATOR:
+                current = None
+            elif current and line[1] and line[0] == number:
+                current[1].extend(line[1:])
+            elif line[1] == 0:
+                number = line[0]
+                current = (self.get_message(line), array('i', line[1:]))
+                lines_by_message[id(current[0])] = current
+            else:
+                current = None
+        return lines_by_message
+
     def rebuild_everything(self, room):
-        self.built_lines = []
+        """
+        Build the lines of room again, after a change of width or of
+        anything the lines depend on.
+        Only the last messages (enough to fill the window and one more
+        screen) are built, the others are built by build_older, when they
+        are needed. The lines already built for the same key are reused.
+        """
+        key = self.get_build_key()
+        lines_cache = {}
+        if key != self.build_key:
+            lines_cache[key] = self.lines_cache.get(key, {})
+        if self.build_key is not None:
+            lines_by_message = self.get_lines_by_message()
+            leftover = self.lines_cache.get(self.build_key, {})
+            if len(leftover) < self.lines_nb_limit:
+                lines_by_message.update(leftover)
+            lines_cache[self.build_key] = lines_by_message
+        self.lines_cache = lines_cache
+        self.build_key = key
+        self.room = room
+        self.built_lines.clear()
+        self.nb_dropped = 0
+        self.messages.clear()
+        self.messages_dropped = 0
+        self.message_lines = {}
+        self.first_built = room.nb_dropped + len(room.messages)
+        self.build_older(self.pos + 2 * self.height)
+
+    def build_older(self, nb_lines):
+        """
+        Build the messages older than the ones already built, until there
+        are at least nb_lines lines (or no older message)
+        """
+        room = self.room
+        nb_lines = min(nb_lines, self.built_lines.maxlen)
+        if room is None or len(self.built_lines) >= nb_lines:
+            return
+        index = min(max(self.first_built - room.nb_dropped, 0),
+                    len(room.messages))
+        if not index:
+            return
         with_timestamps = config.get('show_timestamps')
-        for message in room.messages:
-            self.build_new_message(message, clean=False, timestamp=with_timestamps)
+        cache = self.lines_cache.get(self.build_key, {})
+        count = len(self.built_lines)
+        # (message, lines), from the most recent
+        built = []
+        while index and count < nb_lines:
+            index -= 1
+            message = room.messages[index]
+            cached = cache.pop(id(message), None)
+            if cached and cached[0] is message:
+                lines = [tuple(cached[1][i:i+3])
+                         for i in range(0, len(cached[1]), 3)]
+            else:
+                lines = self.build_message(message, timestamp=with_timestamps)
             if self.separator_after is message:
-                self.build_new_message(None)
-        while len(self.built_lines) > self.lines_nb_limit:
-            self.built_lines.pop(0)
+                built.append((None, [SEPARATOR]))
+                count += 1
+            built.append((message, lines))
+            count += len(lines)
+        self.first_built = room.nb_dropped + index
+        if count > self.built_lines.maxlen:
+            # drop the first lines of the oldest message
+            message, lines = built[-1]
+            built[-1] = (message, lines[count - self.built_lines.maxlen:])
+            self.first_built = 0
+        # number the messages, from the most recent
+        for i, (message, lines) in enumerate(built):
+            if message is not None and lines:
+                self.messages_dropped -= 1
+                self.messages.appendleft(message)
+                built[i] = (message, [(self.messages_dropped,) + line
+                                      for line in lines])
+        new_lines = []
+        for message, lines in reversed(built):
+            new_lines.extend(lines)
+        self.built_lines.extendleft(reversed(new_lines))
+        self.nb_dropped -= len(new_lines)
+        number = self.nb_dropped
+        for message, lines in reversed(built):
+            if (lines and message is not None and
+                    message.identifier is not None):
+                self.message_lines.setdefault(message.identifier,
+                                              [number, len(lines)])
+            number += len(lines)
+
+    def build_all(self):
+        "Build all the messages that are not built yet"
+        self.build_older(self.built_lines.maxlen)
+
+    def find_message_line(self, message):
+        """
+        Return the position in built_lines of the first line of message,
+        building the older messages if needed, or -1 if it has no line
+        """
+        number = self.get_message_number(message)
+        if number is None:
+            self.build_all()
+            number = self.get_message_number(message)
+            if number is None:
+                return -1
+        for i, line in enumerate(self.built_lines):
+            if line[0] == number and line != SEPARATOR:
+                return i
+        return -1
 
     def __del__(self):
         log.debug('** TextWin: deleting %s built lines', (len(self.built_lines)))
@@ -140,7 +411,7 @@ class TextWin(BaseTextWin):
     def __init__(self, lines_nb_limit=None):
         BaseTextWin.__init__(self, lines_nb_limit)
 
-        # the Lines of the highlights in that buffer
+        # the messages highlighted in that buffer
         self.highlights = []
         # the current HL position in that list NaN means that we’re not on
         # an hl. -1 is a valid position (it's before the first hl of the
@@ -154,6 +425,34 @@ class TextWin(BaseTextWin):
 
         self.separator_after = None
 
+        # What each row showed the last time the window was drawn, as
+        # (line, message, color of the nickname) tuples, and the state of
+        # the window at that time: if anything in it changed, or if
+        # something else was drawn on the screen since then, everything is
+        # drawn again
+        self.drawn_rows = []
+        self.drawn_state = None
+
+    def go_to_highlight(self):
+        """
+        Scroll to the highlight at hl_pos, dropping the highlights that
+        are not in the buffer anymore
+        """
+        hl = self.highlights[self.hl_pos]
+        pos = self.find_message_line(hl)
+        while pos == -1:
+            self.highlights = self.highlights[self.hl_pos+1:]
+            if not self.highlights:
+                self.hl_pos = float('nan')
+                self.pos = 0
+                return
+            self.hl_pos = 0
+            hl = self.highlights[0]
+            pos = self.find_message_line(hl)
+        self.pos = len(self.built_lines) - pos - self.height
+        if self.pos < 0 or self.pos >= len(self.built_lines):
+            self.pos = 0
+
     def next_highlight(self):
         """
         Go to the next highlight in the buffer.
@@ -173,22 +472,7 @@ class TextWin(BaseTextWin):
         else:
             self.hl_pos = hl_size
         log.debug("self.hl_pos = %s", self.hl_pos)
-        hl = self.highlights[self.hl_pos]
-        pos = None
-        while not pos:
-            try:
-                pos = self.built_lines.index(hl)
-            except ValueError:
-                self.highlights = self.highlights[self.hl_pos+1:]
-                if not self.highlights:
-                    self.hl_pos = float('nan')
-                    self.pos = 0
-                    return
-                self.hl_pos = 0
-                hl = self.highlights[0]
-        self.pos = len(self.built_lines) - pos - self.height
-        if self.pos < 0 or self.pos >= len(self.built_lines):
-            self.pos = 0
+        self.go_to_highlight()
 
     def previous_highlight(self):
         """
@@ -207,30 +491,31 @@ class TextWin(BaseTextWin):
         else:
             self.hl_pos -= 1
         log.debug("self.hl_pos = %s", self.hl_pos)
-        hl = self.highlights[self.hl_pos]
-        pos = None
-        while not pos:
-            try:
-                pos = self.built_lines.index(hl)
-            except ValueError:
-                self.highlights = self.highlights[self.hl_pos+1:]
-                if not self.highlights:
-                    self.hl_pos = float('nan')
-                    self.pos = 0
-                    return
-                self.hl_pos = 0
-                hl = self.highlights[0]
-        self.pos = len(self.built_lines) - pos - self.height
-        if self.pos < 0 or self.pos >= len(self.built_lines):
+        self.go_to_highlight()
+
+    def scroll_to_message(self, message):
+        """
+        Scroll until the first line of the given message is at the top of
+        the window (or as close as possible)
+        """
+        i = self.find_message_line(message)
+        if i == -1:
+            return
+        self.pos = len(self.built_lines) - i - self.height
+        if self.pos < 0:
             self.pos = 0
+        # Chose a proper position (not too high)
+        self.scroll_up(0)
 
     def scroll_to_separator(self):
         """
         Scroll until separator is centered. If no separator is
         present, scroll at the top of the window
         """
-        if None in self.built_lines:
-            self.pos = len(self.built_lines) - self.built_lines.index(None) - self.height + 1
+        if SEPARATOR not in self.built_lines:
+            self.build_all()
+        if SEPARATOR in self.built_lines:
+            self.pos = len(self.built_lines) - self.built_lines.index(SEPARATOR) - self.height + 1
             if self.pos < 0:
                 self.pos = 0
         else:
@@ -248,9 +533,10 @@ class TextWin(BaseTextWin):
         Remove the line separator
         """
         log.debug('remove_line_separator')
-        if None in self.built_lines:
-            self.built_lines.remove(None)
-            self.separator_after = None
+        if SEPARATOR in self.built_lines:
+            self.replace_lines(self.built_lines.index(SEPARATOR) +
+                               self.nb_dropped, 1, [])
+        self.separator_after = None
 
     def add_line_separator(self, room=None):
         """
@@ -258,8 +544,8 @@ class TextWin(BaseTextWin):
         room is a textbuffer that is needed to get the previous message
         (in case of resize)
         """
-        if None not in self.built_lines:
-            self.built_lines.append(None)
+        if SEPARATOR not in self.built_lines:
+            self.append_lines([SEPARATOR])
             self.nb_of_highlights_after_separator = 0
             log.debug("Reseting number of highlights after separator")
             if room and room.messages:
@@ -271,39 +557,30 @@ class TextWin(BaseTextWin):
         Return the number of lines that are built for the given
         message.
         """
-        lines = self.build_message(message, timestamp=timestamp)
-        if self.lock:
-            self.lock_buffer.extend(lines)
-        else:
-            self.built_lines.extend(lines)
-        if not lines or not lines[0]:
+        nb = BaseTextWin.build_new_message(self, message, history=history,
+                                           clean=clean, highlight=highlight,
+                                           timestamp=timestamp)
+        if not nb:
             return 0
         if highlight:
-            self.highlights.append(lines[0])
+            self.highlights.append(message)
             self.nb_of_highlights_after_separator += 1
             log.debug("Number of highlights after separator is now %s",
                           self.nb_of_highlights_after_separator)
-        if clean:
-            while len(self.built_lines) > self.lines_nb_limit:
-                self.built_lines.pop(0)
-        return len(lines)
+        return nb
 
     def build_message(self, message, timestamp=False):
         """
-        Build a list of lines from a message, without adding it
-        to a list
+        Build the lines of a message, as a list of (start, end, prepend id)
+        tuples, without adding them to the built lines
         """
-        if message is None:  # line separator
-            return [None]
-        txt = message.txt
-        if not txt:
+        if not message.txt:
             return []
-        if len(message.str_time) > 8:
+        if message.time_width > 8:
             default_color = (FORMAT_CHAR + dump_tuple(get_theme().COLOR_LOG_MSG)
                     + '}')
         else:
             default_color = None
-        ret = []
         nick = truncate_nick(message.nickname)
         offset = 0
         if message.ack:
@@ -315,29 +592,22 @@ class TextWin(BaseTextWin):
         if message.me:
             offset += 1 # '* ' before and ' ' after
         if timestamp:
-            if message.str_time:
-                offset += 1 + len(message.str_time)
-            if get_theme().CHAR_TIME_LEFT and message.str_time:
+            time_width = message.time_width
+            if time_width:
+                offset += 1 + time_width
+            if get_theme().CHAR_TIME_LEFT and time_width:
                 offset += 1
-            if get_theme().CHAR_TIME_RIGHT and message.str_time:
+            if get_theme().CHAR_TIME_RIGHT and time_width:
                 offset += 1
-        lines = poopt.cut_text(txt, self.width-offset-1)
-        prepend = default_color if default_color else ''
-        attrs = []
-        for line in lines:
-            saved = Line(msg=message, start_pos=line[0], end_pos=line[1], prepend=prepend)
-            attrs = parse_attrs(message.txt[line[0]:line[1]], attrs)
-            if attrs:
-                prepend = FORMAT_CHAR + FORMAT_CHAR.join(attrs)
-            else:
-                if default_color:
-                    prepend = default_color
-                else:
-                    prepend = ''
-            ret.append(saved)
-        return ret
+        return self.layout_message(message, offset, default_color)
 
     def refresh(self):
+        """
+        Draw the visible lines. Only the rows that do not show the same
+        line as the last time are drawn again, after scrolling the window
+        if the lines moved up or down (a new message, or the user
+        scrolling).
+        """
         log.debug('Refresh: %s', self.__class__.__name__)
         if self.height <= 0:
             return
@@ -346,73 +616,145 @@ class TextWin(BaseTextWin):
         else:
             lines = self.built_lines[-self.height-self.pos:-self.pos]
         with_timestamps = config.get("show_timestamps")
-        self._win.move(0, 0)
-        self._win.erase()
-        for y, line in enumerate(lines):
-            if line:
-                msg = line.msg
-                if line.start_pos == 0:
-                    if msg.nick_color:
-                        color = msg.nick_color
-                    elif msg.user:
-                        color = msg.user.color
-                    else:
-                        color = None
-                    if with_timestamps:
-                        self.write_time(msg.str_time)
-                    if msg.ack:
-                        self.write_ack()
-                    if msg.me:
-                        self._win.attron(to_curses_attr(get_theme().COLOR_ME_MESSAGE))
-                        self.addstr('* ')
-                        self.write_nickname(msg.nickname, color, msg.highlight)
-                        if msg.revisions:
-                            self._win.attron(to_curses_attr(get_theme().COLOR_REVISIONS_MESSAGE))
-                            self.addstr('%d' % msg.revisions)
-                            self._win.attrset(0)
-                        self.addstr(' ')
-                    else:
-                        self.write_nickname(msg.nickname, color, msg.highlight)
-                        if msg.revisions:
-                            self._win.attron(to_curses_attr(get_theme().COLOR_REVISIONS_MESSAGE))
-                            self.addstr('%d' % msg.revisions)
-                            self._win.attrset(0)
-                        self.addstr('> ')
-            if y != self.height-1:
-                self.addstr('\n')
+        rows = []
+        for line in lines:
+            message = None if line == SEPARATOR else self.get_message(line)
+            rows.append((line, message, self.get_nick_color(line, message)))
+        rows.extend((None, None, None) for _ in range(self.height - len(rows)))
+        state = (self._win, Win.screen_generation, self.width,
+                 with_timestamps, get_theme())
+        if state != self.drawn_state:
+            self._win.erase()
+            drawn_rows = [(None, None, None)] * self.height
+        else:
+            drawn_rows = self.scroll_drawn_rows(rows)
+        for y, row in enumerate(rows):
+            drawn_row = drawn_rows[y]
+            if not self.same_line(row, drawn_row) or row[2] != drawn_row[2]:
+                self.write_line(y, row[0], row[1], row[2], with_timestamps)
+        self.drawn_rows = rows
+        self.drawn_state = state
         self._win.attrset(0)
-        for y, line in enumerate(lines):
-            if not line:
-                self.write_line_separator(y)
+        self._refresh()
+
+    @staticmethod
+    def same_line(row, other_row):
+        """
+        Whether two rows of the screen show the same line. The lines are
+        compared by value, and their messages by identity, since a message
+        replaced by another one (a correction, a receipt) can have the same
+        lines.
+        """
+        return row[0] == other_row[0] and row[1] is other_row[1]
+
+    @staticmethod
+    def get_nick_color(line, message):
+        "The color of the nickname written before a line, if any"
+        if message is None or line[1] != 0:
+            return None
+        if message.nick_color:
+            return message.nick_color
+        elif message.user:
+            return message.user.color
+        return None
+
+    def scroll_drawn_rows(self, rows):
+        """
+        If the rows drawn the last time are the new ones moved up or down,
+        scroll the window accordingly, and return what the rows show
+        after that.
+        """
+        drawn_rows = self.drawn_rows
+        height = self.height
+        same_line = self.same_line
+        if rows[0][0] and not same_line(rows[0], drawn_rows[0]):
+            # moved up, e.g. new lines at the bottom
+            for shift in range(1, height):
+                if same_line(drawn_rows[shift], rows[0]):
+                    break
             else:
-                offset = 0
-                # Offset for the timestamp (if any) plus a space after it
-                if with_timestamps:
-                    offset += len(line.msg.str_time)
-                    if offset:
-                        offset += 1
-
-                # Offset for the nickname (if any)
-                # plus a space and a > after it
-                if line.msg.nickname:
-                    offset += poopt.wcswidth(
-                                truncate_nick(line.msg.nickname))
-                    if line.msg.me:
-                        offset += 3
-                    else:
-                        offset += 2
-                    offset += ceil(log10(line.msg.revisions + 1))
-
-                    if line.msg.ack:
-                        offset += 1 + poopt.wcswidth(
-                                    get_theme().CHAR_ACK_RECEIVED)
-
-                self.write_text(y, offset,
-                        line.prepend+line.msg.txt[line.start_pos:line.end_pos])
-            if y != self.height-1:
-                self.addstr('\n')
+                return drawn_rows
+        elif drawn_rows[0][0] and not same_line(drawn_rows[0], rows[0]):
+            # moved down, e.g. scrolling up in the history
+            for shift in range(-1, -height, -1):
+                if same_line(rows[-shift], drawn_rows[0]):
+                    break
+            else:
+                return drawn_rows
+        else:
+            return drawn_rows
+        if shift > 0:
+            moved = drawn_rows[shift:] + [(None, None, None)] * shift
+            overlap = zip(moved[:height - shift], rows)
+        else:
+            moved = [(None, None, None)] * -shift + drawn_rows[:shift]
+            overlap = zip(moved[-shift:], rows[-shift:])
+        # do not bother scrolling if most of the rows changed anyway
+        if any(not same_line(a, b) for a, b in overlap):
+            return drawn_rows
+        self._win.scrollok(True)
+        self._win.scroll(shift)
+        self._win.scrollok(False)
+        return moved
+
+    def write_line(self, y, line, msg, color, with_timestamps):
+        """
+        Draw a line of msg (or the separator, or nothing if line is None)
+        on the yth row, after clearing it
+        """
         self._win.attrset(0)
-        self._refresh()
+        self.move(y, 0)
+        self._win.clrtoeol()
+        if line is None:
+            return
+        if line == SEPARATOR:
+            self.write_line_separator(y)
+            return
+        _, start_pos, end_pos, prepend = line
+        if start_pos == 0:
+            if with_timestamps:
+                self.write_time(msg.str_time)
+            if msg.ack:
+                self.write_ack()
+            if msg.me:
+                self._win.attron(to_curses_attr(get_theme().COLOR_ME_MESSAGE))
+                self.addstr('* ')
+                self.write_nickname(msg.nickname, color, msg.highlight)
+                if msg.revisions:
+                    self._win.attron(to_curses_attr(get_theme().COLOR_REVISIONS_MESSAGE))
+                    self.addstr('%d' % msg.revisions)
+                    self._win.attrset(0)
+                self.addstr(' ')
+            else:
+                self.write_nickname(msg.nickname, color, msg.highlight)
+                if msg.revisions:
+                    self._win.attron(to_curses_attr(get_theme().COLOR_REVISIONS_MESSAGE))
+                    self.addstr('%d' % msg.revisions)
+                    self._win.attrset(0)
+                self.addstr('> ')
+            self._win.attrset(0)
+        offset = 0
+        # Offset for the timestamp (if any) plus a space after it
+        if with_timestamps:
+            offset += msg.time_width
+            if offset:
+                offset += 1
+
+        # Offset for the nickname (if any)
+        # plus a space and a > after it
+        if msg.nickname:
+            offset += poopt.wcswidth(truncate_nick(msg.nickname))
+            if msg.me:
+                offset += 3
+            else:
+                offset += 2
+            offset += ceil(log10(msg.revisions + 1))
+
+            if msg.ack:
+                offset += 1 + poopt.wcswidth(get_theme().CHAR_ACK_RECEIVED)
+
+        self.write_text(y, offset, msg.txt, start_pos, end_pos,
+                        prepends[prepend])
 
     def write_line_separator(self, y):
         char = get_theme().CHAR_NEW_TEXT_SEPARATOR
@@ -454,19 +796,25 @@ class TextWin(BaseTextWin):
         Find a message, and replace it with a new one
         (instead of rebuilding everything in order to correct a message)
         """
+        entry = self.message_lines.pop(old_id, None)
+        if entry is None:
+            return
+        number, nb = entry
+        position = number - self.nb_dropped
+        # the new message takes the number of the old one
+        message_number = self.built_lines[position][0]
+        self.messages[message_number - self.messages_dropped] = message
         with_timestamps = config.get('show_timestamps')
-        for i in range(len(self.built_lines)-1, -1, -1):
-            if self.built_lines[i] and self.built_lines[i].msg.identifier == old_id:
-                index = i
-                while index >= 0 and self.built_lines[index] and self.built_lines[index].msg.identifier == old_id:
-                    self.built_lines.pop(index)
-                    index -= 1
-                index += 1
-                lines = self.build_message(message, timestamp=with_timestamps)
-                for line in lines:
-                    self.built_lines.insert(index, line)
-                    index += 1
-                break
+        lines = [(message_number,) + line for line in
+                 self.build_message(message, timestamp=with_timestamps)]
+        if len(lines) != nb:
+            self.replace_lines(number, nb, lines)
+            return
+        # Same number of lines (e.g. a receipt), replace them in place
+        for i, line in enumerate(lines):
+            self.built_lines[position + i] = line
+        if message.identifier is not None:
+            self.message_lines[message.identifier] = entry
 
     def __del__(self):
         log.debug('** TextWin: deleting %s built lines', (len(self.built_lines)))
@@ -485,73 +833,55 @@ class XMLTextWin(BaseTextWin):
             lines = self.built_lines[-self.height:]
         else:
             lines = self.built_lines[-self.height-self.pos:-self.pos]
+        messages = [self.get_message(line) for line in lines]
         self._win.move(0, 0)
         self._win.erase()
-        for y, line in enumerate(lines):
-            if line:
-                msg = line.msg
-                if line.start_pos == 0:
-                    if msg.nickname == theme.CHAR_XML_OUT:
-                        color = theme.COLOR_XML_OUT
-                    elif msg.nickname == theme.CHAR_XML_IN:
-                        color = theme.COLOR_XML_IN
-                    self.write_time(msg.str_time)
-                    self.write_prefix(msg.nickname, color)
-                    self.addstr(' ')
+        for y, (line, msg) in enumerate(zip(lines, messages)):
+            if line[1] == 0:
+                if msg.nickname == theme.CHAR_XML_OUT:
+                    color = theme.COLOR_XML_OUT
+                elif msg.nickname == theme.CHAR_XML_IN:
+                    color = theme.COLOR_XML_IN
+                self.write_time(msg.str_time)
+                self.write_prefix(msg.nickname, color)
+                self.addstr(' ')
             if y != self.height-1:
                 self.addstr('\n')
         self._win.attrset(0)
-        for y, line in enumerate(lines):
+        for y, (line, msg) in enumerate(zip(lines, messages)):
             offset = 0
             # Offset for the timestamp (if any) plus a space after it
-            offset += len(line.msg.str_time)
+            offset += msg.time_width
             # space
             offset += 1
 
             # Offset for the prefix
-            offset += poopt.wcswidth(truncate_nick(line.msg.nickname))
+            offset += poopt.wcswidth(truncate_nick(msg.nickname))
             # space
             offset += 1
 
-            self.write_text(y, offset,
-                    line.prepend+line.msg.txt[line.start_pos:line.end_pos])
+            self.write_text(y, offset, msg.txt, line[1], line[2],
+                            prepends[line[3]])
             if y != self.height-1:
                 self.addstr('\n')
         self._win.attrset(0)
         self._refresh()
 
     def build_message(self, message, timestamp=False):
-        txt = message.txt
-        ret = []
-        default_color = None
         nick = truncate_nick(message.nickname)
         offset = 0
         if nick:
             offset += poopt.wcswidth(nick) + 1 # + nick + ' ' length
-        if message.str_time:
-            offset += 1 + len(message.str_time)
-        if get_theme().CHAR_TIME_LEFT and message.str_time:
+        time_width = message.time_width
+        if time_width:
+            offset += 1 + time_width
+        if get_theme().CHAR_TIME_LEFT and time_width:
             offset += 1
-        if get_theme().CHAR_TIME_RIGHT and message.str_time:
+        if get_theme().CHAR_TIME_RIGHT and time_width:
             offset += 1
-        lines = poopt.cut_text(txt, self.width-offset-1)
-        prepend = default_color if default_color else ''
-        attrs = []
-        for line in lines:
-            saved = Line(msg=message, start_pos=line[0], end_pos=line[1], prepend=prepend)
-            attrs = parse_attrs(message.txt[line[0]:line[1]], attrs)
-            if attrs:
-                prepend = FORMAT_CHAR + FORMAT_CHAR.join(attrs)
-            else:
-                if default_color:
-                    prepend = default_color
-                else:
-                    prepend = ''
-            ret.append(saved)
-        return ret
+        return self.layout_message(message, offset)
 
     def write_prefix(self, nickname, color):
         self._win.attron(to_curses_attr(color))
         self.addstr(truncate_nick(nickname))
         self._win.attroff(to_curses_attr(color))
-
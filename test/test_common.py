@@ -12,7 +12,8 @@ from slixmpp import JID
 from datetime import timedelta
 from common import (datetime_tuple, get_utc_time, get_local_time, shell_split,
                     find_argument_quoted, find_argument_unquoted,
-                    parse_str_to_secs, parse_secs_to_str, safeJID)
+                    parse_str_to_secs, parse_secs_to_str, safeJID,
+                    RingBuffer, get_size)
 
 def test_utc_time():
     delta = timedelta(seconds=-3600)
@@ -64,3 +65,24 @@ def test_parse_secs_to_str():
 def test_safeJID():
     assert safeJID('toto@titi/tata') == JID('toto@titi/tata')
     assert safeJID('é_è') == JID('')
+
+def test_ring_buffer():
+    buffer = RingBuffer(range(10), maxlen=5)
+    assert list(buffer) == [5, 6, 7, 8, 9]
+    buffer.append(10)
+    assert list(buffer) == [6, 7, 8, 9, 10]
+    as_list = list(buffer)
+    for index in (slice(None), slice(-3, None), slice(-4, -1), slice(1, 3),
+                  slice(None, -40, -1), slice(3, 0, -2), slice(4, 2),
+                  slice(-10, 10, 2)):
+        assert buffer[index] == as_list[index]
+    assert buffer[-1] == 10
+
+def test_get_size():
+    seen = set()
+    text = 'a shared string'
+    size = get_size((text, None, text), seen)
+    assert size == sys.getsizeof(text)
+    assert get_size(('another string', text), seen) == \
+            sys.getsizeof('another string')
+    assert get_size((text,), seen) == 0
@@ -112,3 +112,30 @@ class TestTabNames(object):
         assert config_obj.get_by_tabname('test_int', 'toto@toto.com', fallback=False) == ''
 
 
+
+    def test_get_tabname_cache(self, config_obj):
+        config_obj.set_and_save('test3', value='value', section='toto@toto.com')
+        misses = config_obj.cache_misses
+        hits = config_obj.cache_hits
+        assert config_obj.get_by_tabname('test3', 'toto@toto.com') == 'value'
+        assert config_obj.get_by_tabname('test3', 'toto@toto.com') == 'value'
+        assert config_obj.cache_misses == misses + 1
+        assert config_obj.cache_hits == hits + 1
+
+        config_obj.set('test3', 'other', section='toto@toto.com')
+        assert config_obj.get_by_tabname('test3', 'toto@toto.com') == 'other'
+        config_obj.remove_and_save('test3', section='toto@toto.com')
+        assert config_obj.get_by_tabname('test3', 'toto@toto.com') == ''
+        config_obj.read_file()
+        assert config_obj.get_by_tabname('test3', 'toto@toto.com') == ''
+        assert config_obj.cache_misses == misses + 4
+
+    def test_get_tabname_cache_limit(self, config_obj, monkeypatch):
+        monkeypatch.setattr(config, 'TABNAME_CACHE_LIMIT', 2)
+        config_obj.clear_cache()
+        clears = config_obj.cache_clears
+        for jid in ('a@toto.com', 'b@toto.com', 'c@toto.com'):
+            config_obj.get_by_tabname('test3', jid)
+        stats = config_obj.get_cache_stats()
+        assert stats['entries'] == 1
+        assert stats['clears'] == clears + 1
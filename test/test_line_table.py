@@ -0,0 +1,57 @@
+"""
+Test the line_table module
+"""
+
+import sys
+sys.path.append('src')
+
+import pytest
+
+import line_table
+from line_table import LineTable, SEPARATOR, get_prepend_id, prepends
+
+def rows(*numbers):
+    return [(number, 0, number, 0) for number in numbers]
+
+def test_append_and_drop():
+    table = LineTable(maxlen=3)
+    assert not table
+    table.extend(rows(1, 2, 3, 4))
+    assert len(table) == 3
+    assert list(table) == rows(2, 3, 4)
+    table.append(SEPARATOR)
+    assert list(table) == rows(3, 4) + [SEPARATOR]
+    assert table.index(SEPARATOR) == 2
+    assert SEPARATOR in table
+
+def test_both_ends():
+    table = LineTable(maxlen=100)
+    table.extend(rows(*range(50)))
+    for number in range(20):
+        assert table.popleft() == (number, 0, number, 0)
+    table.extendleft(rows(*range(19, -1, -1)))
+    assert list(table) == rows(*range(50))
+    assert table.pop() == (49, 0, 49, 0)
+    table[0] = (7, 1, 2, 3)
+    assert table[0] == (7, 1, 2, 3)
+    assert table[-1] == (48, 0, 48, 0)
+    assert table[-3:] == rows(46, 47, 48)
+    assert list(reversed(table))[0] == (48, 0, 48, 0)
+    with pytest.raises(IndexError):
+        table[49]
+    table.clear()
+    assert len(table) == 0 and len(table.rows) == 0
+
+def test_full_appendleft():
+    table = LineTable(rows(1, 2), maxlen=2)
+    table.appendleft((0, 0, 0, 0))
+    assert list(table) == rows(0, 1)
+
+def test_prepend_ids(monkeypatch):
+    monkeypatch.setattr(line_table, 'PREPENDS_LIMIT', len(prepends) + 1)
+    assert get_prepend_id('') == 0
+    prepend_id = get_prepend_id('\x19b')
+    assert prepends[prepend_id] == '\x19b'
+    assert get_prepend_id('\x19b') == prepend_id
+    # the table is full
+    assert get_prepend_id('\x19u') == 0
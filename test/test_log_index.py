@@ -0,0 +1,93 @@
+"""
+Test the log_index module
+"""
+
+import os
+import sys
+import tempfile
+import pytest
+sys.path.append('src')
+
+from log_index import LogIndex, parse_timestamp, scan_messages
+
+LOG = (b'MR 20140101T10:00:00Z 000 <toto>  hello\n'
+       b'MI 20140101T11:00:00Z 001 toto has joined\n'
+       b' second line\n'
+       b'MR 20140102T09:30:00Z 000 <tata>  Message\n')
+
+@pytest.fixture
+def log_files():
+    directory = tempfile.mkdtemp()
+    log_path = os.path.join(directory, 'room@muc.example')
+    index_path = os.path.join(directory, 'room@muc.example.idx')
+    with open(log_path, 'wb') as fd:
+        fd.write(LOG)
+    yield log_path, index_path
+    for path in (log_path, index_path):
+        if os.path.exists(path):
+            os.unlink(path)
+    os.rmdir(directory)
+
+def test_parse_timestamp():
+    assert parse_timestamp(b'MR 19700101T00:01:00Z') == 60
+    assert parse_timestamp(b'MR toto') == 0
+
+def test_scan_messages():
+    offsets = [offset for offset, _ in scan_messages(LOG)]
+    assert offsets == [0, 40, 95]
+    assert [offset for offset, _ in scan_messages(LOG, 1)] == [40, 95]
+
+def test_open_and_append(log_files):
+    log_path, index_path = log_files
+    index = LogIndex(log_path, index_path)
+    assert index.open()
+    assert index.count == 3
+    assert index.offset(1) == 40
+    assert index.offset(3) == len(LOG)
+
+    line = b'MR 20140103T00:00:00Z 000 <toto>  new\n'
+    with open(log_path, 'ab') as fd:
+        fd.write(line)
+    index.append(parse_timestamp(line), len(line))
+    assert index.offset(3) == len(LOG)
+    assert index.log_size == len(LOG) + len(line)
+    index.flush()
+    index.close()
+
+    # reopening does not index anything twice
+    index = LogIndex(log_path, index_path)
+    assert index.open()
+    assert index.count == 4
+    index.close()
+
+def test_catch_up_and_rebuild(log_files):
+    log_path, index_path = log_files
+    index = LogIndex(log_path, index_path)
+    index.open()
+    index.close()
+
+    line = b'MI 20140103T00:00:00Z 000 appended elsewhere\n'
+    with open(log_path, 'ab') as fd:
+        fd.write(line)
+    index.open()
+    assert index.count == 4
+    assert index.offset(3) == len(LOG)
+    index.close()
+
+    # rotated log
+    with open(log_path, 'wb') as fd:
+        fd.write(line)
+    index.open()
+    assert index.count == 1
+    assert index.offset(0) == 0
+    index.close()
+
+def test_find(log_files):
+    log_path, index_path = log_files
+    index = LogIndex(log_path, index_path)
+    index.open()
+    assert index.find(0) == 0
+    assert index.find(parse_timestamp(b'MR 20140101T10:30:00Z')) == 1
+    assert index.find(parse_timestamp(b'MR 20140102T00:00:00Z')) == 2
+    assert index.find(parse_timestamp(b'MR 20150101T00:00:00Z')) == 3
+    index.close()
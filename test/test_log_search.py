@@ -0,0 +1,70 @@
+"""
+Test the log_search module
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import pytest
+sys.path.append('src')
+
+import log_search
+from log_search import SearchIndex, parse_messages
+
+LOG = ('MR 20140101T10:00:00Z 000 <toto> \xa0hello world\n'
+       'MI 20140101T11:00:00Z 001 toto has joined\n'
+       ' second line\n').encode()
+
+def search(index, query):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    future = loop.create_future()
+    index.search(query, lambda results, error:
+            loop.call_soon_threadsafe(future.set_result, (results, error)))
+    try:
+        return loop.run_until_complete(future)
+    finally:
+        loop.close()
+
+@pytest.fixture
+def index():
+    directory = tempfile.mkdtemp()
+    index = SearchIndex(os.path.join(directory, 'search.db'))
+    yield index
+    index.stop()
+
+def test_parse_messages():
+    assert list(parse_messages(LOG)) == [
+            (1388570400, 'toto', 'hello world'),
+            (1388574000, '', 'toto has joined\nsecond line')]
+
+@pytest.mark.skipif(not log_search.SQLITE, reason='sqlite3 is missing')
+def test_feed_and_search(index):
+    index.feed('room@muc.example', 0, LOG)
+    results, error = search(index, 'hello')
+    assert error is None
+    assert [(r.room, r.nick, r.txt) for r in results] == [
+            ('room@muc.example', 'toto', 'hello world')]
+    assert search(index, 'nick:toto')[0][0].txt == 'hello world'
+    assert search(index, 'nothing')[0] == []
+    assert search(index, '"unterminated')[1]
+
+@pytest.mark.skipif(not log_search.SQLITE, reason='sqlite3 is missing')
+def test_search_most_recent_first(index):
+    index.feed('new@muc.example', 0,
+               'MR 20150101T10:00:00Z 000 <toto> \xa0hello\n'.encode())
+    index.feed('old@muc.example', 0,
+               'MR 20100101T10:00:00Z 000 <toto> \xa0hello\n'.encode())
+    results, _ = search(index, 'hello')
+    assert [r.room for r in results] == ['new@muc.example', 'old@muc.example']
+
+@pytest.mark.skipif(not log_search.SQLITE, reason='sqlite3 is missing')
+def test_search_same_second(index):
+    for room in ('a@muc.example', 'b@muc.example'):
+        index.feed(room, 0, ('MR 20150101T10:00:00Z 000 <toto> \xa0hello\n'
+                             'MR 20150101T10:00:00Z 000 <toto> \xa0hello\n'
+                            ).encode())
+    results, _ = search(index, 'hello')
+    assert [r.room for r in results] == ['b@muc.example'] * 2 + \
+                                         ['a@muc.example'] * 2
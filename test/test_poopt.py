@@ -6,9 +6,28 @@ import pytest
 import sys
 sys.path.append('src')
 
-from poopt import cut_text
+from poopt import cut_text, parse_runs, layout_message
 
 def test_cut_text():
 
     text = '12345678901234567890'
     assert cut_text(text, 5) == [(0, 5), (5, 10), (10, 15), (15, 20)]
+
+def test_parse_runs():
+
+    text = 'a\x19bb\x1912}c\x191,-1,u}d\x19Oe'
+    assert parse_runs(text) == [(0, 1, ''), (3, 4, 'b'), (8, 9, '12'),
+                                (17, 18, '1,-1,u'), (20, 21, 'o')]
+    assert parse_runs(text, 3, 9) == [(3, 4, ''), (8, 9, '12')]
+    assert parse_runs('') == [(0, 0, '')]
+    assert parse_runs('a\x19') == [(0, 1, ''), (2, 2, '')]
+
+def test_layout_message():
+
+    text = '\x19bfoo \x191}bar baz'
+    assert layout_message(text, 5) == [(0, 5, ''), (6, 12, '\x19b'),
+                                       (13, 16, '\x19b\x191}')]
+    text = '\x19uab\x19ocd\nef'
+    assert layout_message(text, 80) == [(0, 9, ''), (9, 11, '')]
+    text = '12345678901234567890'
+    assert layout_message(text, 5) == [(a, b, '') for a, b in cut_text(text, 5)]
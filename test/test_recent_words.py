@@ -0,0 +1,36 @@
+"""
+Test the recent_words module
+"""
+
+import sys
+sys.path.append('src')
+
+from recent_words import RecentWords, HALF_LIFE
+
+def test_words():
+    words = RecentWords(100)
+    words.add_message('\x19o\x191}Hello, world! (poezio) is “so”\x19o')
+    assert len(words) == 3
+    assert set(words.get_completions('')) == {'Hello', 'world', 'poezio'}
+    assert words.get_completions('WOR') == ['world']
+    assert words.get_completions('x') == []
+
+def test_ranking():
+    words = RecentWords(100)
+    words.add_message('alpha albatross')
+    words.add_message('alpha')
+    # said more often
+    assert words.get_completions('al') == ['alpha', 'albatross']
+    for _ in range(HALF_LIFE * 2):
+        words.add_message('nothing')
+    words.add_message('albatross')
+    # said more recently
+    assert words.get_completions('al') == ['albatross', 'alpha']
+
+def test_limit():
+    words = RecentWords(8)
+    for i in range(20):
+        words.add_message('word%d' % i)
+    assert len(words) <= 8
+    assert words.get_completions('word')[0] == 'word19'
+    assert words.keys == sorted((word.lower(), word) for word in words.scores)
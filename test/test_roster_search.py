@@ -0,0 +1,51 @@
+"""
+Test the roster_search module
+"""
+
+import sys
+sys.path.append('src')
+
+from roster_search import RosterSearchIndex, get_grams
+
+class FakeContact(object):
+    def __init__(self, jid, name='', groups=('none',)):
+        self.bare_jid = jid
+        self.name = name
+        self.groups = list(groups)
+
+def test_get_grams():
+    assert get_grams('abc', skip=False) == {'ab', 'bc'}
+    assert get_grams('abc') == {'ab', 'bc', 'ac'}
+    assert get_grams('a') == set()
+
+def test_search():
+    index = RosterSearchIndex()
+    index.update(FakeContact('alice@example.com', 'Alice', ['Friends']))
+    index.update(FakeContact('bob@example.org', 'Robert'))
+    index.update(FakeContact('carol@example.com', '', ['Work']))
+    assert set(index.search('')) == {'alice@example.com', 'bob@example.org',
+                                     'carol@example.com'}
+    assert set(index.search('example.com')) == {'alice@example.com',
+                                                'carol@example.com'}
+    assert set(index.search('ROB')) == {'bob@example.org'}
+    assert set(index.search('work')) == {'carol@example.com'}
+    assert set(index.search('o')) == {'bob@example.org', 'carol@example.com',
+                                      'alice@example.com'}
+    assert index.search('nothing') == {}
+
+    index.update(FakeContact('bob@example.org', 'Bobby'))
+    assert index.search('rob') == {}
+    index.remove('alice@example.com')
+    assert set(index.search('example.com')) == {'carol@example.com'}
+    assert 'friends' not in str(index.postings)
+
+def test_search_fuzzy():
+    index = RosterSearchIndex()
+    index.update(FakeContact('alice@example.com', 'Alice'))
+    index.update(FakeContact('bob@example.org', 'Robert'))
+    scores = index.search_fuzzy('alcie')
+    assert list(scores) == ['alice@example.com']
+    assert scores['alice@example.com'] < 1
+    assert index.search_fuzzy('robert') == {'bob@example.org': 1}
+    assert index.search_fuzzy('zzz') == {}
+    assert index.search_fuzzy('bb') == {}
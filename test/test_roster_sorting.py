@@ -0,0 +1,31 @@
+"""
+Test the roster_sorting module
+"""
+
+import sys
+sys.path.append('src')
+
+from roster_sorting import chain_sort_key
+
+METHODS = {
+    'len': len,
+    'first': lambda x: x[0],
+}
+
+def chain_sorted(items, sort):
+    "Sort the items the way the roster used to, one method at a time"
+    items = sorted(items)
+    for sorting in sort.split(':'):
+        if sorting == 'reverse':
+            items = list(reversed(items))
+        else:
+            items = sorted(items, key=METHODS.get(sorting, lambda x: 0))
+    return items
+
+def test_chain_sort_key():
+    items = ['b', 'ab', 'ba', 'a', 'abc', 'ca', 'c']
+    for sort in ('', 'len', 'first', 'len:first', 'first:len', 'reverse',
+                 'len:reverse', 'reverse:len', 'first:reverse:len',
+                 'len:reverse:first:reverse', 'unknown:len'):
+        key = chain_sort_key(sort, METHODS, lambda x: x)
+        assert sorted(items, key=key) == chain_sorted(items, sort)
@@ -0,0 +1,51 @@
+"""
+Test the StringPool class of the string_pool module
+"""
+
+import sys
+sys.path.append('src')
+
+from string_pool import StringPool, MIN_TRIM_SIZE
+
+def make_string(text):
+    "A new string object equal to text"
+    return ''.join(list(text))
+
+def test_intern():
+    pool = StringPool()
+    nick = make_string('some nick')
+    assert pool.intern(nick) is nick
+    other = make_string('some nick')
+    assert other is not nick
+    assert pool.intern(other) is nick
+    assert pool.intern('') == ''
+    assert pool.intern(None) is None
+    stats = pool.get_stats()
+    assert stats['strings'] == 1
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['saved'] == sys.getsizeof(other)
+
+def test_trim():
+    pool = StringPool()
+    kept = [pool.intern(make_string('kept %s' % i)) for i in range(10)]
+    for i in range(MIN_TRIM_SIZE - 10):
+        pool.intern(make_string('dropped %s' % i))
+    assert pool.trims == 1
+    # the string being interned when the pool is trimmed is in use
+    assert len(pool) == 11
+    assert pool.dropped == MIN_TRIM_SIZE - 11
+    for string in kept:
+        assert pool.intern(make_string(string)) is string
+
+def test_trim_outside_reference():
+    pool = StringPool()
+    nick = pool.intern(make_string('some nick'))
+    pool.trim()
+    # still used outside of the pool
+    assert len(pool) == 1
+    assert pool.intern(make_string('some nick')) is nick
+    del nick
+    pool.trim()
+    assert len(pool) == 0
+    assert pool.dropped == 1
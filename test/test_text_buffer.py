@@ -0,0 +1,50 @@
+"""
+Test the Message and TextBuffer classes of the text_buffer module
+"""
+
+import sys
+sys.path.append('src')
+
+from datetime import datetime
+
+import text_buffer
+from text_buffer import Message, TextBuffer, LONG_TIME, NO_TIME
+
+TIME = datetime(2014, 1, 1, 10, 0, 0)
+
+class ConfigShim(object):
+    def get(self, option, default=None, section=None):
+        return default
+
+def test_message_fields():
+    msg = Message('text', None, TIME, 'nick', None, 'id', highlight=True,
+                  ack=False, time_format=LONG_TIME)
+    assert msg.highlight and not msg.me and not msg.ack
+    assert msg.str_time == '2014-01-01 10:00:00'
+    assert msg.time_width == len(msg.str_time)
+    acked = msg._replace(ack=True)
+    assert acked is not msg and acked.ack and acked.highlight
+    assert acked.txt == 'text' and acked.time_format == LONG_TIME
+    assert 'old_message=None' in repr(acked)
+
+def test_str_time_cache():
+    text_buffer.str_times.clear()
+    msg = Message('text', None, TIME, 'nick', None, None)
+    assert msg.str_time == '10:00:00'
+    assert msg.str_time is msg.str_time
+    assert text_buffer.str_times[(TIME, 0)] == '10:00:00'
+    no_time = msg._replace(time_format=NO_TIME)
+    assert no_time.str_time == '' and no_time.time_width == 0
+
+def test_ack_and_correction(monkeypatch):
+    monkeypatch.setattr(text_buffer, 'config', ConfigShim())
+    buf = TextBuffer(messages_nb_limit=2, words_nb_limit=0)
+    buf.add_message('first', nickname='n', identifier='a', jid='a@b/c')
+    buf.add_message('second', nickname='n', identifier='b', jid='a@b/c')
+    msg = buf.ack_message('b')
+    assert msg.ack and buf.messages[-1] is msg
+    msg = buf.modify_message('fixed', 'b', 'c', jid='a@b/c')
+    assert msg.revisions == 1 and msg.old_message.txt == 'second\x19o'
+    buf.add_message('third', nickname='n', identifier='d')
+    assert buf.ack_message('a') is None
+    assert buf.ack_message('c').txt == 'fixed\x19o'
@@ -0,0 +1,167 @@
+"""
+Test the TextWin class of the windows module
+"""
+
+import pytest
+import sys
+sys.path.append('src')
+
+class ConfigShim(object):
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, option, default=None, section=None):
+        return self.values.get(option, '' if default is None else default)
+
+import config
+config.config = ConfigShim({})
+import core
+
+import text_buffer
+from windows import funcs, text_win
+from windows.text_win import TextWin
+
+# 40 characters, written on two lines in a window 30 columns wide
+TWO_LINES = 'word ' * 8
+
+class FakeCursesWin(object):
+    "Accept (and ignore) all the calls made on a curses window"
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: (0, 0)
+
+@pytest.fixture
+def shim(monkeypatch):
+    shim = ConfigShim({'show_timestamps': False, 'max_nick_length': 25})
+    monkeypatch.setattr(text_win, 'config', shim)
+    monkeypatch.setattr(funcs, 'config', shim)
+    monkeypatch.setattr(text_buffer, 'config', shim)
+    monkeypatch.setattr(text_win, 'to_curses_attr', lambda color: 0)
+    return shim
+
+def make_win(buf, lines_nb_limit, height=2, width=30):
+    win = TextWin(lines_nb_limit)
+    win._win = FakeCursesWin()
+    buf.add_window(win)
+    win.resize(height, width, 0, 0, buf)
+    return win
+
+def make_buffer(nb_messages):
+    buf = text_buffer.TextBuffer(messages_nb_limit=100, words_nb_limit=0)
+    for i in range(nb_messages):
+        buf.add_message(TWO_LINES, nickname='n', identifier='old%s' % i,
+                        jid='a@b/c')
+    return buf
+
+def built_messages(win, buf):
+    "The numbers of the messages in buf whose lines are built, in order"
+    numbers = []
+    for line in win.built_lines:
+        number = list(buf.messages).index(win.get_message(line))
+        if not numbers or numbers[-1] != number:
+            numbers.append(number)
+    return numbers
+
+def assert_contiguous(numbers):
+    assert numbers == list(range(numbers[0], numbers[0] + len(numbers)))
+
+def test_no_hole_after_correction(shim):
+    buf = make_buffer(20)
+    win = make_win(buf, lines_nb_limit=6)
+    for i in range(5):
+        assert buf.add_message(TWO_LINES, nickname='n', jid='a@b/c',
+                               identifier='new%s' % i) == 2
+    msg = buf.modify_message('short', 'new4', 'new4b', jid='a@b/c')
+    win.modify_message('new4', msg)
+    assert len(win.built_lines) == 5
+    win.scroll_up(10)
+    numbers = built_messages(win, buf)
+    assert_contiguous(numbers)
+    assert numbers[-1] == 24
+
+def test_no_hole_when_scrolled_up(shim):
+    buf = make_buffer(20)
+    win = make_win(buf, lines_nb_limit=6)
+    win.scroll_up(2)
+    for i in range(3):
+        buf.add_message(TWO_LINES, nickname='n', identifier='new%s' % i)
+    win.add_line_separator(buf)
+    win.remove_line_separator()
+    win.scroll_up(10)
+    assert_contiguous(built_messages(win, buf))
+
+def test_build_older(shim):
+    buf = make_buffer(20)
+    win = make_win(buf, lines_nb_limit=100)
+    # only the lines needed to fill the window twice are built
+    assert len(win.built_lines) == 4
+    win.scroll_up(10)
+    assert len(win.built_lines) >= 10 + 2 * 2
+    win.build_all()
+    assert built_messages(win, buf) == list(range(20))
+
+def test_lines_table(shim):
+    buf = make_buffer(0)
+    win = make_win(buf, lines_nb_limit=5)
+    for i in range(3):
+        buf.add_message(TWO_LINES, nickname='n', identifier=str(i))
+    # the first line of the first message was dropped, not the message
+    assert len(win.built_lines) == 5
+    assert [line[1] for line in win.built_lines] == [25, 0, 25, 0, 25]
+    assert win.get_message(win.built_lines[0]) is buf.messages[0]
+    assert win.message_lines['0'] == [1, 1]
+    buf.add_message('short', nickname='n', identifier='3')
+    # the message is dropped with its last line
+    assert len(win.messages) == 3
+    assert win.get_message(win.built_lines[0]) is buf.messages[1]
+    assert '0' not in win.message_lines
+
+def test_receipt_is_redrawn(shim, monkeypatch):
+    buf = make_buffer(3)
+    win = make_win(buf, lines_nb_limit=100, height=4)
+    written = []
+    monkeypatch.setattr(win, 'write_line',
+                        lambda y, line, msg, *args: written.append((y, msg)))
+    win.refresh()
+    assert len(written) == 4
+    del written[:]
+    msg = buf.ack_message('old2')
+    win.modify_message('old2', msg)
+    win.refresh()
+    # same lines (the receipt does not change the layout), but the message
+    # changed
+    assert written == [(2, msg), (3, msg)]
+    del written[:]
+    win.refresh()
+    assert written == []
+
+def test_separator_and_highlights(shim):
+    buf = make_buffer(3)
+    win = make_win(buf, lines_nb_limit=100, height=2)
+    win.add_line_separator(buf)
+    buf.add_message('hl', nickname='n', highlight=True)
+    assert list(win.built_lines).count(text_win.SEPARATOR) == 1
+    assert win.highlights == [buf.messages[-1]]
+    win.scroll_to_message(buf.messages[0])
+    assert win.pos == len(win.built_lines) - win.height
+    win.scroll_to_separator()
+    win.next_highlight()
+    assert win.pos == 0
+    win.remove_line_separator()
+    assert text_win.SEPARATOR not in win.built_lines
+
+def test_lines_cache(shim, monkeypatch):
+    buf = make_buffer(5)
+    win = make_win(buf, lines_nb_limit=100, height=10)
+    lines = list(win.built_lines)
+    win.resize(10, 60, 0, 0, buf)
+    assert len(win.built_lines) == 5
+    built = []
+    build_message = win.build_message
+    monkeypatch.setattr(win, 'build_message',
+                        lambda *args, **kwargs: built.append(1) or
+                                                build_message(*args, **kwargs))
+    # back to the previous width: the lines are taken from the cache
+    win.resize(10, 30, 0, 0, buf)
+    assert built == []
+    assert [line[1:] for line in win.built_lines] == \
+            [line[1:] for line in lines]
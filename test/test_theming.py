@@ -23,4 +23,26 @@ def test_dump_tuple():
     assert dump_tuple((1, )) == '1'
     assert dump_tuple((1, 2, 'u')) == '1,2,u'
 
-
+class FakeCurses(object):
+    "Only the color pairs of curses"
+    COLOR_PAIRS = 4
+
+    def __init__(self):
+        self.pairs = {}
+
+    def init_pair(self, pair, fg, bg):
+        self.pairs[pair] = (fg, bg)
+
+def test_color_pairs_full(monkeypatch):
+    import theming
+    fake = FakeCurses()
+    monkeypatch.setattr(theming, 'curses', fake)
+    monkeypatch.setattr(theming, 'curses_colors_dict', {})
+    monkeypatch.setattr(theming, 'color_pairs_full', False)
+    assert [theming.find_color_pair((fg, -1)) for fg in (1, 2, 3)] == [1, 2, 3]
+    # no pair is reassigned once they are all used
+    assert theming.find_color_pair((2, 4)) == 2
+    assert theming.find_color_pair((5, 4)) == 0
+    assert fake.pairs == {1: (1, -1), 2: (2, -1), 3: (3, -1)}
+    assert theming.color_pairs_full
+    assert theming.find_color_pair((3, -1)) == 3